@@ -0,0 +1,98 @@
+"""Benchmark response serialization: stdlib JSON paths vs core.serialize.dumps."""
+
+import json
+import math
+
+import numpy as np
+import pytest
+from fastapi.encoders import jsonable_encoder
+
+from rezoning_api.core.serialize import dumps
+
+
+def _minmax():
+    """country minmax table: ~100 layers, some without data"""
+    rng = np.random.default_rng(0)
+    return {
+        f"layer-{i}": {
+            "min": float("nan") if i % 7 == 0 else float(rng.uniform(0, 10)),
+            "max": float("nan") if i % 7 == 0 else float(rng.uniform(10, 1e5)),
+        }
+        for i in range(100)
+    }
+
+
+def _zone():
+    """zone statistics as computed: numpy scalars in nested dicts"""
+    rng = np.random.default_rng(0)
+    layers = [f"layer-{i}" for i in range(20)]
+    return {
+        "lcoe": np.float64(187.5),
+        "zone_score": np.float32(0.29),
+        "generation_potential": np.float64(2902.6),
+        "icp": np.float64(1875.0),
+        "cf": np.float32(0.18),
+        "zone_output_density": np.float64(4.6),
+        "suitable_area": np.int64(625000000),
+        "criterion_average": {k: np.float64(v) for k, v in zip(layers, rng.random(20))},
+        "criterion_contribution": {
+            k: np.float32(v) for k, v in zip(layers, rng.random(20))
+        },
+    }
+
+
+def _nan_to_none(obj):
+    if isinstance(obj, dict):
+        return {k: _nan_to_none(v) for k, v in obj.items()}
+    elif isinstance(obj, list):
+        return [_nan_to_none(v) for v in obj]
+    elif isinstance(obj, float) and math.isnan(obj):
+        return None
+    return obj
+
+
+def _stdlib_minmax(content):
+    """the previous filter layers path (nan_to_none pre-pass + json.dumps)"""
+    return json.dumps(
+        _nan_to_none(content),
+        ensure_ascii=False,
+        allow_nan=True,
+        separators=(",", ":"),
+    ).encode("utf-8")
+
+
+def _stdlib_zone(content):
+    """the previous zone path (response_model validation aside)"""
+    return json.dumps(
+        jsonable_encoder(
+            {
+                k: {kk: float(vv) for kk, vv in v.items()}
+                if isinstance(v, dict)
+                else float(v)
+                for k, v in content.items()
+            }
+        ),
+        ensure_ascii=False,
+        allow_nan=False,
+        separators=(",", ":"),
+    ).encode("utf-8")
+
+
+@pytest.mark.benchmark(group="minmax")
+@pytest.mark.parametrize("serializer", [_stdlib_minmax, dumps])
+def test_json_minmax(benchmark, serializer):
+    """Serialize a country minmax table."""
+    content = _minmax()
+    benchmark.name = serializer.__name__
+    body = benchmark(serializer, content)
+    assert json.loads(body)["layer-0"]["min"] is None
+
+
+@pytest.mark.benchmark(group="zone")
+@pytest.mark.parametrize("serializer", [_stdlib_zone, dumps])
+def test_json_zone(benchmark, serializer):
+    """Serialize zone statistics."""
+    content = _zone()
+    benchmark.name = serializer.__name__
+    body = benchmark(serializer, content)
+    benchmark.extra_info["bytes"] = len(body)
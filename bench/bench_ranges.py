@@ -0,0 +1,256 @@
+"""
+Benchmark concurrent remote raster reads: GDAL's native reads vs RangeFile.
+
+RangeFile (block cache or RANGE_READS) reads through rasterio's Python file
+plugin, which holds the GIL, but coalesces and hedges its GETs. The "http"
+group serves a local COG over HTTP with a fixed latency and a slow tail (a few
+requests much slower), read by 8 threads at once either natively (/vsicurl/)
+or through a RangeFile with no disk cache. Compare the mean round time (GIL
+cost) and the p99_read_ms extra info (tail latency, what hedging is for) of
+both. The "s3" group compares /vsis3/ with RangeFile on a real dataset: set
+BENCH_S3_DATASET to an s3:// COG.
+"""
+import http.client
+import itertools
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+import pytest
+import rasterio
+from rasterio.windows import Window
+
+from rezoning_api.core import blockcache
+from rezoning_api.core.ranges import RangeReader
+
+THREADS = 8
+_opens = itertools.count()
+READS = 32
+ROUNDS = 5
+WINDOW = 256
+SIZE = 2048
+# every request waits LATENCY seconds, one in TAIL_EVERY TAIL seconds
+LATENCY = 0.02
+TAIL = 0.5
+TAIL_EVERY = 50
+
+
+@pytest.fixture(scope="module")
+def cog(tmp_path_factory):
+    """a tiled, compressed float32 raster, compressing like the datasets"""
+    path = str(tmp_path_factory.mktemp("ranges") / "cog.tif")
+    rng = np.random.default_rng(0)
+    with rasterio.open(
+        path,
+        "w",
+        driver="GTiff",
+        width=SIZE,
+        height=SIZE,
+        count=1,
+        dtype="float32",
+        crs="EPSG:4326",
+        transform=rasterio.transform.from_origin(0, SIZE, 1, 1),
+        tiled=True,
+        blockxsize=256,
+        blockysize=256,
+        compress="deflate",
+    ) as dst:
+        dst.write(rng.integers(0, 100, (1, SIZE, SIZE)).astype("float32"))
+    return path
+
+
+class _Handler(BaseHTTPRequestHandler):
+    """HEAD and ranged GET of the served file, with injected latency"""
+
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def _delay(self):
+        server = self.server
+        with server.lock:
+            server.requests += 1
+            slow = server.tail and server.requests % TAIL_EVERY == 0
+        time.sleep(TAIL if slow else server.latency)
+
+    def do_HEAD(self):
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(self.server.data)))
+        self.send_header("Accept-Ranges", "bytes")
+        self.send_header("ETag", '"bench"')
+        self.end_headers()
+
+    def do_GET(self):
+        self._delay()
+        data = self.server.data
+        start, end = 0, len(data) - 1
+        value = self.headers.get("Range")
+        if value:
+            first, last = value[len("bytes=") :].split("-")
+            start, end = int(first), min(int(last or end), end)
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {start}-{end}/{len(data)}")
+        else:
+            self.send_response(200)
+        body = data[start : end + 1]
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("Accept-Ranges", "bytes")
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    # every reader thread, hedge and keep-alive connection at once
+    request_queue_size = 128
+
+
+@pytest.fixture(scope="module", params=[False, True], ids=["no-tail", "tail"])
+def server(request, cog):
+    """HTTP server of the raster"""
+    with open(cog, "rb") as f:
+        data = f.read()
+    server = _Server(("127.0.0.1", 0), _Handler)
+    server.data = data
+    server.latency = LATENCY
+    server.tail = request.param
+    server.requests = 0
+    server.lock = threading.Lock()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+
+
+class _HTTPClient:
+    """the part of the S3 client used by blockcache, over plain HTTP"""
+
+    def __init__(self, port: int):
+        """Init client."""
+        self.port = port
+        self._local = threading.local()
+
+    def _connection(self) -> http.client.HTTPConnection:
+        # one keep-alive connection per thread, as boto3's pool and curl do
+        if not hasattr(self._local, "connection"):
+            self._local.connection = http.client.HTTPConnection(
+                "127.0.0.1", self.port
+            )
+        return self._local.connection
+
+    def head_object(self, Bucket, Key):
+        connection = self._connection()
+        connection.request("HEAD", f"/{Key}")
+        response = connection.getresponse()
+        response.read()
+        return {
+            "ETag": response.getheader("ETag"),
+            "ContentLength": int(response.getheader("Content-Length")),
+        }
+
+    def get_object(self, Bucket, Key, Range):
+        # a fresh connection: the body may be abandoned by a hedge
+        connection = http.client.HTTPConnection("127.0.0.1", self.port)
+        connection.request("GET", f"/{Key}", headers={"Range": Range})
+        return {"Body": connection.getresponse()}
+
+
+def _windows(size: int):
+    rng = random.Random(0)
+    offsets = [
+        (rng.randrange(size - WINDOW), rng.randrange(size - WINDOW))
+        for _ in range(READS)
+    ]
+    return [Window(col, row, WINDOW, WINDOW) for col, row in offsets]
+
+
+def _read_all(open_raster, path: str, size: int, unique: bool, latencies: list):
+    """
+    READS windows, each from its own open, on THREADS threads, adding the
+    latency of every read to latencies; unique opens use a new URL each, so no
+    read is served from GDAL's /vsicurl/ cache
+    """
+
+    def read(window):
+        name = f"{path}?read={next(_opens)}" if unique else path
+        t1 = time.monotonic()
+        with open_raster(name) as src:
+            src.read(1, window=window)
+        latencies.append(time.monotonic() - t1)
+
+    with ThreadPoolExecutor(THREADS) as pool:
+        list(pool.map(read, _windows(size)))
+
+
+def _run(benchmark, open_raster, path: str, size: int = SIZE, unique: bool = False):
+    """benchmark rounds of _read_all, with the read latency percentiles"""
+    latencies: list = []
+    benchmark.pedantic(
+        _read_all,
+        args=(open_raster, path, size, unique, latencies),
+        rounds=ROUNDS,
+        iterations=1,
+    )
+    assert len(latencies) == ROUNDS * READS
+    for q in (50, 99):
+        latency = np.percentile(latencies, q) * 1000
+        benchmark.extra_info[f"p{q}_read_ms"] = round(float(latency), 1)
+
+
+def _native(path):
+    return rasterio.open(path)
+
+
+@pytest.fixture
+def range_reads(monkeypatch):
+    """route s3:// opens through a RangeFile without disk cache"""
+
+    def setup(client):
+        monkeypatch.setattr(blockcache, "RANGE_READS", True)
+        monkeypatch.setattr(blockcache, "_block_cache", None)
+        monkeypatch.setattr(blockcache, "BLOCK_CACHE_SIZE", 0)
+        monkeypatch.setattr(blockcache, "_heads", {})
+        if client is not None:
+            monkeypatch.setattr(blockcache, "_s3_client", client)
+            monkeypatch.setattr(blockcache, "_range_reader", RangeReader(client))
+
+    return setup
+
+
+@pytest.mark.benchmark(group="http")
+@pytest.mark.parametrize("path", ["native", "range"])
+def test_http_reads(benchmark, server, range_reads, path):
+    """Concurrent window reads over HTTP, natively or through a RangeFile."""
+    port = server.server_address[1]
+    benchmark.name = f"{path}-{'tail' if server.tail else 'no-tail'}"
+    if path == "native":
+        url = f"/vsicurl/http://127.0.0.1:{port}/cog.tif"
+        env = rasterio.Env(
+            GDAL_DISABLE_READDIR_ON_OPEN="EMPTY_DIR",
+            GDAL_HTTP_MERGE_CONSECUTIVE_RANGES="YES",
+        )
+        with env:
+            _run(benchmark, _native, url, unique=True)
+    else:
+        range_reads(_HTTPClient(port))
+        _run(benchmark, blockcache.open_raster, "s3://bench/cog.tif", unique=True)
+
+
+@pytest.mark.benchmark(group="s3")
+@pytest.mark.parametrize("path", ["native", "range"])
+def test_s3_reads(benchmark, range_reads, path):
+    """Concurrent window reads of BENCH_S3_DATASET, /vsis3/ or RangeFile."""
+    dataset = os.getenv("BENCH_S3_DATASET")
+    if not dataset:
+        pytest.skip("BENCH_S3_DATASET is not set")
+    with rasterio.open(dataset) as src:
+        size = min(src.width, src.height)
+    benchmark.name = path
+    if path == "range":
+        range_reads(None)
+    _run(benchmark, blockcache.open_raster, dataset, size)
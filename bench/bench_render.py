@@ -0,0 +1,71 @@
+"""Benchmark tile encoding: rio-tiler `render` vs LUT/paletted renderer."""
+
+import numpy as np
+import pytest
+from rio_tiler.colormap import cmap
+from rio_tiler.utils import render
+
+from rezoning_api.core.render import colormap_lut, render_binary, render_lut
+
+SIZE = 256
+COLOR = [45, 39, 88, 178]
+
+
+def _continuous():
+    """smooth uint8 field with noise, roughly what a quantized LCOE tile looks like"""
+    rng = np.random.default_rng(0)
+    yy, xx = np.mgrid[0:SIZE, 0:SIZE]
+    field = 127 + 60 * np.sin(xx / 23) * np.cos(yy / 31) + rng.normal(0, 8, (SIZE, SIZE))
+    return np.clip(field, 0, 255).astype(np.uint8)
+
+
+def _mask():
+    """country-like mask covering part of the tile"""
+    yy, xx = np.mgrid[0:SIZE, 0:SIZE]
+    return (xx - 100) ** 2 + (yy - 140) ** 2 < 120 ** 2
+
+
+def _rio_continuous(data, mask):
+    return render(data, mask=mask * 255, colormap=cmap.get("viridis"))
+
+
+def _lut_continuous(data, mask):
+    return render_lut(data, mask, colormap_lut("viridis"))
+
+
+def _rio_binary(data, mask):
+    tile = (data > 127).astype(np.uint8)
+    return render(
+        np.stack(
+            [
+                tile * COLOR[0],
+                tile * COLOR[1],
+                tile * COLOR[2],
+                (mask * tile * COLOR[3]).astype(np.uint8),
+            ]
+        )
+    )
+
+
+def _lut_binary(data, mask):
+    return render_binary(np.logical_and(data > 127, mask), COLOR)
+
+
+@pytest.mark.benchmark(group="continuous")
+@pytest.mark.parametrize("renderer", [_rio_continuous, _lut_continuous])
+def test_render_continuous(benchmark, renderer):
+    """Encode a colormapped continuous tile."""
+    data, mask = _continuous(), _mask()
+    benchmark.name = renderer.__name__
+    content = benchmark(renderer, data, mask)
+    benchmark.extra_info["bytes"] = len(content)
+
+
+@pytest.mark.benchmark(group="binary")
+@pytest.mark.parametrize("renderer", [_rio_binary, _lut_binary])
+def test_render_binary(benchmark, renderer):
+    """Encode a filter (binary) tile."""
+    data, mask = _continuous(), _mask()
+    benchmark.name = renderer.__name__
+    content = benchmark(renderer, data, mask)
+    benchmark.extra_info["bytes"] = len(content)
@@ -0,0 +1,89 @@
+"""
+Benchmark zone statistics: scaling with ZONE_WORKERS, and batched zones.
+
+Needs the datasets locally: run with REZONING_IS_LOCAL_DEV=1 and
+REZONING_LOCAL_DATA_PATH pointing at a copy of the bucket. Compare the
+"workers" group to read the scaling curve (speedup vs 1 worker), and the
+"batch" group for 100 zones computed one by one or in one batch.
+"""
+from functools import partial
+
+import pytest
+
+from rezoning_api.core import aio
+from rezoning_api.db.zonal import accumulate, accumulate_labels
+from rezoning_api.models.zone import LCOE, Filters, Weights
+from rezoning_api.utils import REGISTRY, calc_score, get_aoi_grid, get_label_grid
+
+# a large area, in local data coordinates, and a small block size so it has
+# enough blocks to keep every worker busy
+AOI = {
+    "type": "Polygon",
+    "coordinates": [[[-2, 40], [10, 40], [10, 52], [-2, 52], [-2, 40]]],
+}
+BLOCK_SIZE = 128
+
+
+def _square(x, y):
+    return {
+        "type": "Polygon",
+        "coordinates": [[[x, y], [x + 1, y], [x + 1, y + 1], [x, y + 1], [x, y]]],
+    }
+
+
+# 10 x 10 candidate zones over the same area
+ZONES = [_square(-1.5 + 1.1 * i, 41 + 1.05 * j) for i in range(10) for j in range(10)]
+
+_score = partial(
+    calc_score,
+    "FRA",
+    "solar",
+    LCOE(capacity_factor="gsa-pvout"),
+    Weights(roads=0.5, grid=0.3, slope=0.2),
+    Filters(),
+    ret_extras=True,
+    window_scale=True,
+)
+
+
+def _skip_without_data():
+    if REGISTRY.location("multiband/distance").startswith("s3://"):
+        pytest.skip("datasets are not available locally")
+
+
+def _zone():
+    grid = get_aoi_grid(AOI)
+    return accumulate(_score, grid, block_size=BLOCK_SIZE).stats(30)
+
+
+def _zones_one_by_one():
+    return [accumulate(_score, get_aoi_grid(zone)).stats(30) for zone in ZONES]
+
+
+def _zones_batch():
+    zones = accumulate_labels(_score, get_label_grid(ZONES), len(ZONES))
+    return [zone.stats(30) for zone in zones]
+
+
+@pytest.mark.benchmark(group="workers", warmup_iterations=1)
+@pytest.mark.parametrize("workers", [1, 2, 4, 8])
+def test_zone_workers(benchmark, monkeypatch, workers):
+    """Zone statistics of a large area with 1 to 8 block workers."""
+    _skip_without_data()
+
+    monkeypatch.setitem(
+        aio._executors, "zone", aio.PriorityExecutor(workers, thread_name_prefix="zone")
+    )
+    benchmark.name = f"{workers} workers"
+    stats = benchmark.pedantic(_zone, rounds=3, iterations=1)
+    benchmark.extra_info["suitable_area"] = stats["suitable_area"]
+
+
+@pytest.mark.benchmark(group="batch", warmup_iterations=1)
+@pytest.mark.parametrize("zones", [_zones_one_by_one, _zones_batch])
+def test_zone_batch(benchmark, zones):
+    """Statistics of 100 zones, one request per zone or one batch."""
+    _skip_without_data()
+    benchmark.name = zones.__name__
+    stats = benchmark.pedantic(zones, rounds=3, iterations=1)
+    assert len(stats) == len(ZONES)
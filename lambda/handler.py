@@ -1,6 +1,13 @@
 """AWS Lambda handler."""
 
 from mangum import Mangum
+from rezoning_api.core.config import WARMUP_ON_STARTUP
 from rezoning_api.main import app
+from rezoning_api.warmup import warmup
+
+# the lifespan is off (it would run on every invocation), warm up during init,
+# before a provisioned concurrency instance takes traffic
+if WARMUP_ON_STARTUP:
+    warmup()
 
 handler = Mangum(app, lifespan="off")
@@ -1,5 +1,12 @@
 """ rezoning_api. """
 
-import pkg_resources
+try:
+    from importlib.metadata import version as _version
+except ImportError:  # python < 3.8
+    from pkg_resources import get_distribution
 
-version = pkg_resources.get_distribution(__package__).version
+    def _version(name):
+        return get_distribution(name).version
+
+
+version = _version(__package__)
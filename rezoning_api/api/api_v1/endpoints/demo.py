@@ -1,15 +1,23 @@
 """API demo"""
+from functools import lru_cache
+
 from fastapi import APIRouter, Request
-from fastapi.templating import Jinja2Templates
 
 router = APIRouter()
-templates = Jinja2Templates(directory="rezoning_api/templates")
+
+
+@lru_cache(maxsize=None)
+def get_templates():
+    """jinja templates, loaded on first use"""
+    from fastapi.templating import Jinja2Templates
+
+    return Jinja2Templates(directory="rezoning_api/templates")
 
 
 @router.get("/demo")
 def demo(request: Request):
     """demo"""
-    return templates.TemplateResponse(
+    return get_templates().TemplateResponse(
         "demo.html",
         {
             "request": request,
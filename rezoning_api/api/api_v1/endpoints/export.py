@@ -1,19 +1,21 @@
 """Filter endpoints."""
 from enum import Enum
 import json
-import boto3
-from botocore.client import Config
 
 from fastapi import APIRouter, status, HTTPException
 from fastapi.responses import Response
 
 from rezoning_api.utils import get_hash
 from rezoning_api.core.config import EXPORT_BUCKET, QUEUE_URL, IS_LOCAL_DEV, LOCALSTACK_ENDPOINT_URL
+from rezoning_api.core.lazy import LazyClient
 from rezoning_api.models.zone import ExportRequest
 
 router = APIRouter()
 
-s3 = boto3.client("s3", config=Config(signature_version="s3v4"))
+# created on first use, shared across requests
+endpoint_url = LOCALSTACK_ENDPOINT_URL if IS_LOCAL_DEV else None
+sqs = LazyClient("sqs", endpoint_url=endpoint_url)
+s3 = LazyClient("s3", endpoint_url=endpoint_url)
 
 
 class Operation(str, Enum):
@@ -60,14 +62,12 @@ def export(
     print( "Is local dev?", IS_LOCAL_DEV )
 
     # run export queue processing
-    client = boto3.client("sqs")
     queue_url = QUEUE_URL
     if IS_LOCAL_DEV:
-        client = boto3.client("sqs", endpoint_url=LOCALSTACK_ENDPOINT_URL)
-        queue_url = client.get_queue_url(QueueName="export-queue")
+        queue_url = sqs.get_queue_url(QueueName="export-queue")
         queue_url = queue_url["QueueUrl"]
     print( f"Pushing into bucket url {queue_url}" )
-    client.send_message(
+    sqs.send_message(
         QueueUrl=queue_url,
         MessageBody=json.dumps(
             dict(
@@ -89,7 +89,6 @@ def export(
 def get_export_status(id: str, response: Response):
     """Return export status"""
     ret = None
-    s3 = boto3.client("s3", endpoint_url=(LOCALSTACK_ENDPOINT_URL if IS_LOCAL_DEV else None) )
     try:
         key = f"export/WBG-REZoning-{id}"
         s3.head_object(Bucket=EXPORT_BUCKET, Key=key)
@@ -1,57 +1,24 @@
 """Filter endpoints."""
-import json
-import math
-from rezoning_api.utils import read_dataset
-from fastapi import APIRouter, Depends
-from fastapi.responses import JSONResponse
-from rio_tiler.io import COGReader
-from rio_tiler.utils import render
+from functools import lru_cache, partial
+from rezoning_api.utils import read_dataset, read_layer_tile
+from fastapi import APIRouter, Depends, Request
 import numpy as np
-import xarray as xr
-from typing import Optional, Any
-
-from rezoning_api.core.config import BUCKET
-from rezoning_api.models.tiles import TileResponse
+from typing import Optional, Tuple
+
+from rezoning_api.core.lazy import lazy_module
+from rezoning_api.core.cache import pack_result, unpack_result
+from rezoning_api.core.metadata import PrecomputedResponse
+from rezoning_api.core.render import render_binary, tile_media_type
+from rezoning_api.core.aio import gather, run_compute
+from rezoning_api.core.tiles import parse_tiles, tile_result_async, tile_results_async
+from rezoning_api.models.tiles import TileBatchResponse, TileResponse, TileSize
 from rezoning_api.models.zone import Filters, RangeFilter
-from rezoning_api.utils import _filter, LAYERS, filter_to_layer_name, get_layer_location, get_min_max
+from rezoning_api.utils import _filter, REGISTRY, filter_to_layer_name, get_min_max
 from rezoning_api.db.country import get_country_min_max, get_region_min_max, s3_get, get_country_geojson, get_region_geojson
 
 router = APIRouter()
 
-
-def nan_to_none(obj):
-    if isinstance(obj, dict):
-        return {k: nan_to_none(v) for k, v in obj.items()}
-    elif isinstance(obj, list):
-        return [nan_to_none(v) for v in obj]
-    elif isinstance(obj, float) and math.isnan(obj):
-        return None
-    return obj
-
-
-class CustomJSONEncoder(json.JSONEncoder):
-    def default(self, obj):
-        pass
-
-    def encode(self, obj):
-        obj = nan_to_none(obj)
-        return super().encode(obj)
-
-    def iterencode(self, obj, *args, **kwargs):
-        obj = nan_to_none(obj)
-        return super().iterencode(obj, *args, **kwargs)
-
-
-class CustomJSONResponse(JSONResponse):
-    def render(self, content: Any) -> bytes:
-        return json.dumps(
-            content,
-            ensure_ascii=False,
-            allow_nan=True,
-            indent=None,
-            separators=(",", ":"),
-            cls=CustomJSONEncoder,
-        ).encode("utf-8")
+xr = lazy_module("xarray")
 
 
 @router.get(
@@ -72,7 +39,7 @@ class CustomJSONResponse(JSONResponse):
     response_class=TileResponse,
     name="filter_country",
 )
-def filter(
+async def filter(
     z: int,
     x: int,
     y: int,
@@ -80,15 +47,102 @@ def filter(
     country_id: Optional[str] = None,
     filters: Filters = Depends(),
     offshore: bool = False,
+    tilesize: TileSize = TileSize.default,
 ):
     """Return filtered tile."""
+    result = await tile_result_async(
+        "filter",
+        _filter_compute(country_id, filters, offshore),
+        z,
+        x,
+        y,
+        tilesize,
+        country_id=country_id,
+        filters=filters.dict(),
+        offshore=offshore,
+    )
+    content = await run_compute(_render_filter, result, color)
+    return TileResponse(content=content, media_type=tile_media_type())
+
+
+@router.get(
+    "/filter/batch",
+    responses={
+        200: dict(
+            description="return many filtered tiles (tiles=z/x/y,z/x/y,...) in one response"
+        )
+    },
+    response_class=TileBatchResponse,
+    name="filter_batch",
+)
+@router.get(
+    "/filter/{country_id}/batch",
+    responses={
+        200: dict(
+            description="return many filtered tiles (tiles=z/x/y,z/x/y,...) in one response"
+        )
+    },
+    response_class=TileBatchResponse,
+    name="filter_country_batch",
+)
+async def filter_batch(
+    tiles: str,
+    color: str,
+    country_id: Optional[str] = None,
+    filters: Filters = Depends(),
+    offshore: bool = False,
+    tilesize: TileSize = TileSize.default,
+):
+    """Return many filtered tiles."""
+    indices = parse_tiles(tiles)
+    results = await tile_results_async(
+        "filter",
+        _filter_compute(country_id, filters, offshore),
+        indices,
+        tilesize,
+        country_id=country_id,
+        filters=filters.dict(),
+        offshore=offshore,
+    )
+    rendered = await run_compute(
+        lambda: [(tile, _render_filter(r, color)) for tile, r in zip(indices, results)]
+    )
+    return TileBatchResponse(rendered, tile_media_type=tile_media_type())
+
+
+def _filter_compute(country_id: Optional[str], filters: Filters, offshore: bool):
+    """tile compute function (see core.tiles) for a set of filter parameters"""
+    return lambda z, x, y, tilesize, block: filter_tile(
+        z, x, y, tilesize, country_id, filters.copy(), offshore, block=block
+    )
+
+
+def _render_filter(result, color: str) -> bytes:
+    """render a filter result in the requested color"""
+    _, visible = unpack_result(result)
+
+    # color like 45,39,88,178 (RGBA)
+    color_list = list(map(lambda x: int(x), color.split(",")))
+
+    return render_binary(visible, color_list)
+
+
+def filter_tile(
+    z: int,
+    x: int,
+    y: int,
+    tilesize: int,
+    country_id: Optional[str],
+    filters: Filters,
+    offshore: bool,
+    block: Tuple[int, int] = (1, 1),
+):
+    """compute the (style independent) filter mask for a tile (or block of tiles)"""
     # find the required datasets to open
     sent_filters = [
         filter_to_layer_name(k) for k, v in filters.dict().items() if v is not None
     ]
-    datasets = [
-        k for k, v in LAYERS.items() if any([layer in sent_filters for layer in v])
-    ]
+    datasets = REGISTRY.datasets_for(sent_filters)
 
     # potentially mask by country
     geometry = None
@@ -101,30 +155,40 @@ def filter(
             feat = get_region_geojson(country_id, offshore)
             geometry = feat.geometry.dict()
 
-    arrays = []
-    for dataset in datasets:
-        data, mask = read_dataset(
-            f"s3://{BUCKET}/{dataset}.tif",
-            LAYERS[dataset],
-            x=x,
-            y=y,
-            z=z,
-            geometry=geometry,
-        )
-        arrays.append(data)
+    # read all datasets concurrently
+    reads = gather(
+        [
+            partial(
+                read_dataset,
+                REGISTRY.url(dataset),
+                REGISTRY.bands(dataset),
+                x=x,
+                y=y,
+                z=z,
+                geometry=geometry,
+                tilesize=tilesize,
+                block=block,
+            )
+            for dataset in datasets
+        ]
+    )
+    arrays = [data for data, _ in reads]
     if arrays:
+        mask = reads[-1][1]
         arr = xr.concat(arrays, dim="layer")
         tile, new_mask = _filter(arr, filters)
     else:
         # if we didn't have anything to read, read gebco so we can mask
         # TODO: improve this
         data, mask = read_dataset(
-            f"s3://{BUCKET}/raster/gebco/gebco_combined.tif",
+            REGISTRY.url("raster/gebco/gebco_combined"),
             ["gebco"],
             x=x,
             y=y,
             z=z,
             geometry=geometry,
+            tilesize=tilesize,
+            block=block,
         )
         arrays.append(data)
         arr = xr.concat(arrays, dim="layer")
@@ -133,42 +197,43 @@ def filter(
 
     # mask everything offshore with gebco
     if offshore:
-        gloc, gidx = get_layer_location("gebco")
-        with COGReader(gloc) as cog:
-            gdata, _gmask = cog.tile(x, y, z, tilesize=256, indexes=[gidx + 1])
+        gdata, _gmask = read_layer_tile(
+            "gebco", x, y, z, tilesize=tilesize, block=block
+        )
         mask = mask * (gdata <= 0).squeeze()
 
-    # color like 45,39,88,178 (RGBA)
-    color_list = list(map(lambda x: int(x), color.split(",")))
-    color_tile = np.stack(
-        [
-            tile * color_list[0],
-            tile * color_list[1],
-            tile * color_list[2],
-            (mask.squeeze() * new_mask * color_list[3]).astype(np.uint8),  # type: ignore
-        ]
-    )
+    # filtered tiles are binary: a pixel is either shown in the requested color or not
+    return pack_result(None, np.logical_and(mask.squeeze() > 0, new_mask))
 
-    content = render(color_tile)
-    return TileResponse(content=content)
 
-
-@router.get("/filter/{country_id}/{resource}/layers")
-def get_country_layers(country_id: str, resource: str):
-    """Return min/max for country layers"""
+@lru_cache(maxsize=1024)
+def country_layers_response(country_id: str, resource: str) -> PrecomputedResponse:
+    """min/max of a country's (or region's) layers, built once"""
     if len(country_id) == 3:
         minmax = get_country_min_max(country_id, resource)
     else:
         minmax = get_region_min_max(country_id, resource)
     # keys = list(minmax.keys())
     # [minmax.pop(key) for key in keys if key.startswith(("gwa", "gsa"))]
-    return CustomJSONResponse(content=minmax)
+    return PrecomputedResponse(minmax)
 
 
-@router.get("/filter/schema", name="filter_schema")
-def get_filter_schema():
-    """Return filter schema"""
+@router.get("/filter/{country_id}/{resource}/layers")
+def get_country_layers(country_id: str, resource: str, request: Request):
+    """Return min/max for country layers"""
+    return country_layers_response(country_id, resource)(request)
+
+
+@lru_cache(maxsize=None)
+def filter_schema_response() -> PrecomputedResponse:
+    """the filter schema, built once"""
     schema = Filters.schema()["properties"]
     for key in schema.keys():
         schema[key]["layer"] = filter_to_layer_name(key)
-    return schema
+    return PrecomputedResponse(schema)
+
+
+@router.get("/filter/schema", name="filter_schema")
+def get_filter_schema(request: Request):
+    """Return filter schema"""
+    return filter_schema_response()(request)
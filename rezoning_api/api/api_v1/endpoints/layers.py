@@ -1,36 +1,70 @@
 """Filter endpoints."""
 from rezoning_api.db.country import get_country_geojson, get_country_min_max, get_region_geojson
-from fastapi import APIRouter, Depends, HTTPException
-from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException, Request
+from functools import lru_cache
+from typing import Optional, Tuple
 
-from rio_tiler.io import COGReader
-from rio_tiler.utils import render, linear_rescale, create_cutline
-from rio_tiler.colormap import cmap
+from rio_tiler.utils import linear_rescale
 import numpy as np
-import xarray as xr
 
 from rio_tiler.errors import TileOutsideBounds
 
-from os.path import exists
-
-from rezoning_api.models.tiles import TileResponse
+from rezoning_api.core.cache import pack_result, unpack_result
+from rezoning_api.core.metadata import PrecomputedResponse
+from rezoning_api.core.render import (
+    colormap_lut,
+    lut_from_colormap,
+    render_lut,
+    tile_media_type,
+)
+from rezoning_api.core.aio import run_compute
+from rezoning_api.core.tiles import parse_tiles, tile_result_async, tile_results_async
+from rezoning_api.models.tiles import TileBatchResponse, TileResponse, TileSize
 from rezoning_api.models.zone import Filters, RangeFilter
 from rezoning_api.utils import (
-    get_layer_location,
+    REGISTRY,
     flat_layers,
-    get_min_max,
-    s3_get,
+    get_layer_min_max,
     filter_to_layer_name,
     _filter,
-    LAYERS,
     read_dataset,
+    read_layer_tile,
 )
-from rezoning_api.core.config import BUCKET, IS_LOCAL_DEV, REZONING_LOCAL_DATA_PATH
+from rezoning_api.core.lazy import lazy_module
 from rezoning_api.db.cf import get_capacity_factor_options
-from rezoning_api.db.country import get_country_min_max, s3_get, get_country_geojson, get_region_geojson, match_gsa_dailies
+from rezoning_api.db.country import get_country_min_max, s3_get, get_country_geojson, get_region_geojson
 
 router = APIRouter()
 
+xr = lazy_module("xarray")
+
+LAND_COVER_COLORMAP = {
+    0: [0, 0, 0, 255],
+    10: [255, 255, 100, 255],
+    20: [170, 240, 240, 255],
+    30: [220, 240, 100, 255],
+    40: [200, 200, 100, 255],
+    50: [0, 100, 0, 255],
+    60: [0, 160, 0, 255],
+    70: [0, 60, 0, 255],
+    80: [40, 80, 0, 255],
+    90: [120, 130, 0, 255],
+    100: [140, 160, 0, 255],
+    110: [190, 150, 0, 255],
+    120: [150, 100, 0, 255],
+    130: [255, 180, 50, 255],
+    140: [255, 220, 210, 255],
+    150: [255, 235, 175, 255],
+    160: [0, 120, 90, 255],
+    170: [0, 150, 120, 255],
+    180: [0, 220, 130, 255],
+    190: [195, 20, 0, 255],
+    200: [255, 245, 215, 255],
+    210: [0, 70, 200, 255],
+    220: [255, 255, 255, 255],
+}
+LAND_COVER_LUT = lut_from_colormap(LAND_COVER_COLORMAP)
+
 TILE_URL = "https://d3hkm6tx5mgudr.cloudfront.net/services/{layer}/tiles/{{z}}/{{x}}/{{y}}.pbf"
 
 # TODO: refactor creating the filter mask (share same code between filter and layers endpoints)
@@ -42,6 +76,8 @@ def getFilterMask(
     country_id: Optional[str] = None,
     filters: Optional[Filters] = Depends(),
     offshore: bool = False,
+    tilesize: int = 256,
+    block: Tuple[int, int] = (1, 1),
  ):
     """Return filtered tile."""
     # find the required datasets to open
@@ -49,9 +85,7 @@ def getFilterMask(
     sent_filters = [
         filter_to_layer_name(k) for k, v in filters.dict().items() if v is not None and filter_to_layer_name(k) == layer_id
     ]
-    datasets = [
-        k for k, v in LAYERS.items() if any([layer in sent_filters for layer in v])
-    ]
+    datasets = REGISTRY.datasets_for(sent_filters)
 
     # potentially mask by country
     geometry = None
@@ -67,12 +101,14 @@ def getFilterMask(
     arrays = []
     for dataset in datasets:
         data, mask = read_dataset(
-            f"s3://{BUCKET}/{dataset}.tif",
-            LAYERS[dataset],
+            REGISTRY.url(dataset),
+            REGISTRY.bands(dataset),
             x=x,
             y=y,
             z=z,
             geometry=geometry,
+            tilesize=tilesize,
+            block=block,
         )
         arrays.append(data)
 
@@ -83,12 +119,14 @@ def getFilterMask(
         # if we didn't have anything to read, read gebco so we can mask
         # TODO: improve this
         data, mask = read_dataset(
-            f"s3://{BUCKET}/raster/gebco/gebco_combined.tif",
+            REGISTRY.url("raster/gebco/gebco_combined"),
             ["gebco"],
             x=x,
             y=y,
             z=z,
             geometry=geometry,
+            tilesize=tilesize,
+            block=block,
         )
         arrays.append(data)
         arr = xr.concat(arrays, dim="layer")
@@ -97,9 +135,9 @@ def getFilterMask(
 
     # mask everything offshore with gebco
     if offshore:
-        gloc, gidx = get_layer_location("gebco")
-        with COGReader(gloc) as cog:
-            gdata, _gmask = cog.tile(x, y, z, tilesize=256, indexes=[gidx + 1])
+        gdata, _gmask = read_layer_tile(
+            "gebco", x, y, z, tilesize=tilesize, block=block
+        )
         mask = mask * (gdata <= 0).squeeze()
     return mask.squeeze() * new_mask
 
@@ -117,7 +155,7 @@ def getFilterMask(
     response_class=TileResponse,
     name="layers",
 )
-def layers(
+async def layers(
     id: str,
     z: int,
     x: int,
@@ -127,41 +165,139 @@ def layers(
     filters: Filters = Depends(),
     resource: str = None,
     offshore: bool = False,
+    tilesize: TileSize = TileSize.default,
 ):
     """Return a tile from a layer."""
     print( "layers", id, z, x, y, colormap, country_id, resource, offshore, filters )
-    loc, idx = get_layer_location(id)
-    key = loc.replace(f"s3://{BUCKET}/", "").replace("tif", "vrt")
+    result = await tile_result_async(
+        "layers",
+        _layer_compute(id, country_id, filters, resource, offshore),
+        z,
+        x,
+        y,
+        tilesize,
+        id=id,
+        country_id=country_id,
+        resource=resource,
+        filters=filters.dict(),
+        offshore=offshore,
+    )
+    if result is None:
+        return TileResponse( content=bytes() )
+
+    content = await run_compute(_render_layer, id, result, colormap)
+    return TileResponse(content=content, media_type=tile_media_type())
+
+
+@router.get(
+    "/layers/{id}/batch",
+    responses={
+        200: dict(
+            description="return many tiles (tiles=z/x/y,z/x/y,...) for a given layer in one response"
+        )
+    },
+    response_class=TileBatchResponse,
+    name="layers_batch",
+)
+@router.get(
+    "/layers/{country_id}/{resource}/{id}/batch",
+    responses={
+        200: dict(
+            description="return many tiles (tiles=z/x/y,z/x/y,...) for a given layer, filtered by country"
+        )
+    },
+    response_class=TileBatchResponse,
+    name="layers_batch",
+)
+async def layers_batch(
+    id: str,
+    tiles: str,
+    country_id: str,
+    colormap: str,
+    filters: Filters = Depends(),
+    resource: str = None,
+    offshore: bool = False,
+    tilesize: TileSize = TileSize.default,
+):
+    """Return many tiles from a layer."""
+    indices = parse_tiles(tiles)
+    results = await tile_results_async(
+        "layers",
+        _layer_compute(id, country_id, filters, resource, offshore),
+        indices,
+        tilesize,
+        id=id,
+        country_id=country_id,
+        resource=resource,
+        filters=filters.dict(),
+        offshore=offshore,
+    )
+    rendered = await run_compute(
+        lambda: [
+            (tile, bytes() if result is None else _render_layer(id, result, colormap))
+            for tile, result in zip(indices, results)
+        ]
+    )
+    return TileBatchResponse(rendered, tile_media_type=tile_media_type())
+
+
+def _layer_compute(id, country_id, filters, resource, offshore):
+    """tile compute function (see core.tiles) for a layer and its parameters"""
+    return lambda z, x, y, tilesize, block: layer_tile(
+        id, z, x, y, tilesize, country_id, filters, resource, offshore, block=block
+    )
+
 
-    if IS_LOCAL_DEV:
-        local_loc = loc.replace(f"s3://{BUCKET}/", REZONING_LOCAL_DATA_PATH)
-        if exists(local_loc):
-            loc = local_loc
+def _render_layer(id: str, result, colormap: str) -> bytes:
+    """render a layer result with its colormap"""
+    data, mask = unpack_result(result)
+
+    if id != "land-cover":
+        lut = colormap_lut(colormap)
+    else:
+        lut = LAND_COVER_LUT
+
+    return render_lut(data, mask, lut)
+
+
+def layer_tile(
+    id: str,
+    z: int,
+    x: int,
+    y: int,
+    tilesize: int,
+    country_id: str,
+    filters: Filters,
+    resource: str = None,
+    offshore: bool = False,
+    block: Tuple[int, int] = (1, 1),
+):
+    """
+    compute a layer tile (or block of tiles) quantized to uint8 (land cover keeps
+    its class values)
+    """
+    layer = REGISTRY.layers[id]
+    key = REGISTRY.vrt_key(layer.dataset)
+
+    aoi = None
+    if country_id:
+        if len(country_id) == 3:
+            aoi = get_country_geojson(country_id, offshore).dict()
         else:
-            print( "File", local_loc, "doesn't exist" )
+            aoi = get_region_geojson(country_id, offshore).dict()
 
-    with COGReader(loc) as cog:
-        vrt_options = None
-        if country_id:
-            if len(country_id) == 3:
-                aoi = get_country_geojson(country_id, offshore)
-            else:
-                aoi = get_region_geojson(country_id, offshore)
-            cutline = create_cutline(cog.dataset, aoi.dict(), geometry_crs="epsg:4326")
-            vrt_options = {"cutline": cutline}
-
-        try:
-            data, mask = cog.tile(
-                x, y, z, tilesize=256, indexes=[idx + 1], vrt_options=vrt_options
-            )
-        except TileOutsideBounds as err:
-            return TileResponse( content=bytes() )
+    try:
+        data, mask = read_layer_tile(
+            id, x, y, z, tilesize=tilesize, block=block, geometry=aoi
+        )
+    except TileOutsideBounds as err:
+        return None
 
     # mask everything offshore with gebco
     if offshore:
-        gloc, gidx = get_layer_location("gebco")
-        with COGReader(gloc) as cog:
-            gdata, _gmask = cog.tile(x, y, z, tilesize=256, indexes=[gidx + 1])
+        gdata, _gmask = read_layer_tile(
+            "gebco", x, y, z, tilesize=tilesize, block=block
+        )
         mask = mask * (gdata <= 0).squeeze()
 
     is_country = country_id and len( country_id ) == 3
@@ -171,9 +307,9 @@ def layers(
             layer_min = minmax[id]["min"]
             layer_max = minmax[id]["max"]
         else:
-            layer_min_arr, layer_max_arr = get_min_max(s3_get(BUCKET, key))
-            layer_min = layer_min_arr[idx]
-            layer_max = layer_max_arr[idx]
+            layer_min_arr, layer_max_arr = get_layer_min_max(key)
+            layer_min = layer_min_arr[layer.index]
+            layer_max = layer_max_arr[layer.index]
     except Exception:
         layer_min = data.min()
         layer_max = data.max()
@@ -202,7 +338,7 @@ def layers(
         data = np.where(np.logical_and(data >= 4, data <= 10), 1, 0)
         layer_min, layer_max = (0, 1)
 
-    if match_gsa_dailies(id):
+    if layer.daily:
         # annualize gsa layers to match min/max
         if country_id:
             data *= 365
@@ -212,55 +348,31 @@ def layers(
     mask = mask * (data <= layer_max).squeeze()
 
     if len( [kv for kv in filters.dict().items() if kv[1]] ) > 0:
-        filter_mask = getFilterMask(z, x, y, id, country_id, filters, offshore)
+        filter_mask = getFilterMask(
+            z, x, y, id, country_id, filters, offshore, tilesize=tilesize, block=block
+        )
         mask = mask * filter_mask
 
     if id != "land-cover":
         data = linear_rescale(
             data, in_range=(layer_min, layer_max), out_range=(0, 255)
         ).astype(np.uint8)
-        colormap_dict = cmap.get(colormap)
     else:
         data = data.astype(np.uint8)
-        colormap_dict = {
-            0: [0, 0, 0, 255],
-            10: [255, 255, 100, 255],
-            20: [170, 240, 240, 255],
-            30: [220, 240, 100, 255],
-            40: [200, 200, 100, 255],
-            50: [0, 100, 0, 255],
-            60: [0, 160, 0, 255],
-            70: [0, 60, 0, 255],
-            80: [40, 80, 0, 255],
-            90: [120, 130, 0, 255],
-            100: [140, 160, 0, 255],
-            110: [190, 150, 0, 255],
-            120: [150, 100, 0, 255],
-            130: [255, 180, 50, 255],
-            140: [255, 220, 210, 255],
-            150: [255, 235, 175, 255],
-            160: [0, 120, 90, 255],
-            170: [0, 150, 120, 255],
-            180: [0, 220, 130, 255],
-            190: [195, 20, 0, 255],
-            200: [255, 245, 215, 255],
-            210: [0, 70, 200, 255],
-            220: [255, 255, 255, 255],
-        }
-
-    content = render(data, mask, colormap=colormap_dict)
-    return TileResponse(content=content)
 
+    return pack_result(data, mask)
 
-@router.get("/layers/", name="layer_list")
-def get_layers():
-    """Return layers list"""
+
+@lru_cache(maxsize=None)
+def layer_list_response() -> PrecomputedResponse:
+    """the layers list, built once"""
     layers = {layer: {} for layer in flat_layers()}
 
     # for later matching
     cfo = get_capacity_factor_options()
     cfo_flat = cfo["solar"] + cfo["wind"] + cfo["offshore"]
     cfo_ids = [cf["id"] for cf in cfo_flat]
+    filter_schema = Filters.schema()["properties"]
 
     for lkey, layer in layers.items():
         # everything starts as a raster
@@ -268,7 +380,7 @@ def get_layers():
         # add descriptions, categories, and titles from matching titles
         matching_filters = [
             filter
-            for key, filter in Filters.schema()["properties"].items()
+            for key, filter in filter_schema.items()
             if filter_to_layer_name(key) == lkey
         ]
         if matching_filters:
@@ -364,4 +476,10 @@ def get_layers():
         if not layers[key]:
             del layers[key]
 
-    return layers
+    return PrecomputedResponse(layers)
+
+
+@router.get("/layers/", name="layer_list")
+def get_layers(request: Request):
+    """Return layers list"""
+    return layer_list_response()(request)
@@ -1,25 +1,29 @@
 """LCOE endpoints."""
-from typing import Optional
+from functools import lru_cache
+from typing import Optional, Tuple
 import copy
 from rezoning_api.db.country import get_country_min_max
-from fastapi import APIRouter, Depends
-from rio_tiler.io import COGReader
-from rio_tiler.colormap import cmap
-from rio_tiler.utils import render, linear_rescale
+from fastapi import APIRouter, Depends, Request
+from rio_tiler.utils import linear_rescale
 import numpy as np
 
-from rezoning_api.models.tiles import TileResponse
+from rezoning_api.models.tiles import TileBatchResponse, TileResponse, TileSize
 from rezoning_api.models.zone import LCOE, Filters
 from rezoning_api.db.cf import get_capacity_factor_options
 from rezoning_api.db.irena import get_irena_defaults
 from rezoning_api.core.config import LCOE_MAX
+from rezoning_api.core.cache import pack_result, unpack_result
+from rezoning_api.core.metadata import PrecomputedResponse
+from rezoning_api.core.render import colormap_lut, render_lut, tile_media_type
+from rezoning_api.core.aio import run_compute
+from rezoning_api.core.tiles import parse_tiles, tile_result_async, tile_results_async
 from rezoning_api.utils import (
     lcoe_generation,
     lcoe_interconnection,
     lcoe_road,
     get_capacity_factor,
     get_distances,
-    get_layer_location,
+    read_layer_tile,
 )
 from rezoning_api.db.country import get_country_geojson, get_region_geojson
 
@@ -38,7 +42,7 @@ router = APIRouter()
     response_class=TileResponse,
     name="lcoe",
 )
-def lcoe(
+async def lcoe(
     z: int,
     x: int,
     y: int,
@@ -49,10 +53,120 @@ def lcoe(
     lcoe: LCOE = Depends(),
     offshore: bool = False,
     lcoe_min: Optional[float] = 80,
-    lcoe_max: Optional[float] = 300
+    lcoe_max: Optional[float] = 300,
+    tilesize: TileSize = TileSize.default,
 ):
     """Return LCOE tile."""
+    result = await tile_result_async(
+        "lcoe",
+        _lcoe_compute(country_id, filters, lcoe, offshore, lcoe_min, lcoe_max),
+        z,
+        x,
+        y,
+        tilesize,
+        country_id=country_id,
+        filters=filters.dict(),
+        lcoe=lcoe.dict(),
+        offshore=offshore,
+        lcoe_min=lcoe_min,
+        lcoe_max=lcoe_max,
+    )
+    tile, mask = unpack_result(result)
+
+    content = await run_compute(render_lut, tile, mask, colormap_lut(colormap))
+    return TileResponse(content=content, media_type=tile_media_type())
+
+
+@router.get(
+    "/lcoe/batch",
+    responses={
+        200: dict(
+            description="return many LCOE tiles (tiles=z/x/y,z/x/y,...) in one response"
+        )
+    },
+    response_class=TileBatchResponse,
+    name="lcoe_batch",
+)
+@router.get(
+    "/lcoe/{country_id}/{resource}/batch",
+    responses={
+        200: dict(
+            description="return many LCOE tiles (tiles=z/x/y,z/x/y,...) in one response"
+        )
+    },
+    response_class=TileBatchResponse,
+    name="lcoe_batch",
+)
+async def lcoe_batch(
+    tiles: str,
+    colormap: str,
+    country_id: Optional[str] = None,
+    resource: Optional[str] = None,
+    filters: Filters = Depends(),
+    lcoe: LCOE = Depends(),
+    offshore: bool = False,
+    lcoe_min: Optional[float] = 80,
+    lcoe_max: Optional[float] = 300,
+    tilesize: TileSize = TileSize.default,
+):
+    """Return many LCOE tiles."""
+    indices = parse_tiles(tiles)
+    results = await tile_results_async(
+        "lcoe",
+        _lcoe_compute(country_id, filters, lcoe, offshore, lcoe_min, lcoe_max),
+        indices,
+        tilesize,
+        country_id=country_id,
+        filters=filters.dict(),
+        lcoe=lcoe.dict(),
+        offshore=offshore,
+        lcoe_min=lcoe_min,
+        lcoe_max=lcoe_max,
+    )
+    lut = colormap_lut(colormap)
+    rendered = await run_compute(
+        lambda: [
+            (tile, render_lut(*unpack_result(result), lut))
+            for tile, result in zip(indices, results)
+        ]
+    )
+    return TileBatchResponse(rendered, tile_media_type=tile_media_type())
 
+
+def _lcoe_compute(country_id, filters, lcoe, offshore, lcoe_min, lcoe_max):
+    """tile compute function (see core.tiles) for a set of LCOE parameters"""
+    return lambda z, x, y, tilesize, block: lcoe_tile(
+        z,
+        x,
+        y,
+        tilesize,
+        country_id,
+        filters,
+        lcoe,
+        offshore,
+        lcoe_min,
+        lcoe_max,
+        block=block,
+    )
+
+
+def lcoe_tile(
+    z: int,
+    x: int,
+    y: int,
+    tilesize: int,
+    country_id: Optional[str],
+    filters: Filters,
+    lcoe: LCOE,
+    offshore: bool,
+    lcoe_min: float,
+    lcoe_max: float,
+    block: Tuple[int, int] = (1, 1),
+):
+    """
+    compute LCOE for a tile (or block of tiles), quantized to uint8 over
+    [lcoe_min, lcoe_max]
+    """
     # potentially mask by country
     geometry = None
     if country_id:
@@ -65,9 +179,19 @@ def lcoe(
 
     # calculate LCOE (from zone.py, TODO: DRY)
     # spatial temporal inputs
-    ds, dr, _calc, mask = get_distances(filters, x=x, y=y, z=z, geometry=geometry)
+    ds, dr, _calc, mask = get_distances(
+        filters, x=x, y=y, z=z, geometry=geometry, tilesize=tilesize, block=block
+    )
     cf = get_capacity_factor(
-        lcoe.capacity_factor, lcoe.tlf, lcoe.af, x=x, y=y, z=z, geometry=geometry
+        lcoe.capacity_factor,
+        lcoe.tlf,
+        lcoe.af,
+        x=x,
+        y=y,
+        z=z,
+        geometry=geometry,
+        tilesize=tilesize,
+        block=block,
     )
 
     # lcoe component calculation
@@ -82,9 +206,9 @@ def lcoe(
 
     # mask everything offshore with gebco
     if offshore:
-        gloc, gidx = get_layer_location("gebco")
-        with COGReader(gloc) as cog:
-            gdata, _gmask = cog.tile(x, y, z, tilesize=256, indexes=[gidx + 1])
+        gdata, _gmask = read_layer_tile(
+            "gebco", x, y, z, tilesize=tilesize, block=block
+        )
         mask = mask * (gdata <= 0).squeeze()
 
     tile = linear_rescale(
@@ -93,15 +217,14 @@ def lcoe(
         out_range=[0, 255],
     ).astype(np.uint8)
 
-    colormap = cmap.get(colormap)
-    content = render(tile, mask=mask.squeeze() * 255, colormap=colormap)
-    return TileResponse(content=content)
+    return pack_result(tile, np.asarray(mask))
 
 
-@router.get("/lcoe/schema", name="lcoe_schema")
-@router.get("/lcoe/{resource}/{country_id}/schema", name="lcoe_country_schema")
-def get_filter_schema(resource: Optional[str], country_id: Optional[str] = None):
-    """Return lcoe schema"""
+@lru_cache(maxsize=1024)
+def lcoe_schema_response(
+    resource: Optional[str], country_id: Optional[str]
+) -> PrecomputedResponse:
+    """the lcoe schema, with a country's IRENA defaults, built once"""
     schema = copy.deepcopy(LCOE.schema()["properties"])
     schema["capacity_factor"]["options"] = get_capacity_factor_options()
 
@@ -114,4 +237,13 @@ def get_filter_schema(resource: Optional[str], country_id: Optional[str] = None)
         except TypeError:
             pass
 
-    return schema
+    return PrecomputedResponse(schema)
+
+
+@router.get("/lcoe/schema", name="lcoe_schema")
+@router.get("/lcoe/{resource}/{country_id}/schema", name="lcoe_country_schema")
+def get_filter_schema(
+    request: Request, resource: Optional[str], country_id: Optional[str] = None
+):
+    """Return lcoe schema"""
+    return lcoe_schema_response(resource, country_id)(request)
@@ -1,11 +1,15 @@
 """score endpoints."""
+from typing import Tuple
 
 from fastapi import APIRouter, Depends
-from rio_tiler.colormap import cmap
-from rio_tiler.utils import render, linear_rescale
+from rio_tiler.utils import linear_rescale
 import numpy as np
 
-from rezoning_api.models.tiles import TileResponse
+from rezoning_api.core.cache import pack_result, unpack_result
+from rezoning_api.core.render import colormap_lut, render_lut, tile_media_type
+from rezoning_api.core.aio import run_compute
+from rezoning_api.core.tiles import parse_tiles, tile_result_async, tile_results_async
+from rezoning_api.models.tiles import TileBatchResponse, TileResponse, TileSize
 from rezoning_api.models.zone import LCOE, Weights, Filters
 from rezoning_api.utils import calc_score
 from rezoning_api.db.country import get_country_geojson, get_region_geojson
@@ -19,7 +23,7 @@ router = APIRouter()
     response_class=TileResponse,
     name="score",
 )
-def score(
+async def score(
     country_id: str,
     z: int,
     x: int,
@@ -30,8 +34,108 @@ def score(
     lcoe: LCOE = Depends(),
     weights: Weights = Depends(),
     offshore: bool = False,
+    tilesize: TileSize = TileSize.default,
 ):
     """Return score tile."""
+    result = await tile_result_async(
+        "score",
+        _score_compute(country_id, resource, filters, lcoe, weights, offshore),
+        z,
+        x,
+        y,
+        tilesize,
+        country_id=country_id,
+        resource=resource,
+        filters=filters.dict(),
+        lcoe=lcoe.dict(),
+        weights=weights.dict(),
+        offshore=offshore,
+    )
+    tile, mask = unpack_result(result)
+
+    content = await run_compute(render_lut, tile, mask, colormap_lut(colormap))
+    return TileResponse(content=content, media_type=tile_media_type())
+
+
+@router.get(
+    "/score/{country_id}/{resource}/batch",
+    responses={
+        200: dict(
+            description="return many score tiles (tiles=z/x/y,z/x/y,...) in one response"
+        )
+    },
+    response_class=TileBatchResponse,
+    name="score_batch",
+)
+async def score_batch(
+    country_id: str,
+    tiles: str,
+    colormap: str,
+    resource: str,
+    filters: Filters = Depends(),
+    lcoe: LCOE = Depends(),
+    weights: Weights = Depends(),
+    offshore: bool = False,
+    tilesize: TileSize = TileSize.default,
+):
+    """Return many score tiles."""
+    indices = parse_tiles(tiles)
+    results = await tile_results_async(
+        "score",
+        _score_compute(country_id, resource, filters, lcoe, weights, offshore),
+        indices,
+        tilesize,
+        country_id=country_id,
+        resource=resource,
+        filters=filters.dict(),
+        lcoe=lcoe.dict(),
+        weights=weights.dict(),
+        offshore=offshore,
+    )
+    lut = colormap_lut(colormap)
+    rendered = await run_compute(
+        lambda: [
+            (tile, render_lut(*unpack_result(result), lut))
+            for tile, result in zip(indices, results)
+        ]
+    )
+    return TileBatchResponse(rendered, tile_media_type=tile_media_type())
+
+
+def _score_compute(country_id, resource, filters, lcoe, weights, offshore):
+    """tile compute function (see core.tiles) for a set of score parameters"""
+    return lambda z, x, y, tilesize, block: score_tile(
+        z,
+        x,
+        y,
+        tilesize,
+        country_id,
+        resource,
+        filters,
+        lcoe,
+        weights,
+        offshore,
+        block=block,
+    )
+
+
+def score_tile(
+    z: int,
+    x: int,
+    y: int,
+    tilesize: int,
+    country_id: str,
+    resource: str,
+    filters: Filters,
+    lcoe: LCOE,
+    weights: Weights,
+    offshore: bool,
+    block: Tuple[int, int] = (1, 1),
+):
+    """
+    compute the zone score for a tile (or block of tiles), quantized to uint8
+    over [0, 1]
+    """
     # potentially mask by country
     geometry = None
     if country_id:
@@ -43,11 +147,18 @@ def score(
         geometry = feat.geometry.dict()
 
     data, mask = calc_score(
-        country_id, resource, lcoe, weights, filters, x=x, y=y, z=z, geometry=geometry
+        country_id,
+        resource,
+        lcoe,
+        weights,
+        filters,
+        x=x,
+        y=y,
+        z=z,
+        geometry=geometry,
+        tilesize=tilesize,
+        block=block,
     )
 
     tile = linear_rescale(data, in_range=[0, 1], out_range=[0, 255]).astype(np.uint8)
-
-    colormap = cmap.get(colormap)
-    content = render(tile, mask=mask.squeeze() * 255, colormap=colormap)
-    return TileResponse(content=content)
+    return pack_result(tile, mask)
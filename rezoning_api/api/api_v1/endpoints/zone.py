@@ -1,11 +1,21 @@
 """LCOE endpoints."""
-from typing import Optional
-from fastapi import APIRouter, Depends, HTTPException
-import numpy as np
-import numpy.ma as ma
+from functools import lru_cache, partial
+from typing import List, Optional
+from fastapi import APIRouter, Depends, HTTPException, Request
 
-from rezoning_api.models.zone import ZoneRequest, ZoneResponse, Filters, Weights
-from rezoning_api.utils import calc_score
+from rezoning_api.core.aio import run_compute
+from rezoning_api.core.config import ZONE_BATCH_MAX_AOIS
+from rezoning_api.core.metadata import PrecomputedResponse
+from rezoning_api.core.serialize import FastJSONResponse
+from rezoning_api.db.zonal import accumulate, accumulate_labels
+from rezoning_api.models.zone import (
+    ZoneBatchRequest,
+    ZoneRequest,
+    ZoneResponse,
+    Filters,
+    Weights,
+)
+from rezoning_api.utils import calc_score, get_aoi_grid, get_label_grid
 
 router = APIRouter()
 
@@ -20,66 +30,117 @@ router = APIRouter()
     responses={200: dict(description="return an LCOE calculation for a given area")},
     response_model=ZoneResponse,
 )
-def zone(
+async def zone(
     query: ZoneRequest,
     country_id: Optional[str] = None,
     resource: Optional[str] = None,
     filters: Filters = Depends(),
 ):
     """calculate LCOE and weight for zone score"""
-    data, mask, extras = calc_score(
-        country_id,
-        resource,
-        query.lcoe,
-        query.weights,
-        filters,
-        geometry=query.aoi.dict(),
-        ret_extras=True,
+    # serialized directly: the values are plain floats, response_model only
+    # documents them
+    return FastJSONResponse(
+        await run_compute(zone_stats, query, country_id, resource, filters)
     )
 
-    lcoe = extras["lcoe"]
-    cf = extras["cf"]
-    criterion_average = extras["criterion_average"]
-    criterion_contribution = extras["criterion_contribution"]
 
-    # mask everything with filters
-    lcoe_m = ma.masked_array(lcoe, ~mask)
-    cf_m = ma.masked_array(cf, ~mask)
-    data_m = ma.masked_array(data, ~mask)
+def zone_stats(
+    query: ZoneRequest,
+    country_id: Optional[str],
+    resource: Optional[str],
+    filters: Filters,
+):
+    """zone statistics for an area (blocking, run on the compute executor)"""
+    geometry = query.aoi.dict()
 
-    # zone score
-    zs = data_m.mean()
-    zs = 0.00001 if np.isnan(zs) else zs
+    # score the area block by block, keeping only running statistics
+    zone = accumulate(
+        partial(
+            calc_score,
+            country_id,
+            resource,
+            query.lcoe,
+            query.weights,
+            filters,
+            geometry=geometry,
+            ret_extras=True,
+            window_scale=True,
+        ),
+        get_aoi_grid(geometry),
+    )
 
-    # suitable area
-    suitable_area = mask.sum() * (500 ** 2)
+    stats = zone.stats(query.lcoe.landuse)
+    if stats is None:
+        raise HTTPException(status_code=404, detail="No suitable area after filtering")
+    return stats
 
-    # installed capacity potential
-    # filtered by suitable area, landuse is /km2
-    icp = query.lcoe.landuse * suitable_area / 1000000
 
-    # annual energy generation potential (divide by 1000 for GWh)
-    generation_potential = icp * cf_m.mean() * 8760 / 1000
+@router.post(
+    "/zone/batch",
+    responses={200: dict(description="return LCOE calculations for many areas")},
+    response_model=List[Optional[ZoneResponse]],
+)
+@router.post(
+    "/zone/{country_id}/{resource}/batch",
+    responses={200: dict(description="return LCOE calculations for many areas")},
+    response_model=List[Optional[ZoneResponse]],
+)
+async def zone_batch(
+    query: ZoneBatchRequest,
+    country_id: Optional[str] = None,
+    resource: Optional[str] = None,
+    filters: Filters = Depends(),
+):
+    """
+    calculate LCOE and weight for the zone score of many areas at once, in
+    order, null for areas without suitable area after filtering
+    """
+    if len(query.aois) > ZONE_BATCH_MAX_AOIS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"at most {ZONE_BATCH_MAX_AOIS} areas can be requested at once",
+        )
+    return FastJSONResponse(
+        await run_compute(zone_batch_stats, query, country_id, resource, filters)
+    )
 
-    if not lcoe_m.mean():
-        raise HTTPException(status_code=404, detail="No suitable area after filtering")
 
-    return dict(
-        lcoe=lcoe_m.mean(),
-        zone_score=zs,
-        generation_potential=generation_potential,
-        icp=icp,
-        cf=cf_m.mean(),
-        zone_output_density=generation_potential / suitable_area * 1000000,  # area is m2, ratio is /km2
-        suitable_area=suitable_area,
-        criterion_average=criterion_average,
-        criterion_contribution=criterion_contribution,
-        lcoe_min=lcoe_m.min(),
-        lcoe_max=lcoe_m.max(),
+def zone_batch_stats(
+    query: ZoneBatchRequest,
+    country_id: Optional[str],
+    resource: Optional[str],
+    filters: Filters,
+) -> List[Optional[dict]]:
+    """
+    zone statistics for many areas: the blocks of the window covering them are
+    read and scored once, pixels are labelled by area (blocking, run on the
+    compute executor)
+    """
+    geometries = [aoi.dict() for aoi in query.aois]
+    zones = accumulate_labels(
+        partial(
+            calc_score,
+            country_id,
+            resource,
+            query.lcoe,
+            query.weights,
+            filters,
+            ret_extras=True,
+            window_scale=True,
+        ),
+        get_label_grid(geometries),
+        len(geometries),
     )
+    return [zone.stats(query.lcoe.landuse) for zone in zones]
+
+
+@lru_cache(maxsize=None)
+def weights_schema_response() -> PrecomputedResponse:
+    """the weights schema, built once"""
+    return PrecomputedResponse(Weights.schema()["properties"])
 
 
 @router.get("/zone/schema", name="weights_schema")
-def get_filter_schema():
+def get_filter_schema(request: Request):
     """Return weights schema"""
-    return Weights.schema()["properties"]
+    return weights_schema_response()(request)
@@ -0,0 +1,177 @@
+"""
+admission control: per route concurrency classes with load shedding
+
+Every request belongs to a concurrency class chosen by its path: interactive
+tiles, analytical zone requests or metadata. A class admits at most `limit`
+requests at once, queues at most `queue` more for up to `timeout` seconds and
+rejects the rest with 503 and a Retry-After header, so a burst of expensive
+zone requests cannot starve the map. The class priority also orders queued
+work on the shared executors (see core.aio), tiles first.
+
+Classes are tuned (or added) with the ADMISSION_CLASSES setting, a JSON object
+merged into DEFAULT_CLASSES, e.g. '{"zone": {"limit": 4}}'.
+"""
+import asyncio
+import re
+from collections import deque
+from typing import Deque, Dict, List, Optional
+
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from rezoning_api.core.aio import request_priority
+from rezoning_api.core.config import ADMISSION_CLASSES, ENABLE_ADMISSION_CONTROL
+
+DEFAULT_CLASSES = {
+    "tiles": dict(
+        routes=[r"/(filter|lcoe|score|layers)/.*(\.png|/batch)$"],
+        limit=64,
+        queue=256,
+        timeout=10,
+        priority=0,
+        retry_after=1,
+    ),
+    "zone": dict(
+        routes=[r"/zone/(?!schema)", r"/export"],
+        limit=2,
+        queue=8,
+        timeout=20,
+        priority=2,
+        retry_after=5,
+    ),
+    # everything else
+    "metadata": dict(
+        routes=[r""],
+        limit=16,
+        queue=64,
+        timeout=5,
+        priority=1,
+        retry_after=1,
+    ),
+}
+
+# never queued nor rejected
+EXEMPT_PATHS = {"/ping"}
+
+
+class ConcurrencyClass:
+    """a concurrency limit with a bounded, timed wait queue"""
+
+    def __init__(
+        self,
+        name: str,
+        routes: List[str],
+        limit: int,
+        queue: int,
+        timeout: float,
+        priority: int,
+        retry_after: int,
+    ):
+        """Init class."""
+        self.name = name
+        self.routes = [re.compile(route) for route in routes]
+        self.limit = limit
+        self.queue = queue
+        self.timeout = timeout
+        self.priority = priority
+        self.retry_after = retry_after
+        self.active = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+
+    def matches(self, path: str) -> bool:
+        """whether a request path belongs to this class"""
+        return any(route.search(path) for route in self.routes)
+
+    async def acquire(self) -> bool:
+        """wait for a slot, False when the queue is full or the wait times out"""
+        if self.active < self.limit and not self._waiters:
+            self.active += 1
+            return True
+        if len(self._waiters) >= self.queue:
+            return False
+
+        waiter = asyncio.get_event_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            # the slot is handed over by release, active is unchanged
+            await asyncio.wait_for(waiter, self.timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                self.release()
+            raise
+        finally:
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
+
+    def release(self):
+        """free a slot, handing it to the oldest waiting request"""
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.active -= 1
+
+
+def load_classes(overrides: Optional[Dict] = None) -> List[ConcurrencyClass]:
+    """concurrency classes from DEFAULT_CLASSES and overrides, in matching order"""
+    settings = {name: dict(params) for name, params in DEFAULT_CLASSES.items()}
+    for name, params in (overrides or {}).items():
+        settings.setdefault(name, dict(DEFAULT_CLASSES["metadata"]))
+        settings[name].update(params)
+    # the catch-all class is matched last
+    order = [name for name in settings if name != "metadata"] + ["metadata"]
+    return [ConcurrencyClass(name, **settings[name]) for name in order]
+
+
+class AdmissionMiddleware:
+    """admit requests through their concurrency class, shed load with 503"""
+
+    def __init__(self, app: ASGIApp, classes: Optional[List[ConcurrencyClass]] = None):
+        """Init middleware."""
+        self.app = app
+        self.classes = classes if classes is not None else load_classes(
+            ADMISSION_CLASSES
+        )
+
+    def classify(self, path: str) -> Optional[ConcurrencyClass]:
+        """concurrency class of a request path"""
+        for cls in self.classes:
+            if cls.matches(path):
+                return cls
+        return None
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        """Handle ASGI call."""
+        if (
+            not ENABLE_ADMISSION_CONTROL
+            or scope["type"] != "http"
+            or scope["method"] == "OPTIONS"
+            or scope["path"] in EXEMPT_PATHS
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        cls = self.classify(scope["path"])
+        if cls is None:
+            await self.app(scope, receive, send)
+            return
+
+        if not await cls.acquire():
+            response = JSONResponse(
+                {"detail": f"server busy ({cls.name}), retry later"},
+                status_code=503,
+                headers={"Retry-After": str(cls.retry_after)},
+            )
+            await response(scope, receive, send)
+            return
+
+        token = request_priority.set(cls.priority)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            request_priority.reset(token)
+            cls.release()
@@ -0,0 +1,136 @@
+"""
+executors running the blocking data layer for async endpoints
+
+Tile and zone endpoints are coroutines: cache hits are answered on the event
+loop, everything else runs on the compute executor (COMPUTE_WORKERS threads)
+and the datasets a computation needs are read concurrently on the I/O executor
+(IO_WORKERS threads, see gather). Requests waiting for a thread are cheap
+coroutines, not blocked threads. The blocks of a zone are scored concurrently
+on the zone executor (ZONE_WORKERS threads), their reads on the I/O executor.
+
+Work runs in a copy of the caller's context, so the request deadline (see
+core.deadline) follows it, and is skipped when the request was abandoned
+while it waited for a thread. Queued work runs in order of the request
+priority (see core.admission): interactive tiles before zones and metadata.
+"""
+import asyncio
+import contextvars
+import itertools
+import queue
+import threading
+from concurrent.futures import Executor, Future
+from contextvars import ContextVar
+from functools import partial
+from typing import Any, Callable, List, Optional, Sequence, TypeVar
+
+from rezoning_api.core.config import COMPUTE_WORKERS, IO_WORKERS, ZONE_WORKERS
+from rezoning_api.core.deadline import check_deadline
+
+T = TypeVar("T")
+
+# priority of the request being served, lower runs first
+request_priority: ContextVar[int] = ContextVar("request_priority", default=0)
+
+
+class PriorityExecutor(Executor):
+    """thread pool running queued calls by priority, then in submission order"""
+
+    def __init__(self, max_workers: int, thread_name_prefix: str = ""):
+        """Init executor."""
+        self.max_workers = max_workers
+        self.thread_name_prefix = thread_name_prefix
+        self._queue: queue.PriorityQueue = queue.PriorityQueue()
+        self._counter = itertools.count()
+        self._threads: List[threading.Thread] = []
+        self._lock = threading.Lock()
+
+    def submit(self, fn: Callable[..., T], *args: Any, **kwargs: Any) -> Future:
+        """schedule fn(*args, **kwargs) at the current request priority"""
+        future: Future = Future()
+        item = (request_priority.get(), next(self._counter), future, fn, args, kwargs)
+        self._queue.put(item)
+        with self._lock:
+            if len(self._threads) < self.max_workers:
+                thread = threading.Thread(
+                    target=self._work,
+                    name=f"{self.thread_name_prefix}_{len(self._threads)}",
+                    daemon=True,
+                )
+                thread.start()
+                self._threads.append(thread)
+        return future
+
+    def _work(self):
+        """worker thread loop"""
+        while True:
+            _, _, future, fn, args, kwargs = self._queue.get()
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                result = fn(*args, **kwargs)
+            except BaseException as e:
+                future.set_exception(e)
+            else:
+                future.set_result(result)
+
+
+_executors = {}
+_lock = threading.Lock()
+_workers = {"compute": COMPUTE_WORKERS, "io": IO_WORKERS, "zone": ZONE_WORKERS}
+
+
+def get_executor(kind: str) -> PriorityExecutor:
+    """the process wide "compute", "io" or "zone" executor"""
+    with _lock:
+        executor: Optional[PriorityExecutor] = _executors.get(kind)
+        if executor is None:
+            executor = PriorityExecutor(_workers[kind], thread_name_prefix=kind)
+            _executors[kind] = executor
+    return executor
+
+
+def _checked(fn: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    """
+    run fn unless the request is abandoned; errors raised because the request
+    was abandoned meanwhile (e.g. an interrupted read) become RequestCancelled
+    """
+    check_deadline()
+    try:
+        return fn(*args, **kwargs)
+    except Exception:
+        check_deadline()
+        raise
+
+
+def _in_context(fn: Callable[..., T], *args: Any, **kwargs: Any) -> Callable[[], T]:
+    """fn(*args, **kwargs) bound to a copy of the current context"""
+    return partial(contextvars.copy_context().run, _checked, fn, *args, **kwargs)
+
+
+async def run_compute(fn: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    """await fn(*args, **kwargs) run on the compute executor"""
+    loop = asyncio.get_event_loop()
+    return await loop.run_in_executor(
+        get_executor("compute"), _in_context(fn, *args, **kwargs)
+    )
+
+
+async def run_io(fn: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    """await fn(*args, **kwargs) run on the I/O executor"""
+    loop = asyncio.get_event_loop()
+    return await loop.run_in_executor(
+        get_executor("io"), _in_context(fn, *args, **kwargs)
+    )
+
+
+def gather(calls: Sequence[Callable[[], T]], executor: str = "io") -> List[T]:
+    """
+    run blocking calls (e.g. dataset reads) concurrently on an executor (I/O by
+    default) and return their results in order; the calls must not gather on
+    the same executor
+    """
+    if len(calls) <= 1:
+        return [_checked(call) for call in calls]
+    pool = get_executor(executor)
+    futures = [pool.submit(_in_context(call)) for call in calls]
+    return [future.result() for future in futures]
@@ -0,0 +1,327 @@
+"""
+persistent on-disk cache of remote COG byte ranges
+
+Remote (s3://) rasters are opened through RangeFile, a read-only file-like
+object handed to GDAL (rasterio's Python VSI plugin). Reads are split into
+fixed size blocks; each block is looked up in a local directory keyed by
+(object ETag, byte range) and only fetched from S3 on a miss, contiguous
+missing blocks (and small gaps between them) with a single ranged GET, hedged
+when slow (see core.ranges). The directory persists across warm
+invocations and restarts, is bounded in size with LRU eviction (by file mtime)
+and is safe to share between processes: blocks are written atomically and
+eviction runs under a file lock. An open file keeps only its last
+MEMORY_BLOCKS blocks in memory.
+
+With RANGE_READS and no cache (BLOCK_CACHE_SIZE=0), RangeFile reads through
+the RangeReader only, keeping the coalescing and hedging of core.ranges.
+
+Both are off by default: reads through the Python VSI plugin hold the GIL
+while GDAL's native /vsis3/ reads run in parallel on the zone and I/O
+threads. bench/bench_ranges.py measures both paths under concurrency.
+"""
+import fcntl
+import hashlib
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple
+
+import rasterio
+from rasterio.io import FilePath
+from rio_tiler.io import COGReader
+
+from rezoning_api.core.config import (
+    BLOCK_CACHE_BLOCK_SIZE,
+    BLOCK_CACHE_DIR,
+    BLOCK_CACHE_HEAD_TTL,
+    BLOCK_CACHE_SIZE,
+    RANGE_MERGE_GAP,
+    RANGE_READS,
+    RANGE_WORKERS,
+)
+from rezoning_api.core.ranges import RangeReader, merge_ranges
+
+# evict once this fraction of the cache size has been written since the last scan
+EVICTION_INTERVAL = 0.1
+# and evict down to this fraction of the cache size
+EVICTION_TARGET = 0.9
+# blocks an open RangeFile keeps in memory (GDAL reads headers in small
+# pieces), least recently used first out
+MEMORY_BLOCKS = 64
+
+
+class BlockCache:
+    """size bounded, multi-process safe directory of cached byte blocks"""
+
+    def __init__(self, directory: str, max_bytes: int):
+        """Init cache."""
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._written: Optional[int] = None
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+        """file holding a block"""
+        digest = hashlib.sha1(key.encode()).hexdigest()
+        return os.path.join(self.directory, digest[:2], digest[2:])
+
+    def get(self, key: str) -> Optional[bytes]:
+        """return a cached block and mark it as recently used"""
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return data
+
+    def set(self, key: str, data: bytes):
+        """store a block atomically, evicting old blocks if needed"""
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp, path)
+        except OSError:
+            # e.g. a full disk: the block is simply not cached
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            return
+
+        with self._lock:
+            # the first write of a process always checks the (persisted) size
+            if self._written is not None:
+                self._written += len(data)
+                if self._written < self.max_bytes * EVICTION_INTERVAL:
+                    return
+            self._written = 0
+        self.evict()
+
+    def evict(self):
+        """delete least recently used blocks until the cache fits its size"""
+        with open(os.path.join(self.directory, ".lock"), "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                entries = []
+                total = 0
+                for shard in os.scandir(self.directory):
+                    if not shard.is_dir():
+                        continue
+                    for entry in os.scandir(shard.path):
+                        if entry.name.startswith(".tmp"):
+                            continue
+                        try:
+                            stat = entry.stat()
+                        except FileNotFoundError:
+                            continue
+                        entries.append((stat.st_mtime, stat.st_size, entry.path))
+                        total += stat.st_size
+
+                if total <= self.max_bytes:
+                    return
+                entries.sort()
+                target = self.max_bytes * EVICTION_TARGET
+                for _, size, path in entries:
+                    if total <= target:
+                        break
+                    try:
+                        os.remove(path)
+                    except FileNotFoundError:
+                        pass
+                    total -= size
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+_s3_client = None
+_range_reader: Optional[RangeReader] = None
+# (bucket, key) -> (etag, size, expiry), object versions checked at most every
+# BLOCK_CACHE_HEAD_TTL seconds
+_heads: Dict[Tuple[str, str], Tuple[str, int, float]] = {}
+
+
+def _s3():
+    """shared S3 client"""
+    global _s3_client
+    if _s3_client is None:
+        import boto3
+        from botocore.config import Config
+
+        # room for every range worker and hedge
+        _s3_client = boto3.client(
+            "s3", config=Config(max_pool_connections=RANGE_WORKERS + 10)
+        )
+    return _s3_client
+
+
+def get_range_reader() -> RangeReader:
+    """shared reader for ranged GETs"""
+    global _range_reader
+    if _range_reader is None:
+        _range_reader = RangeReader(_s3())
+    return _range_reader
+
+
+def _head(bucket: str, key: str) -> Tuple[str, int]:
+    """current (etag, size) of an S3 object"""
+    cached = _heads.get((bucket, key))
+    if cached and cached[2] > time.monotonic():
+        return cached[0], cached[1]
+    response = _s3().head_object(Bucket=bucket, Key=key)
+    etag, size = response["ETag"].strip('"'), response["ContentLength"]
+    _heads[(bucket, key)] = (etag, size, time.monotonic() + BLOCK_CACHE_HEAD_TTL)
+    return etag, size
+
+
+class RangeFile:
+    """
+    read-only, seekable file-like view of an S3 object read with a RangeReader,
+    backed by a BlockCache when given
+    """
+
+    def __init__(
+        self, bucket: str, key: str, cache: Optional[BlockCache], block_size: int
+    ):
+        """Init file."""
+        self.bucket = bucket
+        self.key = key
+        self.cache = cache
+        self.block_size = block_size
+        self.etag, self.size = _head(bucket, key)
+        self.name = f"s3://{bucket}/{key}"
+        self.closed = False
+        self._pos = 0
+        # the last MEMORY_BLOCKS blocks used through this file
+        self._blocks: OrderedDict = OrderedDict()
+
+    def _block_key(self, index: int) -> str:
+        """cache key of a block: object version and byte range"""
+        start = index * self.block_size
+        end = min(start + self.block_size, self.size) - 1
+        return f"{self.bucket}/{self.key}@{self.etag}:{start}-{end}"
+
+    def _fetch(self, first: int, last: int) -> Dict[int, bytes]:
+        """fetch blocks first..last (inclusive) from S3 with one ranged GET"""
+        start = first * self.block_size
+        end = min((last + 1) * self.block_size, self.size) - 1
+        body = get_range_reader().get(self.bucket, self.key, start, end)
+        blocks = {}
+        for index in range(first, last + 1):
+            offset = (index - first) * self.block_size
+            blocks[index] = body[offset : offset + self.block_size]
+        return blocks
+
+    def _load(self, first: int, last: int) -> List[bytes]:
+        """blocks first..last, from memory, disk or S3"""
+        blocks = {}
+        missing = []
+        for index in range(first, last + 1):
+            block = self._blocks.get(index)
+            if block is None and self.cache is not None:
+                block = self.cache.get(self._block_key(index))
+            if block is None:
+                missing.append(index)
+            else:
+                blocks[index] = block
+
+        # coalesce nearby missing blocks into single requests
+        for run_first, run_last in merge_ranges(
+            [(index, index) for index in missing], RANGE_MERGE_GAP
+        ):
+            for index, block in self._fetch(run_first, run_last).items():
+                if index not in blocks:
+                    # not a gap between missing blocks, already cached
+                    blocks[index] = block
+                    if self.cache is not None:
+                        self.cache.set(self._block_key(index), block)
+
+        for index in range(first, last + 1):
+            self._blocks[index] = blocks[index]
+            self._blocks.move_to_end(index)
+        while len(self._blocks) > MEMORY_BLOCKS:
+            self._blocks.popitem(last=False)
+        return [blocks[index] for index in range(first, last + 1)]
+
+    def read(self, size: int = -1) -> bytes:
+        """read up to size bytes from the current position"""
+        if size is None or size < 0:
+            size = self.size - self._pos
+        size = min(size, self.size - self._pos)
+        if size <= 0:
+            return b""
+
+        first = self._pos // self.block_size
+        last = (self._pos + size - 1) // self.block_size
+        data = b"".join(self._load(first, last))
+        offset = self._pos - first * self.block_size
+        self._pos += size
+        return data[offset : offset + size]
+
+    def seek(self, offset: int, whence: int = os.SEEK_SET) -> int:
+        """move the current position"""
+        if whence == os.SEEK_CUR:
+            offset += self._pos
+        elif whence == os.SEEK_END:
+            offset += self.size
+        self._pos = max(offset, 0)
+        return self._pos
+
+    def tell(self) -> int:
+        """current position"""
+        return self._pos
+
+    def readable(self) -> bool:
+        """file-like protocol"""
+        return True
+
+    def seekable(self) -> bool:
+        """file-like protocol"""
+        return True
+
+    def close(self):
+        """release the in-memory blocks"""
+        self._blocks.clear()
+        self.closed = True
+
+
+_block_cache: Optional[BlockCache] = None
+
+
+def get_block_cache() -> Optional[BlockCache]:
+    """the process wide block cache, None when disabled"""
+    global _block_cache
+    if _block_cache is None and BLOCK_CACHE_SIZE > 0:
+        _block_cache = BlockCache(BLOCK_CACHE_DIR, BLOCK_CACHE_SIZE * 1024 * 1024)
+    return _block_cache
+
+
+@contextmanager
+def open_raster(path: str):
+    """
+    open a raster with rasterio, remote (s3://) rasters through a RangeFile when
+    the block cache or RANGE_READS is on
+    """
+    cache = get_block_cache()
+    if not path.startswith("s3://") or (cache is None and not RANGE_READS):
+        with rasterio.open(path) as src:
+            yield src
+        return
+
+    bucket, key = path[len("s3://") :].split("/", 1)
+    fileobj = RangeFile(bucket, key, cache, BLOCK_CACHE_BLOCK_SIZE * 1024)
+    with FilePath(fileobj) as vsi_file, vsi_file.open() as src:
+        yield src
+
+
+@contextmanager
+def open_cog(path: str):
+    """COGReader for a raster, opened with open_raster"""
+    with open_raster(path) as src, COGReader(path, dataset=src) as cog:
+        yield cog
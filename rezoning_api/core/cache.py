@@ -0,0 +1,176 @@
+"""in-memory caches for computed (style independent) tile results"""
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, TimeoutError
+from typing import Any, Callable, Dict, Optional, Tuple
+
+import numpy as np
+
+from rezoning_api.core.config import ENABLE_CACHE, RESULT_CACHE_SIZE
+from rezoning_api.core.deadline import RequestCancelled, check_deadline
+
+# seconds between checks of the request deadline while waiting for a computation
+POLL_INTERVAL = 0.1
+
+
+def _nbytes(value: Any) -> int:
+    """approximate memory footprint of a cached value"""
+    if isinstance(value, (bytes, bytearray)):
+        return len(value)
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, (tuple, list)):
+        return sum(_nbytes(v) for v in value)
+    return 64
+
+
+class LRUCache:
+    """thread-safe least-recently-used cache bounded by total size in bytes"""
+
+    def __init__(self, max_bytes: int):
+        """Init cache."""
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self._data: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str, default: Any = None) -> Any:
+        """return a cached value and mark it as recently used"""
+        with self._lock:
+            try:
+                value, _ = self._data[key]
+            except KeyError:
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: Any):
+        """store a value, evicting the least recently used entries if needed"""
+        size = _nbytes(value)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._data:
+                self.current_bytes -= self._data.pop(key)[1]
+            self._data[key] = (value, size)
+            self.current_bytes += size
+            while self.current_bytes > self.max_bytes:
+                _, (_, evicted) = self._data.popitem(last=False)
+                self.current_bytes -= evicted
+
+    def clear(self):
+        """empty the cache"""
+        with self._lock:
+            self._data.clear()
+            self.current_bytes = 0
+
+    def __contains__(self, key: str) -> bool:
+        """membership test (does not affect recency)"""
+        return key in self._data
+
+    def __len__(self) -> int:
+        """number of cached entries"""
+        return len(self._data)
+
+
+class SingleFlight:
+    """
+    run concurrent computations of the same key once: later callers wait for the
+    computation in flight and share its result (e.g. the tiles of a map view
+    overzoomed from one parent, or the tiles of one metatile)
+    """
+
+    def __init__(self):
+        """Init with nothing in flight."""
+        self._inflight: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+
+    def run(self, key: str, compute: Callable[[], Any]) -> Any:
+        """compute() for key, or the result of the computation already in flight"""
+        while True:
+            with self._lock:
+                future = self._inflight.get(key)
+                owner = future is None
+                if owner:
+                    future = Future()
+                    self._inflight[key] = future
+            if owner:
+                break
+            while True:
+                try:
+                    return future.result(timeout=POLL_INTERVAL)
+                except TimeoutError:
+                    check_deadline()
+                except RequestCancelled:
+                    # the request computing it was abandoned, not this one
+                    break
+
+        try:
+            result = compute()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                del self._inflight[key]
+
+
+# analytical results keyed by every parameter except styling (color, colormap)
+result_cache = LRUCache(RESULT_CACHE_SIZE * 1024 * 1024)
+# computations of results missing from result_cache
+result_flights = SingleFlight()
+
+_MISSING = object()
+
+
+def pack_result(data: Optional[np.ndarray], mask: np.ndarray) -> Tuple:
+    """store a tile result compactly: uint8 data (optional) and a bit-packed mask"""
+    mask = np.asarray(mask).squeeze().astype(np.bool_)
+    if data is not None:
+        data = np.ascontiguousarray(np.asarray(data).squeeze(), dtype=np.uint8)
+    return (data, np.packbits(mask), mask.shape)
+
+
+def unpack_result(result: Tuple) -> Tuple[Optional[np.ndarray], np.ndarray]:
+    """inverse of pack_result, returns (data, boolean mask)"""
+    data, bits, shape = result
+    mask = np.unpackbits(bits, count=shape[0] * shape[1]).reshape(shape)
+    return data, mask.astype(np.bool_)
+
+
+def result_key(name: str, **params: Any) -> str:
+    """cache key for an analytical result"""
+    return hashlib.sha224(
+        json.dumps(dict(name=name, **params), sort_keys=True).encode()
+    ).hexdigest()
+
+
+def cached_result(name: str, compute: Callable[[], Any], **params: Any) -> Any:
+    """
+    return the analytical result for `name` and `params`, computing it on a miss
+    (once for concurrent callers)
+    params must be JSON serializable and must not include styling options so that
+    re-styling a tile reuses the computed result
+    """
+    key = result_key(name, **params)
+    if not ENABLE_CACHE:
+        return result_flights.run(key, compute)
+
+    result = result_cache.get(key, _MISSING)
+    if result is not _MISSING:
+        return result
+
+    def compute_and_cache():
+        # cached by a computation that completed since the lookup
+        result = result_cache.get(key, _MISSING)
+        if result is _MISSING:
+            result = compute()
+            result_cache.set(key, result)
+        return result
+
+    return result_flights.run(key, compute_and_cache)
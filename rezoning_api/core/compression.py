@@ -0,0 +1,167 @@
+"""content-type aware response compression (brotli / gzip)"""
+import gzip
+import hashlib
+from typing import List, Optional
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from rezoning_api.core.cache import LRUCache
+from rezoning_api.core.config import (
+    BROTLI_QUALITY,
+    COMPRESSED_CACHE_SIZE,
+    COMPRESSION_MINIMUM_SIZE,
+    GZIP_LEVEL,
+)
+
+try:
+    import brotli
+except ImportError:  # pragma: nocover
+    brotli = None  # type: ignore
+
+# media types worth compressing, everything else (PNG/WebP tiles, binary
+# containers) is already compressed and passed through untouched
+COMPRESSIBLE_TYPES = (
+    "application/json",
+    "application/javascript",
+    "application/geo+json",
+    "image/svg+xml",
+    "text/",
+)
+
+# compressed variants of recently sent bodies, keyed by (encoding, body digest)
+# so repeated metadata responses are only compressed once
+compressed_cache = LRUCache(COMPRESSED_CACHE_SIZE * 1024 * 1024)
+
+
+def select_encoding(accept_encoding: str) -> Optional[str]:
+    """pick the best supported content-encoding from an Accept-Encoding header"""
+    accepted = {}
+    for item in accept_encoding.lower().split(","):
+        name, _, params = item.strip().partition(";")
+        quality = 1.0
+        if params.strip().startswith("q="):
+            try:
+                quality = float(params.strip()[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[name.strip()] = quality
+
+    if brotli is not None and accepted.get("br", 0) > 0:
+        return "br"
+    if accepted.get("gzip", 0) > 0:
+        return "gzip"
+    return None
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    """compress a body with the given content-encoding"""
+    if encoding == "br":
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+
+
+def compress_cached(body: bytes, encoding: str) -> bytes:
+    """compress a body, reusing the result for identical bodies"""
+    key = f"{encoding}:{hashlib.sha1(body).hexdigest()}"
+    compressed = compressed_cache.get(key)
+    if compressed is None:
+        compressed = compress(body, encoding)
+        compressed_cache.set(key, compressed)
+    return compressed
+
+
+def is_compressible(content_type: str) -> bool:
+    """whether a media type benefits from compression"""
+    return content_type.lower().startswith(COMPRESSIBLE_TYPES)
+
+
+def add_vary(headers: MutableHeaders):
+    """add Accept-Encoding to the Vary header, once"""
+    if "accept-encoding" not in headers.get("vary", "").lower():
+        headers.add_vary_header("Accept-Encoding")
+
+
+class CompressionMiddleware:
+    """
+    compress textual responses with brotli or gzip
+    unlike starlette's GZipMiddleware, images and small bodies are never
+    compressed and responses that already carry a Content-Encoding (e.g.
+    pre-compressed metadata) are sent as they are. Every compressible response
+    varies on Accept-Encoding, compressed or not, so shared caches keep the
+    encodings apart
+    """
+
+    def __init__(self, app: ASGIApp, minimum_size: int = COMPRESSION_MINIMUM_SIZE):
+        """Init middleware."""
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        """Handle ASGI call."""
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        encoding = select_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        responder = _CompressionResponder(self.app, encoding, self.minimum_size)
+        await responder(scope, receive, send)
+
+
+class _CompressionResponder:
+    """buffers the response start to decide whether to compress the body"""
+
+    def __init__(self, app: ASGIApp, encoding: Optional[str], minimum_size: int):
+        """Init responder."""
+        self.app = app
+        self.encoding = encoding
+        self.minimum_size = minimum_size
+        self.send: Send = None
+        self.start_message: Message = None
+        self.passthrough = False
+        self.body: List[bytes] = []
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        """Handle ASGI call."""
+        self.send = send
+        await self.app(scope, receive, self.send_with_compression)
+
+    async def send_with_compression(self, message: Message):
+        """buffer and compress response bodies with a compressible media type"""
+        if message["type"] == "http.response.start":
+            self.start_message = message
+            headers = MutableHeaders(raw=message["headers"])
+            compressible = is_compressible(headers.get("content-type", ""))
+            if compressible:
+                add_vary(headers)
+            self.passthrough = (
+                self.encoding is None
+                or "content-encoding" in headers
+                or not compressible
+            )
+            if self.passthrough:
+                await self.send(message)
+            return
+
+        if self.passthrough or message["type"] != "http.response.body":
+            await self.send(message)
+            return
+
+        # textual bodies are small enough to buffer, they may arrive in several
+        # chunks when wrapped by other middleware
+        self.body.append(message.get("body", b""))
+        if message.get("more_body", False):
+            return
+
+        body = b"".join(self.body)
+        if len(body) < self.minimum_size:
+            await self.send(self.start_message)
+            await self.send({"type": "http.response.body", "body": body})
+            return
+
+        compressed = compress_cached(body, self.encoding)
+        headers = MutableHeaders(raw=self.start_message["headers"])
+        headers["Content-Encoding"] = self.encoding
+        headers["Content-Length"] = str(len(compressed))
+        await self.send(self.start_message)
+        await self.send({"type": "http.response.body", "body": compressed})
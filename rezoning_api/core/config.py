@@ -1,4 +1,5 @@
 """Config."""
+import json
 import os
 
 API_VERSION_STR = "/v1"
@@ -22,3 +23,114 @@ LOCALSTACK_ENDPOINT_URL = "http://localhost:4566/"
 
 FEEDBACK_URL = os.getenv('FEEDBACK_URL')
 GITHUB_TOKEN = os.getenv('GITHUB_TOKEN')
+
+# in-memory cache of computed, style independent tile results (filter masks,
+# quantized LCOE/score/layer values), size in megabytes
+ENABLE_CACHE = not os.getenv("DISABLE_CACHE")
+RESULT_CACHE_SIZE = int(os.getenv("RESULT_CACHE_SIZE", 128))
+
+# tile encoding: "png" (paletted where possible) or "webp", zlib level for PNG
+TILE_FORMAT = os.getenv("TILE_FORMAT", "png").lower()
+TILE_ZLEVEL = int(os.getenv("TILE_ZLEVEL", 6))
+TILE_WEBP_LOSSLESS = os.getenv("TILE_WEBP_LOSSLESS", "true").lower() == "true"
+
+# response compression: bodies smaller than the minimum size (bytes) and image
+# tiles are never compressed, brotli is used when installed and accepted
+COMPRESSION_MINIMUM_SIZE = int(os.getenv("COMPRESSION_MINIMUM_SIZE", 1024))
+BROTLI_QUALITY = int(os.getenv("BROTLI_QUALITY", 6))
+GZIP_LEVEL = int(os.getenv("GZIP_LEVEL", 6))
+COMPRESSED_CACHE_SIZE = int(os.getenv("COMPRESSED_CACHE_SIZE", 16))
+
+# compute tiles in blocks of METATILE_SIZE x METATILE_SIZE (a power of two) from
+# one larger read, caching every child tile. 1 disables metatiling
+METATILE_SIZE = int(os.getenv("METATILE_SIZE", 1))
+
+# multi-tile batch requests: maximum number of tiles per request, and the size
+# (in tiles per side) of the aligned groups computed from a single window
+BATCH_MAX_TILES = int(os.getenv("BATCH_MAX_TILES", 64))
+BATCH_MAX_BLOCK = int(os.getenv("BATCH_MAX_BLOCK", 8))
+
+# the source data is ~500m, tiles above MAX_NATIVE_ZOOM are upsampled in memory
+# from their (cached) ancestor tile at MAX_NATIVE_ZOOM instead of being read
+MAX_NATIVE_ZOOM = int(os.getenv("MAX_NATIVE_ZOOM", 10))
+
+# tile reads use Web Mercator, tile aligned COG copies of the layers.json
+# datasets stored under MERCATOR_PREFIX (built with `python -m rezoning_api.db.warp`)
+# zonal statistics and exports always use the geographic originals
+MERCATOR_PREFIX = os.getenv("MERCATOR_PREFIX", "mercator")
+USE_MERCATOR_COPIES = os.getenv("USE_MERCATOR_COPIES", "false").lower() == "true"
+
+# tile reads come from the quantized analysis cube holding every layer (built
+# with `python -m rezoning_api.db.cube`) instead of one COG per dataset
+CUBE_KEY = os.getenv("CUBE_KEY", "cube/analysis.tif")
+USE_CUBE = os.getenv("USE_CUBE", "false").lower() == "true"
+
+# remote (s3://) rasters are read through GDAL's /vsis3/ by default. With
+# RANGE_READS or a block cache they are read through core.ranges instead
+# (coalesced and hedged GETs, see below): hedging needs one of them. That path
+# goes through rasterio's Python file plugin, measure it with
+# bench/bench_ranges.py before enabling it
+RANGE_READS = os.getenv("RANGE_READS", "false").lower() == "true"
+
+# persistent on-disk cache of remote COG byte ranges (size in megabytes, 0, the
+# default, disables it), shared by all processes using the same directory
+BLOCK_CACHE_DIR = os.getenv("BLOCK_CACHE_DIR", "/tmp/rezoning-block-cache")
+BLOCK_CACHE_SIZE = int(os.getenv("BLOCK_CACHE_SIZE", 0))
+BLOCK_CACHE_BLOCK_SIZE = int(os.getenv("BLOCK_CACHE_BLOCK_SIZE", 64))  # kilobytes
+BLOCK_CACHE_HEAD_TTL = int(os.getenv("BLOCK_CACHE_HEAD_TTL", 300))  # seconds
+
+# speculatively compute the neighbours and children of requested tiles in the
+# background (0 workers disables it, it has no use on Lambda where the process
+# is frozen between requests). At most PREFETCH_BUDGET tiles wait at once
+PREFETCH_WORKERS = int(os.getenv("PREFETCH_WORKERS", 0))
+PREFETCH_BUDGET = int(os.getenv("PREFETCH_BUDGET", 32))
+
+# remote range reads: a duplicate (hedged) request is sent when a GET has not
+# completed after the RANGE_HEDGE_PERCENTILE of recent GET latencies (0
+# disables hedging), RANGE_HEDGE_DELAY seconds until enough GETs were observed
+# and never sooner than RANGE_HEDGE_MIN_DELAY. Missing blocks at most
+# RANGE_MERGE_GAP blocks apart are fetched with a single request
+RANGE_HEDGE_PERCENTILE = float(os.getenv("RANGE_HEDGE_PERCENTILE", 95))
+RANGE_HEDGE_DELAY = float(os.getenv("RANGE_HEDGE_DELAY", 0.5))
+RANGE_HEDGE_MIN_DELAY = float(os.getenv("RANGE_HEDGE_MIN_DELAY", 0.05))
+RANGE_MERGE_GAP = int(os.getenv("RANGE_MERGE_GAP", 2))
+RANGE_WORKERS = int(os.getenv("RANGE_WORKERS", 16))
+
+# threads computing tiles and zones off the event loop, and threads reading
+# datasets concurrently for them (reads mostly wait on S3 or GDAL I/O)
+COMPUTE_WORKERS = int(os.getenv("COMPUTE_WORKERS", min(32, (os.cpu_count() or 1) * 4)))
+IO_WORKERS = int(os.getenv("IO_WORKERS", 64))
+
+# seconds a request may run before its remaining work is abandoned with a 504
+# (0, the default, disables it: long exports and country zones may run as long
+# as they need); on Lambda the invocation's remaining time always applies
+REQUEST_TIMEOUT = float(os.getenv("REQUEST_TIMEOUT", 0))
+
+# admission control (see core.admission): per route concurrency classes,
+# requests over a class limit and queue are rejected with 503. ADMISSION_CLASSES
+# is a JSON object overriding the default classes
+ENABLE_ADMISSION_CONTROL = (
+    os.getenv("ENABLE_ADMISSION_CONTROL", "true").lower() == "true"
+)
+ADMISSION_CLASSES = json.loads(os.getenv("ADMISSION_CLASSES", "{}"))
+
+# cold start budget: seconds `import rezoning_api.main` may take before
+# `python -m rezoning_api.importtime` reports a regression
+IMPORT_TIME_BUDGET = float(os.getenv("IMPORT_TIME_BUDGET", 1.5))
+
+# warmup (see rezoning_api.warmup): run it when a worker starts (the app startup
+# event, or the Lambda handler's init), opening WARMUP_DATASETS (comma separated
+# layers.json keys, all when empty) and preparing WARMUP_COUNTRIES (comma
+# separated ISO3 codes, most requested first)
+WARMUP_ON_STARTUP = os.getenv("WARMUP_ON_STARTUP", "false").lower() == "true"
+WARMUP_DATASETS = [d for d in os.getenv("WARMUP_DATASETS", "").split(",") if d]
+WARMUP_COUNTRIES = [c for c in os.getenv("WARMUP_COUNTRIES", "").split(",") if c]
+
+# zone statistics are computed over blocks of ZONE_BLOCK_SIZE x ZONE_BLOCK_SIZE
+# pixels of the area, bounding memory use for large areas
+ZONE_BLOCK_SIZE = int(os.getenv("ZONE_BLOCK_SIZE", 512))
+# threads scoring the blocks of a zone concurrently (reads, decompression and
+# array arithmetic release the GIL)
+ZONE_WORKERS = int(os.getenv("ZONE_WORKERS", os.cpu_count() or 1))
+# maximum number of areas per batch zone request
+ZONE_BATCH_MAX_AOIS = int(os.getenv("ZONE_BATCH_MAX_AOIS", 256))
@@ -0,0 +1,133 @@
+"""
+per request deadlines and cancellation of abandoned requests
+
+DeadlineMiddleware gives every HTTP request a Deadline (the time left in the
+Lambda invocation, capped by REQUEST_TIMEOUT seconds when set; no expiry
+outside Lambda by default) held in a context variable, and cancels it when the client disconnects (e.g. a tile
+request aborted by the browser while panning). The context follows the
+request onto the compute and I/O executors (see core.aio), and the data
+layer calls check_deadline() between read and compute stages, so work for
+an abandoned or expired request stops at the next stage with
+RequestCancelled instead of running to completion.
+"""
+import asyncio
+import threading
+import time
+from contextvars import ContextVar
+from typing import Optional
+
+from starlette.requests import Request
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from rezoning_api.core.config import REQUEST_TIMEOUT
+
+# time kept to answer before the Lambda invocation itself times out, seconds
+LAMBDA_MARGIN = 2.0
+
+
+class RequestCancelled(Exception):
+    """the client disconnected or the request deadline expired"""
+
+
+class Deadline:
+    """expiry time and cancellation flag of a request"""
+
+    def __init__(self, timeout: Optional[float] = None):
+        """Init deadline, no expiry when timeout is None."""
+        self.expires = None if timeout is None else time.monotonic() + timeout
+        self._cancelled = threading.Event()
+
+    def cancel(self):
+        """mark the request as abandoned"""
+        self._cancelled.set()
+
+    @property
+    def cancelled(self) -> bool:
+        """whether the client went away"""
+        return self._cancelled.is_set()
+
+    @property
+    def expired(self) -> bool:
+        """whether the deadline passed"""
+        return self.expires is not None and time.monotonic() >= self.expires
+
+    def remaining(self) -> Optional[float]:
+        """seconds left, None without expiry"""
+        if self.expires is None:
+            return None
+        return max(self.expires - time.monotonic(), 0.0)
+
+    def check(self):
+        """raise RequestCancelled when the work is no longer wanted"""
+        if self.cancelled:
+            raise RequestCancelled("client disconnected")
+        if self.expired:
+            raise RequestCancelled("request deadline exceeded")
+
+
+_deadline: ContextVar[Optional[Deadline]] = ContextVar("deadline", default=None)
+
+
+def current_deadline() -> Optional[Deadline]:
+    """deadline of the request being served, None outside of requests"""
+    return _deadline.get()
+
+
+def check_deadline():
+    """raise RequestCancelled if the current request is abandoned or expired"""
+    deadline = _deadline.get()
+    if deadline is not None:
+        deadline.check()
+
+
+def request_timeout(scope: Scope) -> Optional[float]:
+    """
+    the time left in the Lambda invocation, capped by REQUEST_TIMEOUT when set,
+    None (no expiry) outside Lambda without REQUEST_TIMEOUT
+    """
+    timeout = REQUEST_TIMEOUT if REQUEST_TIMEOUT > 0 else None
+    context = scope.get("aws.context")
+    if context is not None and hasattr(context, "get_remaining_time_in_millis"):
+        remaining = context.get_remaining_time_in_millis() / 1000 - LAMBDA_MARGIN
+        timeout = remaining if timeout is None else min(timeout, remaining)
+    return timeout
+
+
+class DeadlineMiddleware:
+    """attach a Deadline to every request and cancel it on client disconnect"""
+
+    def __init__(self, app: ASGIApp):
+        """Init middleware."""
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        """Handle ASGI call."""
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        deadline = Deadline(request_timeout(scope))
+        messages: asyncio.Queue = asyncio.Queue()
+
+        async def watch_disconnect():
+            """forward request messages to the app, cancel on disconnect"""
+            while True:
+                message = await receive()
+                await messages.put(message)
+                if message["type"] == "http.disconnect":
+                    deadline.cancel()
+                    return
+
+        watcher = asyncio.ensure_future(watch_disconnect())
+        token = _deadline.set(deadline)
+        try:
+            await self.app(scope, messages.get, send)
+        finally:
+            _deadline.reset(token)
+            watcher.cancel()
+
+
+async def request_cancelled_handler(request: Request, exc: RequestCancelled):
+    """504 for expired requests; nobody reads the answer to a disconnected one"""
+    return JSONResponse({"detail": str(exc)}, status_code=504)
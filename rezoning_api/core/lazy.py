@@ -0,0 +1,59 @@
+"""
+deferred imports and clients, keeping them out of the import (cold start) path
+
+lazy_module returns a module that is only imported on first attribute access,
+LazyClient a boto3 client created (and boto3 imported) on first use. See
+rezoning_api.importtime for the import time report.
+"""
+import importlib
+import sys
+import threading
+from types import ModuleType
+from typing import Any, Optional
+
+
+class LazyModule:
+    """a module imported on first attribute access"""
+
+    def __init__(self, name: str):
+        """Init module proxy."""
+        self._name = name
+        self._module: Optional[ModuleType] = None
+        self._lock = threading.Lock()
+
+    def __getattr__(self, name: str) -> Any:
+        """forward to the module, importing it first"""
+        if self._module is None:
+            # import_module is thread safe, unlike importlib.util.LazyLoader
+            with self._lock:
+                self._module = importlib.import_module(self._name)
+        return getattr(self._module, name)
+
+
+def lazy_module(name: str) -> Any:
+    """the module itself when already imported, a LazyModule otherwise"""
+    return sys.modules.get(name) or LazyModule(name)
+
+
+class LazyClient:
+    """boto3 client for a service, created on first use"""
+
+    def __init__(self, service: str, **kwargs: Any):
+        """Init client proxy, kwargs are passed to boto3.client."""
+        self._service = service
+        self._kwargs = kwargs
+        self._client = None
+        self._lock = threading.Lock()
+
+    def _get(self):
+        """the actual client"""
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    boto3 = importlib.import_module("boto3")
+                    self._client = boto3.client(self._service, **self._kwargs)
+        return self._client
+
+    def __getattr__(self, name: str) -> Any:
+        """forward to the client"""
+        return getattr(self._get(), name)
@@ -0,0 +1,69 @@
+"""
+precomputed metadata responses
+
+Layer lists, schemas and country layer statistics are fetched by the web app
+on every page load but only change with a deploy. A PrecomputedResponse is
+built once per process (per country/resource where relevant): the body is
+serialized once, compressed once per supported content-encoding and every
+encoding carries its own strong ETag ("<sha1>", "<sha1>-gzip", "<sha1>-br"),
+so a request is answered with the stored bytes, or with 304 Not Modified
+when the client already holds any of them. The compression middleware
+passes these pre-compressed bodies through untouched.
+"""
+import hashlib
+from typing import Any, Dict, Type
+
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response
+
+from rezoning_api.core.compression import brotli, compress, select_encoding
+from rezoning_api.core.config import COMPRESSION_MINIMUM_SIZE
+from rezoning_api.core.serialize import FastJSONResponse
+
+
+class PrecomputedResponse:
+    """serialized, pre-compressed response body with an ETag per encoding"""
+
+    def __init__(
+        self, content: Any, response_class: Type[JSONResponse] = FastJSONResponse
+    ):
+        """Init response, rendering content with response_class."""
+        rendered = response_class(content)
+        self.body = rendered.body
+        self.media_type = rendered.media_type
+        digest = hashlib.sha1(self.body).hexdigest()
+        self.etag = f'"{digest}"'
+        self.variants: Dict[str, bytes] = {}
+        # encoding -> ETag, caches must not mix up the bodies of one resource
+        self.etags: Dict[str, str] = {}
+        if len(self.body) >= COMPRESSION_MINIMUM_SIZE:
+            for encoding in ("br", "gzip") if brotli is not None else ("gzip",):
+                self.variants[encoding] = compress(self.body, encoding)
+                self.etags[encoding] = f'"{digest}-{encoding}"'
+
+    def etag_matches(self, if_none_match: str) -> bool:
+        """whether an If-None-Match header matches the ETag of any encoding"""
+        if if_none_match.strip() == "*":
+            return True
+        for tag in if_none_match.split(","):
+            tag = tag.strip()
+            if tag.startswith("W/"):
+                tag = tag[2:]
+            if tag == self.etag or tag in self.etags.values():
+                return True
+        return False
+
+    def __call__(self, request: Request) -> Response:
+        """the response to a request: 304, or the best encoded body"""
+        encoding = select_encoding(request.headers.get("accept-encoding", ""))
+        body = self.variants.get(encoding)
+        etag = self.etags.get(encoding, self.etag)
+        headers = {"ETag": etag, "Vary": "Accept-Encoding"}
+        if self.etag_matches(request.headers.get("if-none-match", "")):
+            return Response(status_code=304, headers=headers)
+
+        if body is None:
+            body = self.body
+        else:
+            headers["Content-Encoding"] = encoding
+        return Response(body, media_type=self.media_type, headers=headers)
@@ -0,0 +1,82 @@
+"""low priority background prefetching with a bounded budget"""
+import logging
+import threading
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Deque, Optional, Set, Tuple
+
+from rezoning_api.core.aio import request_priority
+from rezoning_api.core.config import PREFETCH_BUDGET, PREFETCH_WORKERS
+
+logger = logging.getLogger(__name__)
+
+# priority of prefetch work on the shared executors (see core.aio): after every
+# request, whatever its admission class (see core.admission)
+PREFETCH_PRIORITY = 100
+
+
+class Prefetcher:
+    """
+    run speculative tasks on a few background threads. At most `budget` tasks
+    wait or run at once: when a new task exceeds the budget the oldest waiting
+    ones are cancelled, as they belong to a view the client has likely left.
+    Tasks are deduplicated by key.
+    """
+
+    def __init__(self, workers: int, budget: int):
+        """Init prefetcher."""
+        self.budget = budget
+        self._executor = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="prefetch"
+        )
+        self._queue: Deque[Tuple[str, Future]] = deque()
+        self._keys: Set[str] = set()
+        self._lock = threading.Lock()
+
+    def submit(self, key: str, fn: Callable, *args: Any, **kwargs: Any) -> bool:
+        """schedule fn(*args, **kwargs) unless a task with the same key is pending"""
+        with self._lock:
+            if key in self._keys:
+                return False
+            self._keys.add(key)
+            future = self._executor.submit(self._run, key, fn, args, kwargs)
+            self._queue = deque(item for item in self._queue if not item[1].done())
+            self._queue.append((key, future))
+
+            while len(self._queue) > self.budget:
+                old_key, old = self._queue.popleft()
+                if old.cancel():
+                    self._keys.discard(old_key)
+        return True
+
+    def _run(self, key: str, fn: Callable, args: tuple, kwargs: dict):
+        """run a task, prefetch failures are never fatal"""
+        token = request_priority.set(PREFETCH_PRIORITY)
+        try:
+            fn(*args, **kwargs)
+        except Exception:
+            logger.debug("prefetch of %s failed", key, exc_info=True)
+        finally:
+            request_priority.reset(token)
+            with self._lock:
+                self._keys.discard(key)
+
+    def pending(self) -> int:
+        """number of waiting or running tasks"""
+        with self._lock:
+            return sum(1 for _, future in self._queue if not future.done())
+
+
+_prefetcher: Optional[Prefetcher] = None
+_prefetcher_lock = threading.Lock()
+
+
+def get_prefetcher() -> Optional[Prefetcher]:
+    """the process wide prefetcher, None when disabled (PREFETCH_WORKERS = 0)"""
+    global _prefetcher
+    if PREFETCH_WORKERS <= 0:
+        return None
+    with _prefetcher_lock:
+        if _prefetcher is None:
+            _prefetcher = Prefetcher(PREFETCH_WORKERS, PREFETCH_BUDGET)
+    return _prefetcher
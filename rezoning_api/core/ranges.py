@@ -0,0 +1,211 @@
+"""
+coalesced and hedged ranged GETs against S3
+
+A tile touching several datasets waits for the slowest of its reads, so the
+occasional slow GET dominates tail latency. RangeReader.get issues a ranged
+GET and, when it has not completed after an adaptive threshold (a percentile
+of recently observed GET latencies), a duplicate "hedge" request: the first
+response wins and the other one is abandoned. Identical ranges requested
+concurrently (e.g. by metatile, batch and prefetch threads reading the same
+blocks) share one request. merge_ranges coalesces nearby ranges so they are
+fetched with one request. Waiting for a request stops when the request that
+needs the data is abandoned (see core.deadline).
+"""
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Deque, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from rezoning_api.core.config import (
+    RANGE_HEDGE_DELAY,
+    RANGE_HEDGE_MIN_DELAY,
+    RANGE_HEDGE_PERCENTILE,
+    RANGE_WORKERS,
+)
+from rezoning_api.core.deadline import RequestCancelled, check_deadline
+
+# latencies kept to compute the hedging threshold, and the number needed before
+# it is used instead of RANGE_HEDGE_DELAY
+LATENCY_WINDOW = 200
+LATENCY_MIN_SAMPLES = 20
+# bytes read at a time from a response body, between checks for cancellation
+CHUNK_SIZE = 64 * 1024
+# seconds between checks of the request deadline while waiting for a GET
+POLL_INTERVAL = 0.1
+
+Range = Tuple[int, int]
+
+
+def merge_ranges(ranges: List[Range], gap: int = 0) -> List[Range]:
+    """
+    merge inclusive (start, end) ranges that overlap, touch or are at most `gap`
+    apart: fetching a few unneeded units is cheaper than another round trip
+    """
+    merged: List[List[int]] = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1] + gap + 1:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return [(start, end) for start, end in merged]
+
+
+class LatencyTracker:
+    """sliding window of request latencies"""
+
+    def __init__(self, size: int = LATENCY_WINDOW):
+        """Init tracker."""
+        self._samples: Deque[float] = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float):
+        """add a latency sample"""
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, q: float) -> Optional[float]:
+        """q-th percentile of the window, None until there are enough samples"""
+        with self._lock:
+            if len(self._samples) < LATENCY_MIN_SAMPLES:
+                return None
+            samples = list(self._samples)
+        return float(np.percentile(samples, q))
+
+
+class _Cancelled(Exception):
+    """the request lost to its hedge"""
+
+
+class RangeReader:
+    """ranged GETs with hedging and sharing of concurrent identical requests"""
+
+    def __init__(
+        self,
+        client,
+        percentile: float = RANGE_HEDGE_PERCENTILE,
+        initial_delay: float = RANGE_HEDGE_DELAY,
+        min_delay: float = RANGE_HEDGE_MIN_DELAY,
+        workers: int = RANGE_WORKERS,
+    ):
+        """Init reader, percentile=0 disables hedging."""
+        self.client = client
+        self.percentile = percentile
+        self.initial_delay = initial_delay
+        self.min_delay = min_delay
+        self.latency = LatencyTracker()
+        self.requests = 0
+        self._executor = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="range"
+        )
+        self._inflight: Dict[Tuple[str, str, int, int], Future] = {}
+        self._lock = threading.Lock()
+
+    def hedge_delay(self) -> float:
+        """seconds to wait for a request before sending its hedge"""
+        delay = self.latency.percentile(self.percentile)
+        if delay is None:
+            delay = self.initial_delay
+        return max(delay, self.min_delay)
+
+    def _request(self, bucket: str, key: str, start: int, end: int, cancel) -> bytes:
+        """one ranged GET, abandoned between chunks once `cancel` is set"""
+        t1 = time.monotonic()
+        with self._lock:
+            self.requests += 1
+        response = self.client.get_object(
+            Bucket=bucket, Key=key, Range=f"bytes={start}-{end}"
+        )
+        body = response["Body"]
+        chunks = []
+        try:
+            for chunk in iter(lambda: body.read(CHUNK_SIZE), b""):
+                if cancel.is_set():
+                    raise _Cancelled()
+                chunks.append(chunk)
+        finally:
+            body.close()
+        self.latency.record(time.monotonic() - t1)
+        return b"".join(chunks)
+
+    def _wait(self, futures, timeout: Optional[float] = None):
+        """wait for the first of futures to complete, checking the request deadline"""
+        end = None if timeout is None else time.monotonic() + timeout
+        while True:
+            step = POLL_INTERVAL
+            if end is not None:
+                step = min(step, max(end - time.monotonic(), 0))
+            done, pending = wait(futures, timeout=step, return_when=FIRST_COMPLETED)
+            if done or (end is not None and time.monotonic() >= end):
+                return done, pending
+            check_deadline()
+
+    def _hedged(self, bucket: str, key: str, start: int, end: int) -> bytes:
+        """run the request, and its hedge if it is slow; first success wins"""
+        cancel = threading.Event()
+        args = (bucket, key, start, end, cancel)
+        t1 = time.monotonic()
+        primary = self._executor.submit(self._request, *args)
+        pending = {primary}
+        try:
+            if self.percentile > 0:
+                done, _ = self._wait(pending, timeout=self.hedge_delay())
+                if not done:
+                    pending.add(self._executor.submit(self._request, *args))
+
+            error = None
+            while pending:
+                done, pending = self._wait(pending)
+                for future in done:
+                    try:
+                        data = future.result()
+                    except Exception as e:
+                        error = error or e
+                        continue
+                    if future is not primary:
+                        # the primary lost and is abandoned: record the time it
+                        # ran as a lower bound of its latency, or the slow
+                        # requests would never be seen and hedges fire ever
+                        # more often
+                        self.latency.record(time.monotonic() - t1)
+                    return data
+            raise error
+        finally:
+            # abandon the losing (or, when cancelled, every) request
+            cancel.set()
+            for future in pending:
+                future.cancel()
+
+    def get(self, bucket: str, key: str, start: int, end: int) -> bytes:
+        """bytes start..end (inclusive) of an S3 object"""
+        check_deadline()
+        request = (bucket, key, start, end)
+        while True:
+            with self._lock:
+                future = self._inflight.get(request)
+                owner = future is None
+                if owner:
+                    future = Future()
+                    self._inflight[request] = future
+            if owner:
+                break
+            self._wait({future})
+            try:
+                return future.result()
+            except RequestCancelled:
+                # the request that issued the GET was abandoned, not this one
+                continue
+
+        try:
+            data = self._hedged(bucket, key, start, end)
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(data)
+            return data
+        finally:
+            with self._lock:
+                del self._inflight[request]
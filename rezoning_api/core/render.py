@@ -0,0 +1,138 @@
+"""tile encoding with precomputed colormap lookup tables and paletted PNGs"""
+import struct
+import zlib
+from functools import lru_cache
+from typing import Dict, Optional, Sequence
+
+import numpy as np
+from rio_tiler.colormap import cmap, make_lut
+from rio_tiler.utils import render
+
+from rezoning_api.core.config import TILE_FORMAT, TILE_WEBP_LOSSLESS, TILE_ZLEVEL
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+
+# PNG color types and scanline filters we use
+PALETTE = 3
+RGBA = 6
+FILTER_NONE = 0
+FILTER_UP = 2
+
+MEDIA_TYPES = {"png": "image/png", "webp": "image/webp"}
+
+
+def tile_media_type() -> str:
+    """media type of the tiles produced by this module"""
+    return MEDIA_TYPES[TILE_FORMAT]
+
+
+@lru_cache(maxsize=64)
+def colormap_lut(name: str) -> np.ndarray:
+    """256 x 4 (RGBA) lookup table for a named rio-tiler colormap"""
+    lut = make_lut(cmap.get(name)).astype(np.uint8)
+    lut.flags.writeable = False
+    return lut
+
+
+def lut_from_colormap(colormap: Dict[int, Sequence[int]]) -> np.ndarray:
+    """256 x 4 (RGBA) lookup table from a {value: [r, g, b, a]} colormap"""
+    lut = make_lut(colormap).astype(np.uint8)
+    lut.flags.writeable = False
+    return lut
+
+
+def _chunk(tag: bytes, data: bytes) -> bytes:
+    """encode a single PNG chunk"""
+    crc = zlib.crc32(data, zlib.crc32(tag)) & 0xFFFFFFFF
+    return struct.pack(">I", len(data)) + tag + data + struct.pack(">I", crc)
+
+
+def encode_png(
+    rows: np.ndarray,
+    width: int,
+    bit_depth: int,
+    color_type: int,
+    palette: Optional[np.ndarray] = None,
+    zlevel: int = TILE_ZLEVEL,
+) -> bytes:
+    """
+    encode already packed scanlines (height x bytes per row, uint8) as PNG
+    paletted images are written unfiltered, truecolor ones with the "up" filter
+    """
+    height = rows.shape[0]
+    scanlines = np.empty((height, rows.shape[1] + 1), dtype=np.uint8)
+    if color_type == PALETTE:
+        scanlines[:, 0] = FILTER_NONE
+        scanlines[:, 1:] = rows
+    else:
+        scanlines[:, 0] = FILTER_UP
+        scanlines[0, 1:] = rows[0]
+        np.subtract(rows[1:], rows[:-1], out=scanlines[1:, 1:])
+
+    header = struct.pack(">IIBBBBB", width, height, bit_depth, color_type, 0, 0, 0)
+    chunks = [_chunk(b"IHDR", header)]
+    if palette is not None:
+        chunks.append(_chunk(b"PLTE", palette[:, :3].tobytes()))
+        # alpha per palette entry, trailing opaque entries can be omitted
+        alpha = palette[:, 3]
+        transparent = np.flatnonzero(alpha != 255)
+        if transparent.size:
+            chunks.append(_chunk(b"tRNS", alpha[: transparent[-1] + 1].tobytes()))
+    chunks.append(_chunk(b"IDAT", zlib.compress(scanlines.tobytes(), zlevel)))
+    chunks.append(_chunk(b"IEND", b""))
+    return PNG_SIGNATURE + b"".join(chunks)
+
+
+def _render_webp(rgba: np.ndarray) -> bytes:
+    """encode a (4, h, w) RGBA array as WebP through GDAL"""
+    options = dict(lossless=True) if TILE_WEBP_LOSSLESS else dict(quality=90)
+    return render(rgba[:3], mask=rgba[3], img_format="WEBP", **options)
+
+
+def render_binary(mask: np.ndarray, color: Sequence[int]) -> bytes:
+    """
+    render a boolean tile: pixels are either the given RGBA color or transparent
+    written as a 1-bit paletted PNG
+    """
+    mask = np.asarray(mask, dtype=np.bool_)
+    if TILE_FORMAT == "webp":
+        rgba = np.zeros((4,) + mask.shape, dtype=np.uint8)
+        for band, value in zip(rgba, color):
+            band[mask] = value
+        return _render_webp(rgba)
+
+    palette = np.array([[0, 0, 0, 0], list(color)], dtype=np.uint8)
+    rows = np.packbits(mask, axis=1)
+    return encode_png(rows, mask.shape[1], 1, PALETTE, palette=palette)
+
+
+def render_lut(data: np.ndarray, mask: np.ndarray, lut: np.ndarray) -> bytes:
+    """
+    render uint8 data through a 256 entry RGBA lookup table, masked pixels are
+    transparent. The output is a paletted PNG whenever a palette index is free
+    to represent masked pixels (or already transparent), RGBA otherwise.
+    """
+    data = np.asarray(data, dtype=np.uint8)
+    mask = np.asarray(mask, dtype=np.bool_)
+    height, width = data.shape
+
+    if TILE_FORMAT == "png":
+        transparent = np.flatnonzero(lut[:, 3] == 0)
+        if transparent.size:
+            index = transparent[0]
+            palette = lut
+        else:
+            unused = np.flatnonzero(np.bincount(data[mask], minlength=256) == 0)
+            index = unused[0] if unused.size else None
+            if index is not None:
+                palette = lut.copy()
+                palette[index] = 0
+        if index is not None:
+            indices = np.where(mask, data, np.uint8(index))
+            return encode_png(indices, width, 8, PALETTE, palette=palette)
+
+    rgba = lut[data]
+    rgba[..., 3] = np.where(mask, rgba[..., 3], 0)
+    if TILE_FORMAT == "webp":
+        return _render_webp(np.moveaxis(rgba, -1, 0))
+    return encode_png(rgba.reshape(height, width * 4), width, 8, RGBA)
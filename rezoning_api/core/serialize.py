@@ -0,0 +1,72 @@
+"""
+JSON serialization of API responses
+
+dumps() serializes with orjson when it is installed (the `json` extra): NaN
+and infinity become null and numpy scalars and arrays are encoded natively,
+without walking the content first. Without orjson the standard library is
+used, with a pre-pass replacing non-finite floats.
+"""
+import json
+import math
+from enum import Enum
+from typing import Any
+
+import numpy as np
+from pydantic import BaseModel
+from starlette.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError:  # pragma: nocover
+    orjson = None  # type: ignore
+
+
+def _default(obj: Any) -> Any:
+    """JSON compatible version of types neither encoder handles"""
+    if isinstance(obj, np.ma.MaskedArray):
+        return _finite(obj.astype(float).filled(np.nan).tolist())
+    if isinstance(obj, (np.generic, np.ndarray)):
+        return _finite(obj.tolist())
+    if isinstance(obj, BaseModel):
+        return obj.dict()
+    if isinstance(obj, Enum):
+        return obj.value
+    if isinstance(obj, (set, frozenset)):
+        return list(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def _finite(obj: Any) -> Any:
+    """content with non-finite floats replaced by None (standard library path)"""
+    if isinstance(obj, float):
+        return obj if math.isfinite(obj) else None
+    if isinstance(obj, dict):
+        return {k: _finite(v) for k, v in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return [_finite(v) for v in obj]
+    return obj
+
+
+def dumps(content: Any) -> bytes:
+    """compact UTF-8 JSON, non-finite numbers as null"""
+    if orjson is not None:
+        return orjson.dumps(
+            content,
+            default=_default,
+            option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS,
+        )
+    return json.dumps(
+        _finite(content),
+        ensure_ascii=False,
+        allow_nan=False,
+        separators=(",", ":"),
+        default=_default,
+    ).encode("utf-8")
+
+
+class FastJSONResponse(JSONResponse):
+    """JSON response serialized with dumps"""
+
+    def render(self, content: Any) -> bytes:
+        """Render content."""
+        return dumps(content)
@@ -0,0 +1,326 @@
+"""tile result computation: caching, metatiles, batches, overzoom, prefetching"""
+import re
+from collections import defaultdict
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from fastapi import HTTPException
+
+from rezoning_api.core.aio import run_compute
+from rezoning_api.core.cache import (
+    cached_result,
+    pack_result,
+    result_cache,
+    result_flights,
+    result_key,
+    unpack_result,
+)
+from rezoning_api.core.config import (
+    BATCH_MAX_BLOCK,
+    BATCH_MAX_TILES,
+    ENABLE_CACHE,
+    MAX_NATIVE_ZOOM,
+    METATILE_SIZE,
+)
+from rezoning_api.core.deadline import check_deadline
+from rezoning_api.core.prefetch import get_prefetcher
+
+# compute(z, x, y, tilesize, block) -> packed result (see core.cache.pack_result)
+# or None, where block=(cols, rows) is the number of tiles starting at x/y that
+# are computed together as one window
+TileCompute = Callable[[int, int, int, int, Tuple[int, int]], Optional[Tuple]]
+
+TileIndex = Tuple[int, int, int]
+
+_MISSING = object()
+_TILE_PATTERN = re.compile(r"^(\d+)/(\d+)/(\d+)$")
+
+
+def slice_result(unpacked: Optional[Tuple], row: int, col: int, size: int):
+    """cut the size x size child at (row, col) out of a larger unpacked result"""
+    if unpacked is None:
+        return None
+    data, mask = unpacked
+    window = (slice(row * size, (row + 1) * size), slice(col * size, (col + 1) * size))
+    return pack_result(None if data is None else data[window], mask[window])
+
+
+def native_tile(z: int, x: int, y: int) -> TileIndex:
+    """the tile at MAX_NATIVE_ZOOM containing z/x/y (or the tile itself)"""
+    if z <= MAX_NATIVE_ZOOM:
+        return (z, x, y)
+    levels = z - MAX_NATIVE_ZOOM
+    return (MAX_NATIVE_ZOOM, x >> levels, y >> levels)
+
+
+def overzoom_result(
+    parent: Optional[Tuple], levels: int, x: int, y: int, tilesize: int
+) -> Optional[Tuple]:
+    """
+    upsample (nearest neighbour) the part of a packed parent result covering the
+    tile x/y, `levels` zoom levels below the parent
+    """
+    if parent is None:
+        return None
+    data, mask = unpack_result(parent)
+    scale = 2 ** levels
+    # parent pixel for every child pixel row/column
+    rows = ((y % scale) * tilesize + np.arange(tilesize)) // scale
+    cols = ((x % scale) * tilesize + np.arange(tilesize)) // scale
+    window = np.ix_(rows, cols)
+    return pack_result(None if data is None else data[window], mask[window])
+
+
+def parse_tiles(tiles: str) -> List[TileIndex]:
+    """parse a comma separated list of z/x/y tile indices"""
+    parsed = []
+    for item in tiles.split(","):
+        match = _TILE_PATTERN.match(item.strip())
+        if not match:
+            raise HTTPException(status_code=400, detail=f"invalid tile: {item}")
+        z, x, y = (int(v) for v in match.groups())
+        if x >= 2 ** z or y >= 2 ** z:
+            raise HTTPException(status_code=400, detail=f"invalid tile: {item}")
+        parsed.append((z, x, y))
+
+    if len(parsed) > BATCH_MAX_TILES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"at most {BATCH_MAX_TILES} tiles can be requested at once",
+        )
+    return parsed
+
+
+def _compute_block(
+    name: str,
+    compute: TileCompute,
+    z: int,
+    x0: int,
+    y0: int,
+    cols: int,
+    rows: int,
+    tilesize: int,
+    **params: Any,
+) -> Dict[TileIndex, Optional[Tuple]]:
+    """compute a cols x rows block of tiles in one pass and cache every tile of it"""
+    check_deadline()
+    block = compute(z, x0, y0, tilesize, (cols, rows))
+    block = None if block is None else unpack_result(block)
+
+    results = {}
+    for row in range(rows):
+        for col in range(cols):
+            tile = slice_result(block, row, col, tilesize)
+            x, y = x0 + col, y0 + row
+            if ENABLE_CACHE:
+                key = result_key(name, z=z, x=x, y=y, tilesize=tilesize, **params)
+                result_cache.set(key, tile)
+            results[(z, x, y)] = tile
+    return results
+
+
+def prefetch_tiles(z: int, x: int, y: int) -> List[TileIndex]:
+    """what a map asks for after z/x/y: the ring of neighbours and the children"""
+    n = 2 ** z
+    tiles = [
+        (z, (x + dx) % n, y + dy)
+        for dy in (-1, 0, 1)
+        for dx in (-1, 0, 1)
+        if 0 <= y + dy < n
+    ]
+    if z < MAX_NATIVE_ZOOM:
+        tiles += [(z + 1, 2 * x + dx, 2 * y + dy) for dy in (0, 1) for dx in (0, 1)]
+    return [tile for tile in dict.fromkeys(tiles) if tile != (z, x, y)]
+
+
+def tile_result(
+    name: str,
+    compute: TileCompute,
+    z: int,
+    x: int,
+    y: int,
+    tilesize: int = 256,
+    **params: Any,
+):
+    """
+    return the (cached) analytical result for tile z/x/y, and schedule the
+    tiles likely requested next in the background (see core.prefetch)
+    """
+    tilesize = int(tilesize)
+    result = _tile_result(name, compute, z, x, y, tilesize, **params)
+    _prefetch(name, compute, z, x, y, tilesize, **params)
+    return result
+
+
+async def tile_result_async(
+    name: str,
+    compute: TileCompute,
+    z: int,
+    x: int,
+    y: int,
+    tilesize: int = 256,
+    **params: Any,
+):
+    """
+    tile_result for async endpoints: cached results are returned without
+    leaving the event loop, others are computed on the compute executor
+    """
+    tilesize = int(tilesize)
+    if ENABLE_CACHE:
+        # overzoomed tiles are upsampled from their cached parent
+        native = native_tile(z, x, y)
+        key = result_key(
+            name, z=native[0], x=native[1], y=native[2], tilesize=tilesize, **params
+        )
+        result = result_cache.get(key, _MISSING)
+        if result is not _MISSING:
+            if z > MAX_NATIVE_ZOOM:
+                result = overzoom_result(result, z - native[0], x, y, tilesize)
+            _prefetch(name, compute, z, x, y, tilesize, **params)
+            return result
+    return await run_compute(tile_result, name, compute, z, x, y, tilesize, **params)
+
+
+async def tile_results_async(
+    name: str,
+    compute: TileCompute,
+    tiles: Sequence[TileIndex],
+    tilesize: int = 256,
+    **params: Any,
+) -> List[Optional[Tuple]]:
+    """tile_results for async endpoints, run on the compute executor"""
+    return await run_compute(tile_results, name, compute, tiles, tilesize, **params)
+
+
+def _prefetch(
+    name: str,
+    compute: TileCompute,
+    z: int,
+    x: int,
+    y: int,
+    tilesize: int,
+    **params: Any,
+):
+    """schedule the uncached tiles likely requested after z/x/y (see core.prefetch)"""
+    prefetcher = get_prefetcher()
+    if prefetcher is None or not ENABLE_CACHE:
+        return
+    for tile in prefetch_tiles(z, x, y):
+        native = native_tile(*tile)
+        key = result_key(
+            name, z=native[0], x=native[1], y=native[2], tilesize=tilesize, **params
+        )
+        if key not in result_cache:
+            prefetcher.submit(
+                key, _tile_result, name, compute, *native, tilesize, **params
+            )
+
+
+def _tile_result(
+    name: str,
+    compute: TileCompute,
+    z: int,
+    x: int,
+    y: int,
+    tilesize: int = 256,
+    **params: Any,
+):
+    """
+    return the (cached) analytical result for tile z/x/y
+
+    With METATILE_SIZE = N > 1 the result is computed for the aligned N x N block
+    of tiles containing z/x/y in a single read at N times the tile size, and
+    every tile of the block is cached. Concurrent requests for the tiles of a
+    block (or of an overzoomed parent) share a single computation.
+
+    Tiles above MAX_NATIVE_ZOOM are upsampled from their ancestor at
+    MAX_NATIVE_ZOOM, so only that ancestor is read, computed and cached.
+    """
+    tilesize = int(tilesize)
+    if z > MAX_NATIVE_ZOOM:
+        native = native_tile(z, x, y)
+        parent = _tile_result(name, compute, *native, tilesize, **params)
+        return overzoom_result(parent, z - native[0], x, y, tilesize)
+
+    if METATILE_SIZE <= 1 or not ENABLE_CACHE:
+        return cached_result(
+            name,
+            lambda: compute(z, x, y, tilesize, (1, 1)),
+            z=z,
+            x=x,
+            y=y,
+            tilesize=tilesize,
+            **params,
+        )
+
+    key = result_key(name, z=z, x=x, y=y, tilesize=tilesize, **params)
+    result = result_cache.get(key, _MISSING)
+    if result is not _MISSING:
+        return result
+
+    size = min(METATILE_SIZE, 2 ** z)
+    x0, y0 = x // size * size, y // size * size
+
+    def compute_block():
+        # computed by a block that completed since the lookup
+        result = result_cache.get(key, _MISSING)
+        if result is not _MISSING:
+            return {(z, x, y): result}
+        return _compute_block(name, compute, z, x0, y0, size, size, tilesize, **params)
+
+    # the tiles of a block requested together (a map view) share one computation
+    block_key = result_key(name, block=[z, x0, y0, size], tilesize=tilesize, **params)
+    results = result_flights.run(block_key, compute_block)
+    if (z, x, y) not in results:
+        # joined a computation that found another tile of the block cached
+        return _tile_result(name, compute, z, x, y, tilesize, **params)
+    return results[(z, x, y)]
+
+
+def tile_results(
+    name: str,
+    compute: TileCompute,
+    tiles: Sequence[TileIndex],
+    tilesize: int = 256,
+    **params: Any,
+) -> List[Optional[Tuple]]:
+    """
+    return the (cached) analytical results for many tiles sharing one parameter set
+
+    Cache misses are grouped per zoom level into aligned groups of at most
+    BATCH_MAX_BLOCK x BATCH_MAX_BLOCK tiles, and each group is computed once
+    over the window spanning its missing tiles. Tiles above MAX_NATIVE_ZOOM are
+    upsampled from their ancestors, each ancestor being computed once.
+    """
+    tilesize = int(tilesize)
+    if any(z > MAX_NATIVE_ZOOM for z, _, _ in tiles):
+        natives = [native_tile(*tile) for tile in tiles]
+        unique = list(dict.fromkeys(natives))
+        computed = tile_results(name, compute, unique, tilesize, **params)
+        parents = dict(zip(unique, computed))
+        return [
+            overzoom_result(parents[native], z - native[0], x, y, tilesize)
+            for (z, x, y), native in zip(tiles, natives)
+        ]
+
+    results: Dict[TileIndex, Optional[Tuple]] = {}
+    groups: Dict[Tuple[int, int, int], List[TileIndex]] = defaultdict(list)
+    for z, x, y in tiles:
+        if ENABLE_CACHE:
+            key = result_key(name, z=z, x=x, y=y, tilesize=tilesize, **params)
+            result = result_cache.get(key, _MISSING)
+            if result is not _MISSING:
+                results[(z, x, y)] = result
+                continue
+        groups[(z, x // BATCH_MAX_BLOCK, y // BATCH_MAX_BLOCK)].append((z, x, y))
+
+    for (z, _, _), missing in groups.items():
+        x0 = min(x for _, x, _ in missing)
+        y0 = min(y for _, _, y in missing)
+        cols = max(x for _, x, _ in missing) - x0 + 1
+        rows = max(y for _, _, y in missing) - y0 + 1
+        results.update(
+            _compute_block(name, compute, z, x0, y0, cols, rows, tilesize, **params)
+        )
+
+    return [results[tile] for tile in tiles]
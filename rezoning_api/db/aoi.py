@@ -0,0 +1,301 @@
+"""
+shared analysis grid for area (zone, export) reads
+
+An area read used to cut every dataset with its own cutline (one warp per
+dataset, each with a slightly different window). The AOIGrid of an area is
+computed once from a reference dataset: the window covering the area snapped
+outward to whole pixels, and the area, simplified to the pixel resolution,
+rasterized on it. Datasets on the same grid are then read as plain windows,
+others are warped onto it, without a cutline. A label grid covers several
+areas at once, its pixels labelled by area, for batch zone statistics: only
+the areas are rasterized, labels are built for the blocks they cover, so far
+apart areas cost no memory for the pixels between them.
+"""
+import math
+from typing import Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+from rasterio import windows
+from rasterio.crs import CRS
+from rasterio.enums import Resampling
+from rasterio.features import geometry_mask
+from rasterio.transform import Affine
+from rasterio.vrt import WarpedVRT
+from rasterio.warp import transform_geom
+from shapely.geometry import mapping, shape
+
+WGS84 = CRS.from_epsg(4326)
+
+
+class Zone(NamedTuple):
+    """an area of a label grid"""
+
+    # window of the area in the label grid
+    window: windows.Window
+    # True inside the area, (window.height, window.width)
+    inside: np.ndarray
+    # label layer of the area, areas in the same layer do not overlap
+    layer: int
+
+
+class AOIGrid(NamedTuple):
+    """the analysis grid of an area"""
+
+    crs: CRS
+    transform: Affine
+    width: int
+    height: int
+    # True inside the area, (height, width), None for a label grid (see blocks)
+    mask: Optional[np.ndarray]
+    # zone labels of a block, 0 outside every zone, (layers, height, width)
+    labels: Optional[np.ndarray] = None
+    # the zones of a label grid (see label_grid)
+    zones: Optional[List[Zone]] = None
+
+    @property
+    def bounds(self) -> Tuple[float, float, float, float]:
+        """left, bottom, right, top in the grid CRS"""
+        return windows.bounds(
+            windows.Window(0, 0, self.width, self.height), self.transform
+        )
+
+    def blocks(self, size: int) -> Iterator["AOIGrid"]:
+        """size x size pixel blocks of the grid, skipping blocks outside the area"""
+        if self.zones is not None:
+            yield from self._label_blocks(size)
+            return
+
+        for row_off in range(0, self.height, size):
+            for col_off in range(0, self.width, size):
+                rows = slice(row_off, row_off + size)
+                cols = slice(col_off, col_off + size)
+                mask = self.mask[rows, cols]
+                if not mask.any():
+                    continue
+                window = windows.Window(col_off, row_off, mask.shape[1], mask.shape[0])
+                yield AOIGrid(
+                    self.crs,
+                    windows.transform(window, self.transform),
+                    mask.shape[1],
+                    mask.shape[0],
+                    mask,
+                    None if self.labels is None else self.labels[:, rows, cols],
+                )
+
+    def _label_blocks(self, size: int) -> Iterator["AOIGrid"]:
+        """blocks of a label grid covered by zones, with their labels"""
+        # block (row, col) -> labels of the zones overlapping it
+        covered: Dict[Tuple[int, int], List[int]] = {}
+        for label, zone in enumerate(self.zones, start=1):
+            window = zone.window
+            bottom = window.row_off + window.height
+            right = window.col_off + window.width
+            rows = range(window.row_off // size, math.ceil(bottom / size))
+            cols = range(window.col_off // size, math.ceil(right / size))
+            for row in rows:
+                for col in cols:
+                    covered.setdefault((row, col), []).append(label)
+
+        layers = max(zone.layer for zone in self.zones) + 1
+        for row, col in sorted(covered):
+            row_off, col_off = row * size, col * size
+            height = min(size, self.height - row_off)
+            width = min(size, self.width - col_off)
+            labels = np.zeros((layers, height, width), dtype=np.int32)
+            block = windows.Window(col_off, row_off, width, height)
+            for label in covered[(row, col)]:
+                zone = self.zones[label - 1]
+                rows, cols = _intersection(block, zone.window)
+                inside = zone.inside[_shift(rows, cols, zone.window)]
+                labels[zone.layer][_shift(rows, cols, block)][inside] = label
+
+            mask = labels.any(axis=0)
+            if not mask.any():
+                continue
+            yield AOIGrid(
+                self.crs,
+                windows.transform(block, self.transform),
+                width,
+                height,
+                mask,
+                labels,
+            )
+
+
+def _intersection(a: windows.Window, b: windows.Window) -> Tuple[slice, slice]:
+    """rows and columns of two windows of a grid in both, empty if disjoint"""
+    top = max(a.row_off, b.row_off)
+    left = max(a.col_off, b.col_off)
+    bottom = max(min(a.row_off + a.height, b.row_off + b.height), top)
+    right = max(min(a.col_off + a.width, b.col_off + b.width), left)
+    return slice(top, bottom), slice(left, right)
+
+
+def _shift(rows: slice, cols: slice, window: windows.Window) -> Tuple[slice, slice]:
+    """grid rows and columns relative to a window"""
+    return (
+        slice(rows.start - window.row_off, rows.stop - window.row_off),
+        slice(cols.start - window.col_off, cols.stop - window.col_off),
+    )
+
+
+def _pixel_window(bounds, transform: Affine) -> Tuple[float, float, float, float]:
+    """
+    col_off, row_off, width, height of bounds in a north up grid (plain affine
+    math: rasterio's window functions set up a GDAL environment on each call)
+    """
+    left, bottom, right, top = bounds
+    col_off, row_off = ~transform * (left, top)
+    col_end, row_end = ~transform * (right, bottom)
+    return col_off, row_off, col_end - col_off, row_end - row_off
+
+
+def _area(src, geometry: dict):
+    """shapely geometry of an (EPSG:4326) geometry or feature, in the src CRS"""
+    geometry = geometry.get("geometry", geometry)
+    if src.crs != WGS84:
+        geometry = transform_geom(WGS84, src.crs, geometry)
+    return shape(geometry)
+
+
+def _grid(src, bounds, max_size: Optional[int] = None) -> Tuple[Affine, int, int]:
+    """transform, width and height of the whole src pixels covering bounds"""
+    col, row, cols, rows = _pixel_window(bounds, src.transform)
+    col_off = math.floor(round(col, 6))
+    row_off = math.floor(round(row, 6))
+    width = max(math.ceil(round(col + cols, 6)) - col_off, 1)
+    height = max(math.ceil(round(row + rows, 6)) - row_off, 1)
+    transform = windows.transform(
+        windows.Window(col_off, row_off, width, height), src.transform
+    )
+
+    if max_size and max(width, height) > max_size:
+        ratio = max(width, height) / max_size
+        out_width = max(round(width / ratio), 1)
+        out_height = max(round(height / ratio), 1)
+        transform = transform * Affine.scale(width / out_width, height / out_height)
+        width, height = out_width, out_height
+    return transform, width, height
+
+
+def _rasterize(area, transform: Affine, width: int, height: int) -> np.ndarray:
+    """pixels of a grid with their center inside area"""
+    # simplified at a tenth of a pixel: thousands of vertices of a drawn
+    # polygon collapse to a few per pixel edge, which barely moves pixel centers
+    tolerance = min(abs(transform.a), abs(transform.e)) / 10
+    area = area.simplify(tolerance, preserve_topology=True)
+    return geometry_mask(
+        [mapping(area)],
+        out_shape=(height, width),
+        transform=transform,
+        invert=True,
+    )
+
+
+def aoi_grid(src, geometry: dict, max_size: Optional[int] = None) -> AOIGrid:
+    """
+    grid of the open dataset src covering an (EPSG:4326) geometry or feature,
+    decimated so its longest side is at most max_size pixels
+    """
+    area = _area(src, geometry)
+    transform, width, height = _grid(src, area.bounds, max_size)
+    mask = _rasterize(area, transform, width, height)
+    return AOIGrid(src.crs, transform, width, height, mask)
+
+
+def _overlap(a: Zone, b: Zone) -> bool:
+    """whether two zones share a pixel"""
+    rows, cols = _intersection(a.window, b.window)
+    if rows.start >= rows.stop or cols.start >= cols.stop:
+        return False
+    a_inside = a.inside[_shift(rows, cols, a.window)]
+    b_inside = b.inside[_shift(rows, cols, b.window)]
+    return bool((a_inside & b_inside).any())
+
+
+def label_grid(src, geometries: List[dict]) -> AOIGrid:
+    """
+    grid of the open dataset src covering several (EPSG:4326) geometries, with
+    labels: pixels of geometries[i] are labelled i + 1 in the blocks of the
+    grid. Overlapping geometries are labelled in separate layers
+    """
+    areas = [_area(src, geometry) for geometry in geometries]
+    lefts, bottoms, rights, tops = zip(*(area.bounds for area in areas))
+    bounds = (min(lefts), min(bottoms), max(rights), max(tops))
+    transform, width, height = _grid(src, bounds)
+
+    zones: List[Zone] = []
+    for area in areas:
+        # rasterized on the grid aoi_grid gives the area alone, so every zone
+        # has the pixels of a single area request
+        area_transform, area_width, area_height = _grid(src, area.bounds)
+        inside = _rasterize(area, area_transform, area_width, area_height)
+        col, row = ~transform * (area_transform.c, area_transform.f)
+        window = windows.Window(round(col), round(row), area_width, area_height)
+
+        # the first layer without an overlapping zone
+        zone = Zone(window, inside, 0)
+        taken = {other.layer for other in zones if _overlap(zone, other)}
+        while zone.layer in taken:
+            zone = zone._replace(layer=zone.layer + 1)
+        zones.append(zone)
+
+    return AOIGrid(src.crs, transform, width, height, None, zones=zones)
+
+
+def _window(src, grid: AOIGrid) -> Optional[windows.Window]:
+    """window of src the grid was built on (possibly decimated), None if not aligned"""
+    if src.crs != grid.crs:
+        return None
+    # the grid must start and end on source pixel edges
+    edges = _pixel_window(grid.bounds, src.transform)
+    if not all(abs(v - round(v)) < 1e-6 for v in edges):
+        return None
+    return windows.Window(*(round(v) for v in edges))
+
+
+def read_grid(src, grid: AOIGrid, indexes: List[int]) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    read bands of an open dataset on an area grid, returns the data and a
+    mask (255 for valid pixels inside the area, 0 elsewhere)
+    """
+    out_shape = (len(indexes), grid.height, grid.width)
+    window = _window(src, grid)
+    if window is not None:
+        inside = (
+            window.col_off >= 0
+            and window.row_off >= 0
+            and window.col_off + window.width <= src.width
+            and window.row_off + window.height <= src.height
+        )
+        data = src.read(
+            indexes,
+            window=window,
+            out_shape=out_shape,
+            resampling=Resampling.nearest,
+            boundless=not inside,
+            fill_value=src.nodata,
+        )
+        if src.nodata is not None:
+            valid = (data != src.nodata).any(axis=0)
+        else:
+            valid = src.dataset_mask(
+                window=window,
+                out_shape=out_shape[1:],
+                resampling=Resampling.nearest,
+                boundless=not inside,
+            ).astype(bool)
+    else:
+        with WarpedVRT(
+            src,
+            crs=grid.crs,
+            transform=grid.transform,
+            width=grid.width,
+            height=grid.height,
+            resampling=Resampling.nearest,
+        ) as vrt:
+            data = vrt.read(indexes)
+            valid = vrt.dataset_mask().astype(bool)
+
+    mask = np.where(np.logical_and(valid, grid.mask), 255, 0).astype(np.uint8)
+    return data, mask
@@ -7,8 +7,6 @@ from time import time
 import numpy as np
 import rasterio
 from shapely.geometry import shape
-from rasterio.windows import from_bounds
-from rasterio.warp import transform_geom
 from rasterio.crs import CRS
 from rio_tiler.utils import linear_rescale
 import pyproj
@@ -17,10 +15,12 @@ from shapely.ops import unary_union, transform
 from shapely.geometry import shape, mapping
 
 from rezoning_api.utils import read_dataset
-from rezoning_api.core.config import BUCKET, LCOE_MAX, IS_LOCAL_DEV, REZONING_LOCAL_DATA_PATH
-from rezoning_api.db.country import get_country_geojson, get_region_geojson, world
+from rezoning_api.core.config import LCOE_MAX
+from rezoning_api.db.country import get_country_geojson, get_region_geojson
+from rezoning_api.db.geometries import get_geometry_store
 from rezoning_api.models.zone import LCOE, Filters, Weights
 from rezoning_api.utils import (
+    get_aoi_grid,
     get_capacity_factor,
     get_distances,
     lcoe_generation,
@@ -28,18 +28,17 @@ from rezoning_api.utils import (
     lcoe_road,
     calc_score,
 )
-from rezoning_api.db.layers import get_layers
-
-from os.path import exists
+from rezoning_api.db.layers import get_layer_registry
 
 PLATE_CARREE = CRS.from_epsg(4326)
 
 
 def refresh_country_extrema(partial=False, offshore=False):
     """refresh the country minima and maxima per layer"""
-    layers = get_layers()
-    datasets = layers.keys()
-    for feature in world["features"]:
+    registry = get_layer_registry()
+    store = get_geometry_store()
+    for country_id in store.ids("countries"):
+        feature = store.entry("countries", country_id)
         f_key = feature["properties"]["GID_0"]
         fname = f"temp/{f_key}.json"
         if offshore:
@@ -60,19 +59,19 @@ def refresh_country_extrema(partial=False, offshore=False):
             continue
 
         extrema = dict()
-        for dataset in datasets:
+        for dataset, layers in registry.datasets.items():
             print(f"reading {dataset}")
             try:
                 ds, _ = read_dataset(
-                    f"s3://{BUCKET}/{dataset}.tif",
-                    layers[dataset],
+                    registry.url(dataset),
+                    layers,
                     x=None,
                     y=None,
                     z=None,
                     geometry=aoi,
                     max_size=1024,
                 )
-                for layer in layers[dataset]:
+                for layer in layers:
                     extrema[layer] = dict(
                         min=float(ds.sel(layer=layer).min()),
                         max=float(ds.sel(layer=layer).max()),
@@ -101,8 +100,11 @@ def single_country_lcoe(
 
     # spatial inputs
     print("getting spatial inputs")
-    ds, dr, _calc, mask = get_distances(filters, geometry=aoi)
-    cf = get_capacity_factor(lcoe.capacity_factor, lcoe.tlf, lcoe.af, geometry=aoi)
+    grid = get_aoi_grid(aoi)
+    ds, dr, _calc, mask = get_distances(filters, geometry=aoi, grid=grid)
+    cf = get_capacity_factor(
+        lcoe.capacity_factor, lcoe.tlf, lcoe.af, geometry=aoi, grid=grid
+    )
     print("capacity factor shape", cf.shape)
 
     # lcoe component calculation
@@ -118,27 +120,19 @@ def single_country_lcoe(
     lr = np.clip(lr, None, LCOE_MAX)
     lcoe_total = np.clip(lcoe_total, None, LCOE_MAX)
 
-    # match with filter for src profile
+    # match with filter for src profile, written on the area grid
     print("begin write out process")
-    match_data = f"s3://{BUCKET}/multiband/filter.tif"
-    if IS_LOCAL_DEV:
-        local_match_data = match_data.replace(f"s3://{BUCKET}/", REZONING_LOCAL_DATA_PATH)
-        if exists(local_match_data):
-            match_data = local_match_data
+    match_data = get_layer_registry().location("multiband/filter")
 
     with rasterio.open(match_data) as src:
-        g2 = transform_geom(PLATE_CARREE, src.crs, aoi)
-        bounds = shape(g2).bounds
-        window = from_bounds(*bounds, transform=src.transform)
-
         profile = src.profile
         profile.update(
             dtype=rasterio.float32,
             count=1,
             compress="deflate",
-            transform=src.window_transform(window),
-            height=window.height,
-            width=window.width,
+            transform=grid.transform,
+            height=grid.height,
+            width=grid.width,
         )
 
         data = lcoe_total.values.astype(np.float32)
@@ -169,31 +163,27 @@ def single_country_score(
     else:
         aoi = get_region_geojson(country_id, offshore=offshore).geometry.dict()
 
-    data, mask = calc_score(country_id, resource, lcoe, weights, filters, geometry=aoi)
+    grid = get_aoi_grid(aoi)
+    data, mask = calc_score(
+        country_id, resource, lcoe, weights, filters, geometry=aoi, grid=grid
+    )
 
     # normalize to 0-1
     data = linear_rescale(
         data, in_range=(data.min(), data.max()), out_range=(0, 1)
     ).astype(np.float32)
 
-    # match with filter for src profile
-    match_data = f"s3://{BUCKET}/multiband/filter.tif"
-    if IS_LOCAL_DEV:
-        local_match_data = match_data.replace(f"s3://{BUCKET}/", REZONING_LOCAL_DATA_PATH)
-        if exists(local_match_data):
-            match_data = local_match_data
+    # match with filter for src profile, written on the area grid
+    match_data = get_layer_registry().location("multiband/filter")
     with rasterio.open(match_data) as src:
-        g2 = transform_geom(PLATE_CARREE, src.crs, aoi)
-        bounds = shape(g2).bounds
-        window = from_bounds(*bounds, transform=src.transform)
         profile = src.profile
         profile.update(
             dtype=rasterio.float32,
             count=1,
             compress="deflate",
-            transform=src.window_transform(window),
-            height=window.height,
-            width=window.width,
+            transform=grid.transform,
+            height=grid.height,
+            width=grid.width,
         )
 
         # write out
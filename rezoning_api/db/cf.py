@@ -1,9 +1,11 @@
 """capacity factor function"""
 import json
+from functools import lru_cache
 
 
+@lru_cache(maxsize=None)
 def get_capacity_factor_options():
-    """get all available capacity factor choices per energy type"""
+    """get all available capacity factor choices per energy type, do not modify"""
     with open("rezoning_api/db/cf.json") as cf:
         capacity_factors = json.load(cf)
     return capacity_factors
@@ -1,25 +1,27 @@
 """functions for gathering data on countries"""
 from os import path as op
+from typing import Dict
+import copy
 import json
 import math
 from geojson_pydantic.features import Feature
-import boto3
-from shapely.ops import unary_union
 from shapely.geometry import shape, mapping
-from shapely import make_valid, simplify, normalize
+from shapely import simplify, normalize
 
 from rezoning_api.core.config import BUCKET
+from rezoning_api.core.lazy import LazyClient
+from rezoning_api.db.geometries import get_geometry_store
 
-with open(op.join(op.dirname(__file__), "countries.geojson"), "r") as f:
-    world = json.load(f)
+MINMAX_DIR = op.join(op.dirname(__file__), "api", "minmax")
 
-with open(op.join(op.dirname(__file__), "eez.geojson"), "r") as f:
-    eez = json.load(f)
+# parsed static files, filled on first use (or all at once by rezoning_api.preload)
+_minmax: Dict[str, dict] = {}
+_regions: Dict[str, dict] = {}
 
 
 # duplicated to prevent circular import
 # TODO: fix someday
-s3 = boto3.client("s3")
+s3 = LazyClient("s3")
 
 
 def s3_get(bucket: str, key: str, full_response=False, customClient=None):
@@ -38,30 +40,40 @@ def match_gsa_dailies(id):
 
 
 def get_country_geojson(id, offshore=False):
-    """get geojson for a single country or eez"""
-    vector_data = eez if offshore else world
-    key = "ISO_TER1" if offshore else "GID_0"
-
-    filtered = [
-        feature
-        for feature in vector_data["features"]
-        if feature["properties"][key].lower() == id.lower()
-    ]
+    """get geojson for a single country or eez (see db.geometries)"""
     try:
-        if offshore:
-            shapes = [shape(f["geometry"]) for f in filtered]
-            shapes = [make_valid(i) for i in shapes]
-            geom = unary_union(shapes)
-            feat = dict(properties={}, geometry=mapping(geom), type="Feature")
-            return Feature(**feat)
-        return Feature(**filtered[0])
+        return get_geometry_store().feature("eez" if offshore else "countries", id)
     except Exception:
         return None
 
+def load_json(cache: Dict[str, dict], name: str, path: str) -> dict:
+    """parse a static JSON file once, later calls return the parsed object"""
+    data = cache.get(name)
+    if data is None:
+        with open(path, "r") as f:
+            data = json.load(f)
+        cache[name] = data
+    return data
+
+
+def load_minmax(name: str) -> dict:
+    """minmax table of a country ({id} or {id}_offshore), do not modify"""
+    return load_json(_minmax, name, op.join(MINMAX_DIR, f"{name}.json"))
+
+
+def load_region(source_dir: str, id: str) -> dict:
+    """region (or region eez) feature, do not modify"""
+    return load_json(
+        _regions,
+        f"{source_dir}/{id}",
+        op.join(op.dirname(__file__), f"{source_dir}/{id}.geojson"),
+    )
+
+
 def get_region_geojson(id, offshore=False):
     """get geojson for a single region or eez"""
     source_dir = "regions_eez" if offshore else "regions"
-    region_json = json.load(open(op.join(op.dirname(__file__), f"{source_dir}/{id}.geojson"), "r"))
+    region_json = load_region(source_dir, id)
     geom = shape( region_json["geometry"] ).convex_hull
     feat = dict(properties=region_json["properties"], geometry=mapping(geom), type="Feature")
     return Feature(**feat)
@@ -72,22 +84,16 @@ def get_country_min_max(id, resource):
     if resource == "offshore":
         # fetch another JSON (there is probably a better way to handle this)
         try:
-            mm = open( f"rezoning_api/db/api/minmax/{id}_offshore.json" )
-            mm_obj = json.load(mm)
+            mm_obj = load_minmax(f"{id}_offshore")
         except Exception:
-            try:
-                mm = open( f"rezoning_api/db/api/minmax/{id}_offshore.json" )
-                mm_obj = json.load(mm)
-            except Exception:
-                mm = open( f"rezoning_api/db/api/minmax/AFG.json" )
-                mm_obj = json.load(mm)
+            mm_obj = load_minmax("AFG")
     else:
         try:
-            mm = open( f"rezoning_api/db/api/minmax/{id}.json" )
-            mm_obj = json.load(mm)
+            mm_obj = load_minmax(id)
         except Exception:
-            mm = open( f"rezoning_api/db/api/minmax/AFG.json" )
-            mm_obj = json.load(mm)
+            mm_obj = load_minmax("AFG")
+    # the tables are shared, adjust a copy
+    mm_obj = copy.deepcopy(mm_obj)
 
     # bathymetry data should never filter below -1000: https://github.com/developmentseed/rezoning-api/issues/91
     # don't display on land: https://github.com/developmentseed/rezoning-api/issues/103
@@ -117,7 +123,7 @@ def get_country_min_max(id, resource):
     return mm_obj
 
 def get_region_min_max(id, resource):
-    regions = json.load( open( f"rezoning_api/db/regions.json" ) )
+    regions = load_json(_regions, "regions", op.join(op.dirname(__file__), "regions.json"))
     mm_obj = dict()
     for reg in regions["regions"]:
         if reg["id"] == id:
@@ -0,0 +1,277 @@
+"""
+analysis cube: every layers.json layer co-registered in one quantized COG
+
+The cube is a single Web Mercator, tile aligned COG with one uint16 band per
+layer (band description = layer id, per-band scale/offset, 65535 = nodata).
+It is pixel interleaved, so one internal tile holds every layer of a 256 x 256
+chunk: the first read of a chunk (a single range request on S3, or a local
+read) fills GDAL's block cache for all layers and the other layers of the same
+tile are served from it. Tile reads use it when USE_CUBE is set (see
+utils.read_cube_tile).
+
+build: python -m rezoning_api.db.cube [--zoom 9] [--output DIR]
+"""
+import argparse
+import math
+import os
+import tempfile
+import threading
+from contextlib import ExitStack
+from time import time
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import rasterio
+from morecantile import tms as tile_matrix_sets
+from rasterio.shutil import copy
+from rasterio.vrt import WarpedVRT
+from rasterio.warp import calculate_default_transform, transform_bounds
+from rasterio.windows import Window
+from rio_tiler.io import COGReader
+
+from rezoning_api.core.blockcache import open_cog
+from rezoning_api.core.config import BUCKET, CUBE_KEY
+from rezoning_api.db.layers import get_layer_registry, resolve_location
+from rezoning_api.db.warp import COG_OPTIONS, source_location
+
+NODATA = 65535
+QMAX = NODATA - 1
+WEB_MERCATOR_TMS = tile_matrix_sets.get("WebMercatorQuad")
+
+_readers = threading.local()
+
+
+def cube_location() -> str:
+    """location of the analysis cube"""
+    return resolve_location(f"s3://{BUCKET}/{CUBE_KEY}")
+
+
+def open_cube() -> COGReader:
+    """
+    per thread, long lived reader of the analysis cube; keeping the dataset open
+    keeps its blocks in GDAL's cache between reads of different layers
+    """
+    cog = getattr(_readers, "cube", None)
+    if cog is None:
+        # never closed, the reader lives as long as the thread
+        _readers.stack = ExitStack()
+        cog = _readers.stack.enter_context(open_cog(cube_location()))
+        _readers.cube = cog
+    return cog
+
+
+def cube_bands(cog: COGReader) -> Dict[str, int]:
+    """layer id -> band index of the analysis cube"""
+    bands = getattr(cog, "_cube_bands", None)
+    if bands is None:
+        bands = {
+            name: idx
+            for idx, name in enumerate(cog.dataset.descriptions, start=1)
+            if name
+        }
+        cog._cube_bands = bands
+    return bands
+
+
+def cube_indexes(cog: COGReader, layers: List[str]) -> List[int]:
+    """band indexes of the analysis cube for a list of layer ids"""
+    bands = cube_bands(cog)
+    return [bands[layer] for layer in layers]
+
+
+def dequantize(cog: COGReader, data: np.ndarray, indexes: List[int]) -> np.ndarray:
+    """convert quantized cube values of the given bands to float32 layer values"""
+    scales = np.array([cog.dataset.scales[i - 1] for i in indexes], dtype=np.float32)
+    offsets = np.array([cog.dataset.offsets[i - 1] for i in indexes], dtype=np.float32)
+    return data.astype(np.float32) * scales[:, None, None] + offsets[:, None, None]
+
+
+def quantization(
+    dtype: str, minimum: float, maximum: float
+) -> Tuple[float, float]:
+    """
+    (scale, offset) mapping [minimum, maximum] onto 0..65534: integer layers
+    with a small enough range are stored exactly, others linearly
+    """
+    if np.issubdtype(np.dtype(dtype), np.integer) and maximum - minimum <= QMAX:
+        return 1.0, float(minimum)
+    if maximum <= minimum:
+        return 1.0, float(minimum)
+    return (maximum - minimum) / QMAX, float(minimum)
+
+
+def quantize(data: np.ma.MaskedArray, scale: float, offset: float) -> np.ndarray:
+    """quantize a masked array to uint16, masked pixels become NODATA"""
+    values = np.clip(np.round((data.filled(offset) - offset) / scale), 0, QMAX)
+    return np.where(np.ma.getmaskarray(data), NODATA, values).astype(np.uint16)
+
+
+def _cube_grid(sources: Dict[str, rasterio.io.DatasetReader], zoom: Optional[int]):
+    """Web Mercator transform/shape covering all sources, snapped to the tile grid"""
+    crs = WEB_MERCATOR_TMS.rasterio_crs
+    bounds = []
+    resolutions = []
+    for src in sources.values():
+        bounds.append(transform_bounds(src.crs, crs, *src.bounds, densify_pts=21))
+        transform, _, _ = calculate_default_transform(
+            src.crs, crs, src.width, src.height, *src.bounds
+        )
+        resolutions.append(transform.a)
+
+    if zoom is None:
+        zoom = WEB_MERCATOR_TMS.zoom_for_res(
+            min(resolutions), zoom_level_strategy="upper"
+        )
+
+    matrix = WEB_MERCATOR_TMS.matrix(zoom)
+    tile_span = (
+        WEB_MERCATOR_TMS.xy_bbox.right - WEB_MERCATOR_TMS.xy_bbox.left
+    ) / matrix.matrixWidth
+    origin_x, origin_y = WEB_MERCATOR_TMS.xy_bbox.left, WEB_MERCATOR_TMS.xy_bbox.top
+    left = max(min(b[0] for b in bounds), WEB_MERCATOR_TMS.xy_bbox.left)
+    bottom = max(min(b[1] for b in bounds), WEB_MERCATOR_TMS.xy_bbox.bottom)
+    right = min(max(b[2] for b in bounds), WEB_MERCATOR_TMS.xy_bbox.right)
+    top = min(max(b[3] for b in bounds), WEB_MERCATOR_TMS.xy_bbox.top)
+
+    col0 = math.floor((left - origin_x) / tile_span)
+    col1 = math.ceil((right - origin_x) / tile_span)
+    row0 = math.floor((origin_y - top) / tile_span)
+    row1 = math.ceil((origin_y - bottom) / tile_span)
+
+    res = tile_span / matrix.tileWidth
+    transform = rasterio.Affine(
+        res, 0, origin_x + col0 * tile_span, 0, -res, origin_y - row0 * tile_span
+    )
+    width = (col1 - col0) * matrix.tileWidth
+    height = (row1 - row0) * matrix.tileHeight
+    return zoom, transform, width, height
+
+
+def build_cube(output=None, zoom=None, layers=None, chunk=1024):
+    """
+    warp, quantize and stack every (or the given) layer into the analysis cube,
+    written to `output` (a local directory) or uploaded to CUBE_KEY in BUCKET
+    """
+    t1 = time()
+    registry = get_layer_registry()
+    datasets = {
+        dataset: [layer for layer in ids if not layers or layer in layers]
+        for dataset, ids in registry.datasets.items()
+    }
+    datasets = {dataset: ids for dataset, ids in datasets.items() if ids}
+    sources = {dataset: rasterio.open(source_location(dataset)) for dataset in datasets}
+
+    zoom, transform, width, height = _cube_grid(sources, zoom)
+    print(f"cube grid: zoom {zoom}, {width} x {height} pixels")
+
+    bands = []
+    for dataset, ids in datasets.items():
+        src = sources[dataset]
+        for layer in ids:
+            bidx = registry.layers[layer].index + 1
+            stats = src.statistics(bidx)
+            scale, offset = quantization(src.dtypes[bidx - 1], stats.min, stats.max)
+            bands.append((dataset, bidx, layer, scale, offset))
+
+    profile = dict(
+        driver="GTiff",
+        dtype="uint16",
+        count=len(bands),
+        width=width,
+        height=height,
+        crs=WEB_MERCATOR_TMS.rasterio_crs,
+        transform=transform,
+        nodata=NODATA,
+        tiled=True,
+        blockxsize=256,
+        blockysize=256,
+        interleave="pixel",
+        compress="deflate",
+        predictor=2,
+        bigtiff="yes",
+    )
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        stacked = os.path.join(tmpdir, "stacked.tif")
+        with rasterio.open(stacked, "w", **profile) as dst:
+            dst.descriptions = tuple(layer for _, _, layer, _, _ in bands)
+            dst.scales = tuple(scale for *_, scale, _ in bands)
+            dst.offsets = tuple(offset for *_, offset in bands)
+
+            vrts = {
+                dataset: WarpedVRT(
+                    src,
+                    crs=profile["crs"],
+                    transform=transform,
+                    width=width,
+                    height=height,
+                    resampling=rasterio.enums.Resampling.nearest,
+                )
+                for dataset, src in sources.items()
+            }
+            for row in range(0, height, chunk):
+                for col in range(0, width, chunk):
+                    window = Window(
+                        col, row, min(chunk, width - col), min(chunk, height - row)
+                    )
+                    out = np.full(
+                        (len(bands), window.height, window.width), NODATA, np.uint16
+                    )
+                    for dataset, vrt in vrts.items():
+                        indexes = [b for d, b, *_ in bands if d == dataset]
+                        data = vrt.read(indexes, window=window, masked=True)
+                        for i, (d, bidx, _, scale, offset) in enumerate(bands):
+                            if d == dataset:
+                                out[i] = quantize(
+                                    data[indexes.index(bidx)], scale, offset
+                                )
+                    dst.write(out, window=window)
+            for vrt in vrts.values():
+                vrt.close()
+
+        for src in sources.values():
+            src.close()
+
+        options = dict(COG_OPTIONS, ZOOM_LEVEL=zoom, BIGTIFF="YES")
+        options.pop("ZOOM_LEVEL_STRATEGY")
+        cube = os.path.join(tmpdir, "cube.tif")
+        copy(
+            stacked,
+            cube,
+            RESAMPLING="NEAREST",
+            OVERVIEW_RESAMPLING="NEAREST",
+            **options,
+        )
+
+        if output:
+            dst_path = os.path.join(output, CUBE_KEY)
+            os.makedirs(os.path.dirname(dst_path), exist_ok=True)
+            os.replace(cube, dst_path)
+        else:
+            import boto3
+
+            boto3.client("s3").upload_file(cube, BUCKET, CUBE_KEY)
+            dst_path = f"s3://{BUCKET}/{CUBE_KEY}"
+
+    print(f"{len(bands)} layers -> {dst_path}, elapsed: {time() - t1:.1f} seconds")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        "--zoom",
+        type=int,
+        help="zoom level of the full resolution cube, from the finest source by default",
+    )
+    parser.add_argument(
+        "--layer",
+        action="append",
+        dest="layers",
+        help="layer id to include (repeatable), all layers by default",
+    )
+    parser.add_argument(
+        "--output",
+        help="local data directory to write to instead of uploading to the bucket",
+    )
+    args = parser.parse_args()
+    build_cube(args.output, args.zoom, args.layers)
@@ -0,0 +1,188 @@
+"""
+compact, lazily decoded store of the country and eez geometries
+
+The store is a single file built from countries.geojson and eez.geojson:
+
+    MAGIC | index length (uint32, big endian) | index (JSON) | WKB geometries
+
+The index maps, per kind ("countries" keyed by GID_0, "eez" keyed by
+ISO_TER1, lower case), an id to the offset and length of its WKB geometry,
+its bounding box and its properties. eez features of the same territory are
+made valid and merged at build time. At runtime only the index is read, a
+geometry is decoded the first time it is requested.
+
+build: python -m rezoning_api.db.geometries [--output PATH]
+"""
+import argparse
+import json
+import struct
+import threading
+from os import path as op
+from time import time
+from typing import Dict, List, Optional, Tuple
+
+from geojson_pydantic.features import Feature
+from shapely import make_valid, wkb
+from shapely.geometry import mapping, shape
+from shapely.ops import unary_union
+
+DB_DIR = op.dirname(__file__)
+STORE_PATH = op.join(DB_DIR, "geometries.bin")
+COUNTRIES_PATH = op.join(DB_DIR, "countries.geojson")
+EEZ_PATH = op.join(DB_DIR, "eez.geojson")
+
+MAGIC = b"RZGEOM1\n"
+_HEADER = struct.Struct(">I")
+
+
+def _collect(countries_path: str, eez_path: str) -> Dict[str, Dict[str, Tuple]]:
+    """(geometry, properties) per kind and id from the source geojsons"""
+    collected: Dict[str, Dict[str, Tuple]] = dict(countries={}, eez={})
+
+    with open(countries_path, "r") as f:
+        world = json.load(f)
+    for feature in world["features"]:
+        key = feature["properties"]["GID_0"].lower()
+        # the first feature of a country wins
+        if key not in collected["countries"]:
+            collected["countries"][key] = (
+                shape(feature["geometry"]),
+                feature["properties"],
+            )
+
+    with open(eez_path, "r") as f:
+        eez = json.load(f)
+    territories: Dict[str, List] = {}
+    for feature in eez["features"]:
+        key = feature["properties"]["ISO_TER1"]
+        if key is None:
+            continue
+        territories.setdefault(key.lower(), []).append(
+            make_valid(shape(feature["geometry"]))
+        )
+    for key, shapes in territories.items():
+        collected["eez"][key] = (unary_union(shapes), {})
+
+    return collected
+
+
+def build_store(countries_path: str = COUNTRIES_PATH, eez_path: str = EEZ_PATH) -> bytes:
+    """the geometry store for the given source geojsons"""
+    index: Dict[str, Dict[str, dict]] = {}
+    payloads = []
+    offset = 0
+    for kind, features in _collect(countries_path, eez_path).items():
+        index[kind] = {}
+        for key, (geometry, properties) in features.items():
+            data = wkb.dumps(geometry)
+            index[kind][key] = dict(
+                offset=offset,
+                length=len(data),
+                bbox=list(geometry.bounds),
+                properties=properties,
+            )
+            payloads.append(data)
+            offset += len(data)
+
+    header = json.dumps(index, separators=(",", ":")).encode()
+    return MAGIC + _HEADER.pack(len(header)) + header + b"".join(payloads)
+
+
+class GeometryStore:
+    """read access to a geometry store, features are decoded on first use"""
+
+    def __init__(self, path: str = STORE_PATH, data: Optional[bytes] = None):
+        """Init store from a file, or from in-memory store bytes."""
+        self.path = path
+        self._data = data
+        self._index: Optional[Dict[str, Dict[str, dict]]] = None
+        self._start = 0
+        self._features: Dict[Tuple[str, str], Feature] = {}
+        self._lock = threading.Lock()
+
+    def _read(self, offset: int, length: int) -> bytes:
+        """bytes of the store"""
+        if self._data is not None:
+            return self._data[offset : offset + length]
+        with open(self.path, "rb") as f:
+            f.seek(offset)
+            return f.read(length)
+
+    def index(self) -> Dict[str, Dict[str, dict]]:
+        """the store index, read once"""
+        if self._index is None:
+            with self._lock:
+                if self._index is None:
+                    head = self._read(0, len(MAGIC) + _HEADER.size)
+                    if head[: len(MAGIC)] != MAGIC:
+                        raise ValueError(f"{self.path} is not a geometry store")
+                    (length,) = _HEADER.unpack(head[len(MAGIC) :])
+                    self._start = len(head) + length
+                    self._index = json.loads(self._read(len(head), length))
+        return self._index
+
+    def ids(self, kind: str) -> List[str]:
+        """ids (lower case) of a kind"""
+        return list(self.index()[kind].keys())
+
+    def entry(self, kind: str, id: str) -> Optional[dict]:
+        """index entry (offset, length, bbox, properties) of a feature"""
+        return self.index()[kind].get(id.lower())
+
+    def bbox(self, kind: str, id: str) -> Optional[List[float]]:
+        """bounding box of a feature, without decoding it"""
+        entry = self.entry(kind, id)
+        return None if entry is None else entry["bbox"]
+
+    def feature(self, kind: str, id: str) -> Optional[Feature]:
+        """the feature of an id, None if unknown"""
+        key = (kind, id.lower())
+        feature = self._features.get(key)
+        if feature is None:
+            entry = self.entry(kind, id)
+            if entry is None:
+                return None
+            geometry = wkb.loads(
+                self._read(self._start + entry["offset"], entry["length"])
+            )
+            feature = Feature(
+                type="Feature",
+                properties=entry["properties"],
+                geometry=mapping(geometry),
+            )
+            self._features[key] = feature
+        return feature
+
+
+_store: Optional[GeometryStore] = None
+_store_lock = threading.Lock()
+
+
+def get_geometry_store() -> GeometryStore:
+    """
+    the process wide geometry store: the built store file, or one built in
+    memory from the source geojsons when it does not exist (local development)
+    """
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                if op.exists(STORE_PATH):
+                    _store = GeometryStore(STORE_PATH)
+                else:
+                    _store = GeometryStore(STORE_PATH, data=build_store())
+    return _store
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--countries", default=COUNTRIES_PATH, help="countries geojson")
+    parser.add_argument("--eez", default=EEZ_PATH, help="eez geojson")
+    parser.add_argument("--output", default=STORE_PATH, help="store file to write")
+    args = parser.parse_args()
+
+    t1 = time()
+    store = build_store(args.countries, args.eez)
+    with open(args.output, "wb") as f:
+        f.write(store)
+    print(f"{len(store)} bytes -> {args.output}, elapsed: {time() - t1:.1f} seconds")
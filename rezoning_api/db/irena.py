@@ -2,15 +2,22 @@
 import os
 from os import path as op
 import json
-import requests
+from functools import lru_cache
 
-# on startup, load pre-fetched IRENA data
-with open(op.join(op.dirname(__file__), "irena.json"), "r") as f:
-    irena_data = json.load(f)
+IRENA_PATH = op.join(op.dirname(__file__), "irena.json")
+
+
+@lru_cache(maxsize=None)
+def load_irena_data():
+    """pre-fetched IRENA data, loaded on first use"""
+    with open(IRENA_PATH, "r") as f:
+        return json.load(f)
 
 
 def request_irena_data(resource, records=[], offset=""):
     """helper for fetching data + pagination"""
+    import requests
+
     headers = {"Authorization": f"Bearer {os.environ['AIRTABLE_KEY']}"}
     AIRTABLE_URL = (
         f"https://api.airtable.com/v0/appU0YP4QVGcBpiLU/{resource}?offset={offset}"
@@ -49,7 +56,7 @@ def fetch_irena_data():
 def get_irena_defaults(resource: str, country: str):
     """return relevant defaults for a given country and resource """
     try:
-        match = irena_data[resource][country]
+        match = load_irena_data()[resource][country]
         return dict(
             cg=match["cg"],
             omfg=match["omfg"],
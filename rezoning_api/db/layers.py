@@ -1,9 +1,125 @@
 """layer functions"""
 import json
+import threading
 from os import path as op
+from os.path import exists
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from rezoning_api.core.config import (
+    BUCKET,
+    IS_LOCAL_DEV,
+    MERCATOR_PREFIX,
+    REZONING_LOCAL_DATA_PATH,
+    USE_MERCATOR_COPIES,
+)
+from rezoning_api.db.country import match_gsa_dailies
+
 
 def get_layers():
     """get saved layer json"""
     with open(op.join(op.dirname(__file__), "layers.json"), "r") as lf:
         layers = json.load(lf)
     return layers
+
+
+def tile_location(dataset: str) -> str:
+    """
+    location of the dataset used for tile reads: the Web Mercator, tile aligned
+    copy (see db.warp) when USE_MERCATOR_COPIES is set, the original otherwise
+    """
+    if USE_MERCATOR_COPIES:
+        return dataset.replace(f"s3://{BUCKET}/", f"s3://{BUCKET}/{MERCATOR_PREFIX}/")
+    return dataset
+
+
+_resolved: Dict[str, str] = {}
+
+
+def resolve_location(loc: str) -> str:
+    """the local copy of an s3:// location in local development, if it exists"""
+    if not IS_LOCAL_DEV:
+        return loc
+    resolved = _resolved.get(loc)
+    if resolved is None:
+        local_loc = loc.replace(f"s3://{BUCKET}/", REZONING_LOCAL_DATA_PATH)
+        resolved = local_loc if exists(local_loc) else loc
+        _resolved[loc] = resolved
+    return resolved
+
+
+class Layer(NamedTuple):
+    """a layer: one band of a dataset"""
+
+    id: str
+    # layers.json key
+    dataset: str
+    # band index in the dataset, 0 based
+    index: int
+    # GSA layers hold daily values, shown as annual values
+    daily: bool
+
+
+class LayerRegistry:
+    """layer and dataset lookups over layers.json"""
+
+    def __init__(self, datasets: Dict[str, List[str]]):
+        """Init registry from layers.json content (dataset -> band layer ids)."""
+        self.datasets = datasets
+        self.layers: Dict[str, Layer] = {}
+        for dataset, ids in datasets.items():
+            for index, id in enumerate(ids):
+                self.layers.setdefault(
+                    id, Layer(id, dataset, index, match_gsa_dailies(id))
+                )
+
+    @property
+    def ids(self) -> List[str]:
+        """every layer id, in layers.json order"""
+        return list(self.layers.keys())
+
+    def get(self, id: str) -> Optional[Layer]:
+        """a layer, None if unknown"""
+        return self.layers.get(id)
+
+    def bands(self, dataset: str) -> List[str]:
+        """layer ids of a dataset's bands, in band order"""
+        return self.datasets[dataset]
+
+    def datasets_for(self, ids: Iterable[str]) -> List[str]:
+        """datasets holding any of the layers, in layers.json order"""
+        wanted = {self.layers[id].dataset for id in ids if id in self.layers}
+        return [dataset for dataset in self.datasets if dataset in wanted]
+
+    def url(self, dataset: str) -> str:
+        """s3:// location of a dataset"""
+        return f"s3://{BUCKET}/{dataset}.tif"
+
+    def location(self, dataset: str, tiles: bool = False) -> str:
+        """resolved location of a dataset, of its tile copy with tiles=True"""
+        loc = self.url(dataset)
+        return resolve_location(tile_location(loc) if tiles else loc)
+
+    def vrt_key(self, dataset: str) -> str:
+        """S3 key of the VRT holding a dataset's band statistics"""
+        return f"{dataset}.tif".replace("tif", "vrt")
+
+    def location_of(self, id: str) -> Tuple[Optional[str], Optional[int]]:
+        """s3:// location of a layer's dataset and its band index"""
+        layer = self.layers.get(id)
+        if layer is None:
+            return (None, None)
+        return (self.url(layer.dataset), layer.index)
+
+
+_registry: Optional[LayerRegistry] = None
+_registry_lock = threading.Lock()
+
+
+def get_layer_registry() -> LayerRegistry:
+    """the process wide layer registry"""
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                _registry = LayerRegistry(get_layers())
+    return _registry
@@ -0,0 +1,96 @@
+"""
+build Web Mercator, tile aligned COG copies of the layers.json datasets
+
+Tile reads (see db.layers.tile_location / utils.read_tile) use these copies when
+USE_MERCATOR_COPIES is set: their internal tiles and overviews follow the XYZ
+grid (GoogleMapsCompatible tiling scheme), so a tile is one aligned block read
+instead of a warped VRT over the geographic original.
+
+usage: python -m rezoning_api.db.warp [--dataset multiband/calc ...] [--output DIR]
+"""
+import argparse
+import os
+import tempfile
+from time import time
+
+import boto3
+import rasterio
+from rasterio.shutil import copy
+
+from rezoning_api.core.config import BUCKET, MERCATOR_PREFIX
+from rezoning_api.db.layers import get_layer_registry
+
+COG_OPTIONS = dict(
+    driver="COG",
+    TILING_SCHEME="GoogleMapsCompatible",
+    BLOCKSIZE=256,
+    # the zoom level whose resolution is just finer than the source, so no
+    # information is lost
+    ZOOM_LEVEL_STRATEGY="UPPER",
+    COMPRESS="DEFLATE",
+    PREDICTOR="YES",
+    BIGTIFF="IF_SAFER",
+    NUM_THREADS="ALL_CPUS",
+)
+
+
+def source_location(dataset: str) -> str:
+    """location of the geographic original of a dataset"""
+    return get_layer_registry().location(dataset)
+
+
+def warp_dataset(src_path: str, dst_path: str, resampling: str = "nearest"):
+    """write a GoogleMapsCompatible COG copy of src_path to a local dst_path"""
+    with rasterio.open(src_path) as src:
+        copy(
+            src,
+            dst_path,
+            RESAMPLING=resampling.upper(),
+            OVERVIEW_RESAMPLING=resampling.upper(),
+            **COG_OPTIONS,
+        )
+
+
+def build_mercator_copies(datasets=None, output=None, resampling="nearest"):
+    """
+    warp every (or the given) layers.json dataset to a Web Mercator COG, written
+    to `output` (a local directory) or uploaded under MERCATOR_PREFIX in BUCKET
+    """
+    datasets = datasets or list(get_layer_registry().datasets)
+    s3 = None if output else boto3.client("s3")
+    for dataset in datasets:
+        t1 = time()
+        src_path = source_location(dataset)
+        if output:
+            dst_path = os.path.join(output, MERCATOR_PREFIX, f"{dataset}.tif")
+            os.makedirs(os.path.dirname(dst_path), exist_ok=True)
+            warp_dataset(src_path, dst_path, resampling)
+        else:
+            with tempfile.TemporaryDirectory() as tmpdir:
+                dst_path = os.path.join(tmpdir, "warped.tif")
+                warp_dataset(src_path, dst_path, resampling)
+                key = f"{MERCATOR_PREFIX}/{dataset}.tif"
+                s3.upload_file(dst_path, BUCKET, key)
+                dst_path = f"s3://{BUCKET}/{key}"
+        print(f"{src_path} -> {dst_path}, elapsed: {time() - t1:.1f} seconds")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        "--dataset",
+        action="append",
+        dest="datasets",
+        help="layers.json dataset key (repeatable), all datasets by default",
+    )
+    parser.add_argument(
+        "--output",
+        help="local data directory to write to instead of uploading to the bucket",
+    )
+    parser.add_argument(
+        "--resampling",
+        default="nearest",
+        help="GDAL resampling for the warp and overviews (default: nearest)",
+    )
+    args = parser.parse_args()
+    build_mercator_copies(args.datasets, args.output, args.resampling)
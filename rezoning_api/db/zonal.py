@@ -0,0 +1,453 @@
+"""
+streaming zone statistics
+
+calc_score over a whole area holds every layer of the area in memory at full
+resolution. The zone endpoint instead scores the area grid block by block (see
+AOIGrid.blocks) and adds each block to a ZoneAccumulator, which only keeps
+sums, counts and extrema: memory use depends on the block size, not on the
+size of the area.
+
+Blocks are scored concurrently on the zone executor (see core.aio): every
+worker reads and reduces its own block into a partial accumulator, partial
+accumulators are merged in block order so results do not depend on
+scheduling. Workers are threads in the same process, nothing is copied
+between them.
+
+Layers without a country min or max are scaled by the min or max of the
+whole window (pixels without data count as 0). Scaling is affine, so
+calc_score leaves them out of the block scores (window_scale) and a
+WindowScaled keeps the sums of their values and the extrema of the window:
+they are scaled once every block was seen, without a second read.
+
+A LabelAccumulator computes the statistics of many zones in one pass over
+the blocks of a label grid (see aoi.label_grid): every block is scored once
+and reduced per zone with bincount.
+"""
+import math
+from functools import partial
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+import numpy.ma as ma
+
+from rezoning_api.core.aio import gather
+from rezoning_api.core.config import ZONE_BLOCK_SIZE
+from rezoning_api.db.aoi import AOIGrid
+from rezoning_api.utils import scale
+
+
+class Mean:
+    """running mean of the unmasked values of masked arrays"""
+
+    def __init__(self, sum: float = 0.0, count: int = 0):
+        """Init mean from a sum and count of values."""
+        self.sum = sum
+        self.count = count
+
+    def add(self, arr: ma.MaskedArray):
+        """add the unmasked values of an array"""
+        count = int(arr.count())
+        if count:
+            self.sum += float(arr.sum(dtype=np.float64))
+            self.count += count
+
+    def merge(self, other: "Mean"):
+        """add the values of another mean"""
+        self.sum += other.sum
+        self.count += other.count
+
+    @property
+    def value(self) -> Optional[float]:
+        """the mean, None without values"""
+        return self.sum / self.count if self.count else None
+
+
+class WindowScaled:
+    """a criterion scaled by the min or max of the window, accumulated over blocks"""
+
+    def __init__(self, scaled: dict):
+        """Init from calc_score's window_scaled entry of the criterion."""
+        self.weight = scaled["weight"]
+        self.score_weight = scaled["score_weight"]
+        self.flip = scaled["flip"]
+        self.scale_min = scaled["min"]
+        self.scale_max = scaled["max"]
+        # values over the scored pixels, and over the mask
+        self.score = Mean()
+        self.contribution = Mean()
+        # extrema of the window pixels with data, and their number
+        self.min = math.inf
+        self.max = -math.inf
+        self.valid = 0
+
+    def add(self, scaled: dict, mask: np.ndarray, scored: np.ndarray):
+        """add a block: the criterion values, the mask and the scored pixels"""
+        values = scaled["values"]
+        valid = ~np.isnan(values)
+        count = int(valid.sum())
+        if count:
+            self.valid += count
+            self.min = min(self.min, float(values[valid].min()))
+            self.max = max(self.max, float(values[valid].max()))
+
+        values = np.nan_to_num(values, nan=0)
+        self.score.add(ma.masked_array(values, ~scored))
+        self.contribution.add(ma.masked_array(values, ~mask))
+
+    def merge(self, other: "WindowScaled"):
+        """add the blocks of another accumulator"""
+        self.score.merge(other.score)
+        self.contribution.merge(other.contribution)
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self.valid += other.valid
+
+    def bounds(self, window_pixels: int) -> Tuple[float, float]:
+        """country min and max, the window's in place of missing (0) ones"""
+        low, high = self.min, self.max
+        if self.valid < window_pixels:
+            # window pixels without data are scaled as 0
+            low, high = min(low, 0.0), max(high, 0.0)
+        return self.scale_min or low, self.scale_max or high
+
+    def scaled(self, mean: Mean, window_pixels: int) -> Optional[float]:
+        """the scaled mean of values"""
+        if mean.value is None:
+            return None
+        low, high = self.bounds(window_pixels)
+        return float(scale(mean.value, low, high, flip=self.flip))
+
+
+class ZoneAccumulator:
+    """zone statistics accumulated over blocks of an area"""
+
+    def __init__(self, window_pixels: int = 0):
+        """Init empty statistics, for an area with a window of window_pixels."""
+        self.window_pixels = window_pixels
+        self.pixels = 0
+        self.score = Mean()
+        self.lcoe = Mean()
+        self.cf = Mean()
+        self.lcoe_min = math.inf
+        self.lcoe_max = -math.inf
+        self.criterion_average: Dict[str, Mean] = {}
+        self.criterion_contribution: Dict[str, Mean] = {}
+        self.window_scaled: Dict[str, WindowScaled] = {}
+
+    def add(self, score, mask: np.ndarray, extras: dict):
+        """add a block: calc_score(..., ret_extras=True) output"""
+        outside = ~mask
+        self.pixels += int(mask.sum())
+        score = ma.masked_array(score, outside)
+        self.score.add(score)
+        self.cf.add(ma.masked_array(extras["cf"], outside))
+
+        lcoe = ma.masked_array(extras["lcoe"], outside)
+        if lcoe.count():
+            self.lcoe.add(lcoe)
+            self.lcoe_min = min(self.lcoe_min, float(lcoe.min()))
+            self.lcoe_max = max(self.lcoe_max, float(lcoe.max()))
+
+        for name, arr in extras["criterion_average"].items():
+            self.criterion_average.setdefault(name, Mean()).add(arr)
+        for name, arr in extras["criterion_contribution"].items():
+            self.criterion_contribution.setdefault(name, Mean()).add(arr)
+
+        scored = ~ma.getmaskarray(score)
+        for name, scaled in extras.get("window_scaled", {}).items():
+            self.window_scaled.setdefault(name, WindowScaled(scaled)).add(
+                scaled, mask, scored
+            )
+
+    def merge(self, other: "ZoneAccumulator"):
+        """add the blocks of another accumulator"""
+        self.pixels += other.pixels
+        self.score.merge(other.score)
+        self.lcoe.merge(other.lcoe)
+        self.cf.merge(other.cf)
+        self.lcoe_min = min(self.lcoe_min, other.lcoe_min)
+        self.lcoe_max = max(self.lcoe_max, other.lcoe_max)
+        for name, mean in other.criterion_average.items():
+            self.criterion_average.setdefault(name, Mean()).merge(mean)
+        for name, mean in other.criterion_contribution.items():
+            self.criterion_contribution.setdefault(name, Mean()).merge(mean)
+        for name, scaled in other.window_scaled.items():
+            if name in self.window_scaled:
+                self.window_scaled[name].merge(scaled)
+            else:
+                self.window_scaled[name] = scaled
+
+    def stats(self, landuse: float) -> Optional[dict]:
+        """
+        the zone endpoint response fields for a land use (MW / km2), None when
+        nothing is left after filtering
+        """
+        lcoe = self.lcoe.value
+        if not lcoe:
+            return None
+
+        # zone score
+        zs = self.score.value
+        if zs is not None:
+            for scaled in self.window_scaled.values():
+                zs += scaled.score_weight * scaled.scaled(
+                    scaled.score, self.window_pixels
+                )
+        zs = 0.0 if zs is None else zs
+        zs = 0.00001 if np.isnan(zs) else zs
+
+        # suitable area
+        suitable_area = self.pixels * (500 ** 2)
+
+        # installed capacity potential
+        # filtered by suitable area, landuse is /km2
+        icp = landuse * suitable_area / 1000000
+
+        # annual energy generation potential (divide by 1000 for GWh)
+        cf = self.cf.value or 0.0
+        generation_potential = icp * cf * 8760 / 1000
+
+        return dict(
+            lcoe=lcoe,
+            zone_score=zs,
+            generation_potential=generation_potential,
+            icp=float(icp),
+            cf=cf,
+            # area is m2, ratio is /km2
+            zone_output_density=generation_potential / suitable_area * 1000000,
+            suitable_area=float(suitable_area),
+            criterion_average={
+                name: mean.value or 0.0 for name, mean in self.criterion_average.items()
+            },
+            criterion_contribution={
+                name: self._contribution(name) or 0.0
+                for name in self.criterion_average
+            },
+            lcoe_min=self.lcoe_min,
+            lcoe_max=self.lcoe_max,
+        )
+
+    def _contribution(self, name: str) -> Optional[float]:
+        """mean weighted scaled value of a criterion"""
+        if name in self.window_scaled:
+            scaled = self.window_scaled[name]
+            value = scaled.scaled(scaled.contribution, self.window_pixels)
+            return None if value is None else scaled.weight * value
+        mean = self.criterion_contribution.get(name)
+        return None if mean is None else mean.value
+
+
+class Means:
+    """running means of the unmasked values of masked arrays, per label"""
+
+    def __init__(self, size: int):
+        """Init empty means for labels 0 to size - 1."""
+        self.sum = np.zeros(size)
+        self.count = np.zeros(size, dtype=np.int64)
+
+    def add(self, labels: np.ndarray, arr: ma.MaskedArray):
+        """add the unmasked values of an array, by label"""
+        valid = ~ma.getmaskarray(arr)
+        labels = labels[valid]
+        size = len(self.sum)
+        self.sum += np.bincount(labels, ma.getdata(arr)[valid], minlength=size)
+        self.count += np.bincount(labels, minlength=size)
+
+    def merge(self, other: "Means"):
+        """add the values of other means"""
+        self.sum += other.sum
+        self.count += other.count
+
+    def mean(self, label: int) -> Mean:
+        """the mean of a label"""
+        return Mean(float(self.sum[label]), int(self.count[label]))
+
+
+class LabelWindowScaled:
+    """a WindowScaled criterion per label, each zone scaled by its own window"""
+
+    def __init__(self, scaled: dict, size: int):
+        """Init from calc_score's window_scaled entry, for labels 0 to size - 1."""
+        self.params = {key: value for key, value in scaled.items() if key != "values"}
+        self.score = Means(size)
+        self.contribution = Means(size)
+        self.min = np.full(size, math.inf)
+        self.max = np.full(size, -math.inf)
+        self.valid = np.zeros(size, dtype=np.int64)
+
+    def add(self, layer: np.ndarray, scaled: dict, mask: np.ndarray, scored: np.ndarray):
+        """add a label layer of a block, see WindowScaled.add"""
+        values = scaled["values"]
+        valid = ~np.isnan(values)
+        labels = layer[valid]
+        self.valid += np.bincount(labels, minlength=len(self.valid))
+        np.minimum.at(self.min, labels, values[valid])
+        np.maximum.at(self.max, labels, values[valid])
+
+        values = np.nan_to_num(values, nan=0)
+        self.score.add(layer, ma.masked_array(values, ~scored))
+        self.contribution.add(layer, ma.masked_array(values, ~mask))
+
+    def merge(self, other: "LabelWindowScaled"):
+        """add the blocks of another accumulator"""
+        self.score.merge(other.score)
+        self.contribution.merge(other.contribution)
+        np.minimum(self.min, other.min, out=self.min)
+        np.maximum(self.max, other.max, out=self.max)
+        self.valid += other.valid
+
+    def zone(self, label: int) -> WindowScaled:
+        """the criterion of one zone"""
+        scaled = WindowScaled(self.params)
+        scaled.score = self.score.mean(label)
+        scaled.contribution = self.contribution.mean(label)
+        scaled.min = float(self.min[label])
+        scaled.max = float(self.max[label])
+        scaled.valid = int(self.valid[label])
+        return scaled
+
+
+class LabelAccumulator:
+    """statistics of zones 1 to zones of a label grid, accumulated over blocks"""
+
+    def __init__(self, zones: int):
+        """Init empty statistics (label 0 is outside every zone)."""
+        self.zones = zones
+        self.pixels = np.zeros(zones + 1, dtype=np.int64)
+        self.score = Means(zones + 1)
+        self.lcoe = Means(zones + 1)
+        self.cf = Means(zones + 1)
+        self.lcoe_min = np.full(zones + 1, math.inf)
+        self.lcoe_max = np.full(zones + 1, -math.inf)
+        self.criterion_average: Dict[str, Means] = {}
+        self.criterion_contribution: Dict[str, Means] = {}
+        self.window_scaled: Dict[str, LabelWindowScaled] = {}
+
+    def add(self, labels: np.ndarray, score, mask: np.ndarray, extras: dict):
+        """add a block: its label layers and calc_score(..., ret_extras=True) output"""
+        outside = ~mask
+        score = ma.masked_array(score, outside)
+        scored = ~ma.getmaskarray(score)
+        cf = ma.masked_array(extras["cf"], outside)
+        lcoe = ma.masked_array(extras["lcoe"], outside)
+        lcoe_valid = ~ma.getmaskarray(lcoe)
+        lcoe_values = ma.getdata(lcoe)[lcoe_valid]
+
+        for layer in labels:
+            self.pixels += np.bincount(layer[mask], minlength=self.zones + 1)
+            self.score.add(layer, score)
+            self.cf.add(layer, cf)
+            self.lcoe.add(layer, lcoe)
+            np.minimum.at(self.lcoe_min, layer[lcoe_valid], lcoe_values)
+            np.maximum.at(self.lcoe_max, layer[lcoe_valid], lcoe_values)
+
+            for name, arr in extras["criterion_average"].items():
+                self.criterion_average.setdefault(name, Means(self.zones + 1)).add(
+                    layer, arr
+                )
+            for name, arr in extras["criterion_contribution"].items():
+                self.criterion_contribution.setdefault(
+                    name, Means(self.zones + 1)
+                ).add(layer, arr)
+            for name, scaled in extras.get("window_scaled", {}).items():
+                self.window_scaled.setdefault(
+                    name, LabelWindowScaled(scaled, self.zones + 1)
+                ).add(layer, scaled, mask, scored)
+
+    def merge(self, other: "LabelAccumulator"):
+        """add the blocks of another accumulator"""
+        self.pixels += other.pixels
+        self.score.merge(other.score)
+        self.lcoe.merge(other.lcoe)
+        self.cf.merge(other.cf)
+        np.minimum(self.lcoe_min, other.lcoe_min, out=self.lcoe_min)
+        np.maximum(self.lcoe_max, other.lcoe_max, out=self.lcoe_max)
+        for name, means in other.criterion_average.items():
+            self.criterion_average.setdefault(name, Means(self.zones + 1)).merge(means)
+        for name, means in other.criterion_contribution.items():
+            self.criterion_contribution.setdefault(
+                name, Means(self.zones + 1)
+            ).merge(means)
+        for name, scaled in other.window_scaled.items():
+            if name in self.window_scaled:
+                self.window_scaled[name].merge(scaled)
+            else:
+                self.window_scaled[name] = scaled
+
+    def zone(self, label: int, window_pixels: int = 0) -> ZoneAccumulator:
+        """the statistics of one zone, with a window of window_pixels"""
+        zone = ZoneAccumulator(window_pixels)
+        zone.pixels = int(self.pixels[label])
+        zone.score = self.score.mean(label)
+        zone.lcoe = self.lcoe.mean(label)
+        zone.cf = self.cf.mean(label)
+        zone.lcoe_min = float(self.lcoe_min[label])
+        zone.lcoe_max = float(self.lcoe_max[label])
+        zone.criterion_average = {
+            name: means.mean(label) for name, means in self.criterion_average.items()
+        }
+        zone.criterion_contribution = {
+            name: means.mean(label)
+            for name, means in self.criterion_contribution.items()
+        }
+        zone.window_scaled = {
+            name: scaled.zone(label) for name, scaled in self.window_scaled.items()
+        }
+        return zone
+
+
+def _block(score: Callable[..., Tuple], block: AOIGrid) -> ZoneAccumulator:
+    """partial accumulator of one block"""
+    zone = ZoneAccumulator()
+    zone.add(*score(grid=block))
+    return zone
+
+
+def _label_block(
+    zones: int, score: Callable[..., Tuple], block: AOIGrid
+) -> LabelAccumulator:
+    """partial label accumulator of one block"""
+    acc = LabelAccumulator(zones)
+    acc.add(block.labels, *score(grid=block))
+    return acc
+
+
+def accumulate(
+    score: Callable[..., Tuple],
+    grid: AOIGrid,
+    block_size: int = ZONE_BLOCK_SIZE,
+) -> ZoneAccumulator:
+    """
+    zone statistics of an area grid: score(grid=block), returning calc_score's
+    (score, mask, extras) with window_scale, runs for every block on the zone
+    executor
+    """
+    zone = ZoneAccumulator(grid.width * grid.height)
+    blocks = [partial(_block, score, block) for block in grid.blocks(block_size)]
+    for part in gather(blocks, executor="zone"):
+        zone.merge(part)
+    return zone
+
+
+def accumulate_labels(
+    score: Callable[..., Tuple],
+    grid: AOIGrid,
+    zones: int,
+    block_size: int = ZONE_BLOCK_SIZE,
+) -> List[ZoneAccumulator]:
+    """
+    zone statistics of every zone of a label grid, see accumulate: each block
+    is scored once for all the zones it overlaps, and every zone is scaled by
+    its own window
+    """
+    acc = LabelAccumulator(zones)
+    blocks = [
+        partial(_label_block, zones, score, block)
+        for block in grid.blocks(block_size)
+    ]
+    for part in gather(blocks, executor="zone"):
+        acc.merge(part)
+    return [
+        acc.zone(label, zone.window.width * zone.window.height)
+        for label, zone in enumerate(grid.zones, start=1)
+    ]
@@ -0,0 +1,115 @@
+"""
+import time (cold start) report for the API
+
+Imports the app in a fresh interpreter with `python -X importtime`, then
+breaks the time down by top level package (time spent executing that
+package's own modules) and by rezoning_api module. The best of --repeat runs
+is reported, and the exit status is 1 when the total exceeds the budget
+(IMPORT_TIME_BUDGET), so the command can guard against cold start
+regressions in CI.
+
+usage: python -m rezoning_api.importtime [--module M] [--threshold S] [--top N]
+"""
+import argparse
+import subprocess
+import sys
+from typing import Dict, List, NamedTuple
+
+from rezoning_api.core.config import IMPORT_TIME_BUDGET
+
+
+class ImportEntry(NamedTuple):
+    """one line of -X importtime output, times in seconds"""
+
+    name: str
+    self_time: float
+    cumulative: float
+    depth: int
+
+
+def parse_importtime(output: str) -> List[ImportEntry]:
+    """entries of -X importtime output (stderr)"""
+    entries = []
+    for line in output.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        fields = line[len("import time:") :].split("|")
+        if len(fields) != 3 or not fields[0].strip().isdigit():
+            continue  # header
+        name = fields[2].rstrip()
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        entries.append(
+            ImportEntry(
+                name.strip(),
+                int(fields[0]) / 1e6,
+                int(fields[1]) / 1e6,
+                depth,
+            )
+        )
+    return entries
+
+
+def by_package(entries: List[ImportEntry]) -> Dict[str, float]:
+    """own import time per top level package, largest first"""
+    totals: Dict[str, float] = {}
+    for entry in entries:
+        package = entry.name.split(".")[0]
+        totals[package] = totals.get(package, 0.0) + entry.self_time
+    return dict(sorted(totals.items(), key=lambda item: -item[1]))
+
+
+def total_time(entries: List[ImportEntry], module: str) -> float:
+    """cumulative import time of a module"""
+    return max(e.cumulative for e in entries if e.name == module)
+
+
+def measure(module: str = "rezoning_api.main") -> List[ImportEntry]:
+    """import a module in a fresh interpreter and parse its import times"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        stderr=subprocess.PIPE,
+        stdout=subprocess.DEVNULL,
+        universal_newlines=True,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"importing {module} failed:\n{result.stderr}")
+    return parse_importtime(result.stderr)
+
+
+def report(entries: List[ImportEntry], module: str, top: int) -> str:
+    """text report of an import"""
+    lines = [f"{module}: {total_time(entries, module):.3f} s", "", "by package:"]
+    for package, seconds in list(by_package(entries).items())[:top]:
+        lines.append(f"  {seconds:8.3f} s  {package}")
+
+    lines += ["", "rezoning_api modules (self / cumulative):"]
+    own = [e for e in entries if e.name.split(".")[0] == "rezoning_api"]
+    for entry in sorted(own, key=lambda e: -e.self_time)[:top]:
+        lines.append(
+            f"  {entry.self_time:8.3f} s  {entry.cumulative:8.3f} s  {entry.name}"
+        )
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--module", default="rezoning_api.main", help="module to import")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=IMPORT_TIME_BUDGET,
+        help="budget in seconds, exit with 1 above it",
+    )
+    parser.add_argument("--repeat", type=int, default=3, help="runs, the best is kept")
+    parser.add_argument("--top", type=int, default=15, help="rows per section")
+    args = parser.parse_args()
+
+    runs = [measure(args.module) for _ in range(max(args.repeat, 1))]
+    best = min(runs, key=lambda entries: total_time(entries, args.module))
+    print(report(best, args.module, args.top))
+
+    total = total_time(best, args.module)
+    if total > args.threshold:
+        print(f"\nover budget: {total:.3f} s > {args.threshold:.3f} s")
+        sys.exit(1)
+    print(f"\nwithin budget: {total:.3f} s <= {args.threshold:.3f} s")
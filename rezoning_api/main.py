@@ -1,11 +1,21 @@
 """rezoning_api app."""
+from typing import Optional
+
 from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.middleware.gzip import GZipMiddleware
 
 from rezoning_api import version
 from rezoning_api.core import config
+from rezoning_api.core.admission import AdmissionMiddleware
+from rezoning_api.core.aio import run_compute
+from rezoning_api.core.compression import CompressionMiddleware
+from rezoning_api.core.deadline import (
+    DeadlineMiddleware,
+    RequestCancelled,
+    request_cancelled_handler,
+)
 from rezoning_api.api.api_v1.api import api_router
+from rezoning_api.warmup import warmup
 
 app = FastAPI(
     title=config.PROJECT_NAME,
@@ -14,6 +24,11 @@ app = FastAPI(
     version=version,
 )
 
+# added first, so CORS wraps them: the 503 and 504 answers carry CORS headers
+# (requests queued for admission count against their deadline)
+app.add_middleware(AdmissionMiddleware)
+app.add_middleware(DeadlineMiddleware)
+
 # Set all CORS enabled origins
 if config.BACKEND_CORS_ORIGINS:
     origins = [origin.strip() for origin in config.BACKEND_CORS_ORIGINS.split(",")]
@@ -40,7 +55,8 @@ async def cache_options(request: Request, call_next):
     return response
 
 
-app.add_middleware(GZipMiddleware, minimum_size=0)
+app.add_middleware(CompressionMiddleware)
+app.add_exception_handler(RequestCancelled, request_cancelled_handler)
 app.include_router(api_router, prefix=config.API_VERSION_STR)
 
 
@@ -48,3 +64,18 @@ app.include_router(api_router, prefix=config.API_VERSION_STR)
 def ping():
     """Health check."""
     return {"ping": "pong!"}
+
+
+@app.on_event("startup")
+async def startup():
+    """warm the worker up before it serves traffic"""
+    if config.WARMUP_ON_STARTUP:
+        await run_compute(warmup)
+
+
+@app.get("/warmup", description="Warm the worker up, report timings")
+async def warmup_worker(countries: Optional[str] = None):
+    """warm up, with comma separated ISO3 country codes instead of WARMUP_COUNTRIES"""
+    return await run_compute(
+        warmup, countries=countries.split(",") if countries else None
+    )
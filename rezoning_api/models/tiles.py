@@ -1,7 +1,18 @@
 """Models for tiles"""
+import struct
+from enum import IntEnum
+from typing import Optional, Sequence, Tuple
+
 from fastapi import Response
 
 
+class TileSize(IntEnum):
+    """supported tile sizes (512 for high-DPI, @2x, clients)"""
+
+    default = 256
+    retina = 512
+
+
 class TileResponse(Response):
     """Tile response."""
 
@@ -19,3 +30,38 @@ class TileResponse(Response):
         self.media_type = media_type
         self.background = None
         self.init_headers(headers)
+
+
+class TileBatchResponse(Response):
+    """
+    many tiles in one length-prefixed binary container (all integers are
+    big-endian uint32):
+
+        count
+        count times: z, x, y, length, <length bytes of tile>
+
+    empty tiles have a length of 0, the media type of the individual tiles is
+    sent in the X-Tile-Content-Type header
+    """
+
+    media_type = "application/octet-stream"
+
+    def __init__(
+        self,
+        tiles: Sequence[Tuple[Tuple[int, int, int], bytes]],
+        tile_media_type: str = "image/png",
+        headers: Optional[dict] = None,
+    ) -> None:
+        """Init tile batch response."""
+        headers = dict(headers or {})
+        headers["X-Tile-Content-Type"] = tile_media_type
+        super().__init__(content=pack_tiles(tiles), headers=headers)
+
+
+def pack_tiles(tiles: Sequence[Tuple[Tuple[int, int, int], bytes]]) -> bytes:
+    """encode (z/x/y, content) pairs in the TileBatchResponse container format"""
+    parts = [struct.pack(">I", len(tiles))]
+    for (z, x, y), content in tiles:
+        parts.append(struct.pack(">IIII", z, x, y, len(content)))
+        parts.append(content)
+    return b"".join(parts)
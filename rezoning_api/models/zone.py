@@ -568,6 +568,14 @@ class ZoneRequest(BaseModel):
     weights: Weights = Weights()
 
 
+class ZoneBatchRequest(BaseModel):
+    """Zone batch POST request"""
+
+    aois: List[Union[Polygon, MultiPolygon]] = Field(..., min_items=1)
+    lcoe: LCOE
+    weights: Weights = Weights()
+
+
 class ExportRequest(BaseModel):
     """Export POST request"""
 
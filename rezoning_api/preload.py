@@ -0,0 +1,64 @@
+"""
+build the static data once in a pre-forking server's master process
+
+With gunicorn's preload_app (see Dockerfiles/ecs/gunicorn_conf.py) the master
+imports the app, which loads the layer registry, and preload() then imports
+the lazily loaded dependencies (see core.lazy), decodes every country/eez
+geometry and parses the remaining static files (IRENA data, minmax tables,
+regions). Workers forked afterwards share these pages copy-on-write instead of
+each building its own copy. gc.freeze() moves everything into a permanent
+generation the collector never scans, so garbage collections in the workers
+do not write to (and thereby copy) the shared pages.
+
+usage: python -m rezoning_api.preload  (prints what was loaded)
+"""
+import gc
+import glob
+from os import path as op
+from time import time
+
+from rezoning_api.core.lazy import lazy_module
+from rezoning_api.db import country
+from rezoning_api.db.irena import load_irena_data
+from rezoning_api.db.geometries import get_geometry_store
+
+
+def preload(freeze: bool = True) -> dict:
+    """load every static structure, return counts of what was loaded"""
+    import rezoning_api.main  # noqa: F401 (layers, the app)
+
+    # deferred at import to keep cold starts short, shared when forking
+    lazy_module("xarray").DataArray
+    load_irena_data()
+
+    store = get_geometry_store()
+    for kind in ("countries", "eez"):
+        for id in store.ids(kind):
+            store.feature(kind, id)
+
+    for path in glob.glob(op.join(country.MINMAX_DIR, "*.json")):
+        country.load_minmax(op.basename(path)[: -len(".json")])
+
+    db_dir = op.dirname(country.__file__)
+    country.load_json(country._regions, "regions", op.join(db_dir, "regions.json"))
+    for source_dir in ("regions", "regions_eez"):
+        for path in glob.glob(op.join(db_dir, source_dir, "*.geojson")):
+            country.load_region(source_dir, op.basename(path)[: -len(".geojson")])
+
+    if freeze:
+        gc.collect()
+        gc.freeze()
+
+    return dict(
+        countries=len(store.ids("countries")),
+        eez=len(store.ids("eez")),
+        minmax=len(country._minmax),
+        regions=len(country._regions),
+    )
+
+
+if __name__ == "__main__":
+    t1 = time()
+    loaded = preload(freeze=False)
+    print(", ".join(f"{k}: {v}" for k, v in loaded.items()))
+    print(f"elapsed: {time() - t1:.2f} seconds")
@@ -1,30 +1,44 @@
 """utility functions"""
 import xml.etree.ElementTree as ET
-import boto3
 import math
 import hashlib
 import json
-from typing import Union, List, Optional, Any
+from functools import lru_cache, partial
+from typing import Union, List, Optional, Any, Tuple
 from geojson_pydantic.geometries import Polygon, MultiPolygon
 import numpy as np
 import numpy.ma as ma
-import xarray as xr
 from pydantic import create_model
+from morecantile import Tile
+from rio_tiler.errors import TileOutsideBounds
 from rio_tiler.io import COGReader
 from rio_tiler.utils import create_cutline
+from rasterio import windows
+from rasterio.enums import Resampling
+from rasterio.features import geometry_mask
+from rasterio.transform import from_bounds as transform_from_bounds
+from rasterio.warp import transform_geom
 
 
-from rezoning_api.core.config import BUCKET, IS_LOCAL_DEV, REZONING_LOCAL_DATA_PATH
+from rezoning_api.core.config import BUCKET, IS_LOCAL_DEV, USE_CUBE
 from rezoning_api.models.zone import LCOE, Weights
-from rezoning_api.db.layers import get_layers
+from rezoning_api.core.aio import gather
+from rezoning_api.core.deadline import check_deadline
+from rezoning_api.core.lazy import LazyClient, lazy_module
+from rezoning_api.core.blockcache import open_cog, open_raster
+from rezoning_api.db.aoi import AOIGrid, aoi_grid, label_grid, read_grid
+from rezoning_api.db.cube import cube_indexes, dequantize, open_cube
+from rezoning_api.db.layers import get_layer_registry, resolve_location, tile_location
 from rezoning_api.db.country import get_country_min_max, match_gsa_dailies
 
-from os.path import exists
+# xarray (and pandas) only load once a tile stack is built
+xr = lazy_module("xarray")
 
-LAYERS = get_layers()
+REGISTRY = get_layer_registry()
+LAYERS = REGISTRY.datasets
 MAX_DIST = 1000000  # meters
 
-s3 = boto3.client("s3")
+s3 = LazyClient("s3")
 
 
 def s3_get(bucket: str, key: str, full_response=False, customClient=None):
@@ -46,6 +60,105 @@ def s3_head(bucket: str, key: str, customClient=None):
     return s3.head_object(Bucket=bucket, Key=key)
 
 
+def _read_aligned(
+    cog: COGReader,
+    bounds: Tuple[float, float, float, float],
+    height: int,
+    width: int,
+    indexes: Optional[List[int]] = None,
+    geometry: Optional[dict] = None,
+):
+    """
+    read a Web Mercator window from a Web Mercator dataset without warping, the
+    window maps onto whole (overview) blocks for tiles at or below the dataset
+    maximum zoom. Returns None when the window is not fully inside the dataset.
+    """
+    src = cog.dataset
+    window = windows.from_bounds(*bounds, transform=src.transform)
+    if (
+        window.col_off < 0
+        or window.row_off < 0
+        or window.col_off + window.width > src.width + 1e-6
+        or window.row_off + window.height > src.height + 1e-6
+    ):
+        return None
+
+    indexes = indexes or list(range(1, src.count + 1))
+    data = src.read(
+        indexes,
+        window=window,
+        out_shape=(len(indexes), height, width),
+        resampling=Resampling.nearest,
+    )
+    if src.nodata is not None:
+        # only look at the bands that were read, a dataset mask would read them all
+        mask = np.where((data != src.nodata).any(axis=0), 255, 0).astype(np.uint8)
+    else:
+        mask = src.dataset_mask(
+            window=window, out_shape=(height, width), resampling=Resampling.nearest
+        )
+
+    if geometry:
+        geometry = geometry.get("geometry", geometry)
+        inside = geometry_mask(
+            [transform_geom("epsg:4326", src.crs, geometry)],
+            out_shape=(height, width),
+            transform=transform_from_bounds(*bounds, width, height),
+            invert=True,
+        )
+        mask = np.where(inside, mask, 0).astype(np.uint8)
+
+    return data, mask
+
+
+def read_tile(
+    cog: COGReader,
+    x: int,
+    y: int,
+    z: int,
+    tilesize: int = 256,
+    block: Tuple[int, int] = (1, 1),
+    indexes: Optional[List[int]] = None,
+    geometry: Optional[dict] = None,
+):
+    """
+    read a web mercator tile from an open COGReader, or with block=(cols, rows)
+    the window covering cols x rows tiles starting at x/y in a single read.
+    Pixels outside the (EPSG:4326) geometry are masked. Web Mercator datasets
+    (see db.warp) are read directly, anything else through a warped VRT.
+    """
+    cols, rows = block
+    tiles = [(x + c, y + r) for r in range(rows) for c in range(cols)]
+    if not any(cog.tile_exists(tx, ty, z) for tx, ty in tiles):
+        raise TileOutsideBounds(f"Tiles {z}/{x}/{y} (+{cols}x{rows}) are outside bounds")
+
+    left, _, _, top = cog.tms.xy_bounds(Tile(x=x, y=y, z=z))
+    _, bottom, right, _ = cog.tms.xy_bounds(Tile(x=x + cols - 1, y=y + rows - 1, z=z))
+    bounds = (left, bottom, right, top)
+    height, width = rows * tilesize, cols * tilesize
+
+    if cog.dataset.crs == cog.tms.rasterio_crs:
+        aligned = _read_aligned(cog, bounds, height, width, indexes, geometry)
+        if aligned is not None:
+            return aligned
+
+    vrt_options = None
+    if geometry:
+        cutline = create_cutline(cog.dataset, geometry, geometry_crs="epsg:4326")
+        vrt_options = {"cutline": cutline}
+
+    return cog.part(
+        bounds,
+        dst_crs=cog.tms.rasterio_crs,
+        bounds_crs=cog.tms.rasterio_crs,
+        height=height,
+        width=width,
+        max_size=None,
+        indexes=indexes,
+        vrt_options=vrt_options,
+    )
+
+
 def read_dataset(
     dataset: str,
     layers: List,
@@ -54,43 +167,129 @@ def read_dataset(
     z: Optional[int] = None,
     geometry: Optional[Union[Polygon, MultiPolygon]] = None,
     max_size=None,
+    tilesize: int = 256,
+    block: Tuple[int, int] = (1, 1),
+    grid: Optional[AOIGrid] = None,
 ):
-    """read a dataset in a given area"""
-    if IS_LOCAL_DEV:
-        new_loc = dataset.replace(f"s3://{BUCKET}/", REZONING_LOCAL_DATA_PATH)
-        if IS_LOCAL_DEV and exists(new_loc):
-            dataset = new_loc
-    with COGReader(dataset) as cog:
-        vrt_options = None
+    """read a dataset in a given area, on the area grid when one is given"""
+    check_deadline()
+    if x is not None and USE_CUBE:
+        data, mask = read_cube_tile(
+            layers, x, y, z, tilesize=tilesize, block=block, geometry=geometry
+        )
+        return _as_dataarray(data, mask, layers)
+
+    # areas on a grid only need the raster, not a COGReader
+    if x is None and grid is not None:
+        with open_raster(resolve_location(dataset)) as src:
+            data, mask = read_grid(src, grid, list(range(1, len(layers) + 1)))
+        return _as_dataarray(data, mask, layers)
+
+    # tiles are read from the Web Mercator copies, areas from the originals
+    if x is not None:
+        dataset = tile_location(dataset)
+    with open_cog(resolve_location(dataset)) as cog:
         indexes = list(range(1, len(layers) + 1))
 
         # for tiles
         if x is not None:
-            if geometry:
-                cutline = create_cutline(
-                    cog.dataset, geometry, geometry_crs="epsg:4326"
-                )
-                vrt_options = {"cutline": cutline}
-
-            data, mask = cog.tile(
-                x, y, z, tilesize=256, indexes=indexes, vrt_options=vrt_options
+            data, mask = read_tile(
+                cog,
+                x,
+                y,
+                z,
+                tilesize=tilesize,
+                block=block,
+                indexes=indexes,
+                geometry=geometry,
             )
         else:
             data, mask = cog.feature(geometry, indexes=indexes, max_size=max_size)
 
-        # return as xarray + mask
-        return (
-            xr.DataArray(
-                ma.array(
-                    data,
-                    mask=np.broadcast_to(~mask, data.shape),
-                ),
-                dims=("layer", "x", "y"),
-                coords=dict(layer=layers),
+        return _as_dataarray(data, mask, layers)
+
+
+def _as_dataarray(data: np.ndarray, mask: np.ndarray, layers: List):
+    """return read data as a masked xarray + mask"""
+    return (
+        xr.DataArray(
+            ma.array(
+                data,
+                mask=np.broadcast_to(~mask, data.shape),
             ),
-            mask / 256,
+            dims=("layer", "x", "y"),
+            coords=dict(layer=layers),
+        ),
+        mask / 256,
+    )
+
+
+def read_cube_tile(
+    layers: List[str],
+    x: int,
+    y: int,
+    z: int,
+    tilesize: int = 256,
+    block: Tuple[int, int] = (1, 1),
+    geometry: Optional[dict] = None,
+):
+    """read layers for a tile (or block of tiles) from the analysis cube, as float32"""
+    cog = open_cube()
+    indexes = cube_indexes(cog, layers)
+    data, mask = read_tile(
+        cog,
+        x,
+        y,
+        z,
+        tilesize=tilesize,
+        block=block,
+        indexes=indexes,
+        geometry=geometry,
+    )
+    return dequantize(cog, data, indexes), mask
+
+
+def read_layer_tile(
+    layer_id: str,
+    x: int,
+    y: int,
+    z: int,
+    tilesize: int = 256,
+    block: Tuple[int, int] = (1, 1),
+    geometry: Optional[dict] = None,
+):
+    """read a single layer for a tile (or block of tiles) from the cube or its dataset"""
+    check_deadline()
+    if USE_CUBE:
+        return read_cube_tile(
+            [layer_id], x, y, z, tilesize=tilesize, block=block, geometry=geometry
         )
 
+    layer = REGISTRY.layers[layer_id]
+    with open_cog(REGISTRY.location(layer.dataset, tiles=True)) as cog:
+        return read_tile(
+            cog,
+            x,
+            y,
+            z,
+            tilesize=tilesize,
+            block=block,
+            indexes=[layer.index + 1],
+            geometry=geometry,
+        )
+
+
+def get_aoi_grid(geometry: dict, max_size=None) -> AOIGrid:
+    """analysis grid of an area, on the grid of the distance dataset"""
+    with open_raster(REGISTRY.location(REGISTRY.get("grid").dataset)) as src:
+        return aoi_grid(src, geometry, max_size=max_size)
+
+
+def get_label_grid(geometries: List[dict]) -> AOIGrid:
+    """analysis grid of several areas, labelled by area (see db.aoi.label_grid)"""
+    with open_raster(REGISTRY.location(REGISTRY.get("grid").dataset)) as src:
+        return label_grid(src, geometries)
+
 
 def filter_to_layer_name(flt):
     """filter name helper"""
@@ -135,27 +334,31 @@ def get_capacity_factor(
     z: Optional[int] = None,
     geometry: Union[Polygon, MultiPolygon] = None,
     max_size=None,
+    tilesize: int = 256,
+    block: Tuple[int, int] = (1, 1),
+    grid: Optional[AOIGrid] = None,
 ):
     """Calculate Capacity Factor"""
     # decide which capacity factor tif to pull from
-    cf_tif_loc, cf_idx = get_layer_location(capacity_factor)
-    dataset = cf_tif_loc.replace(f"s3://{BUCKET}/", "").replace(".tif", "")
-
-    if not cf_tif_loc:
+    layer = REGISTRY.get(capacity_factor)
+    if layer is None:
         raise Exception("invalid capacity factor")
 
     cf, _ = read_dataset(
-        cf_tif_loc,
-        layers=LAYERS[dataset],
+        REGISTRY.url(layer.dataset),
+        layers=REGISTRY.bands(layer.dataset),
         x=x,
         y=y,
         z=z,
         geometry=geometry,
         max_size=max_size,
+        tilesize=tilesize,
+        block=block,
+        grid=grid,
     )
 
     # get our selected layer
-    sel_cf = cf.sel(layer=LAYERS[dataset][cf_idx])
+    sel_cf = cf.sel(layer=capacity_factor)
 
     if capacity_factor == "gsa-pvout":
         # convert daily to hourly
@@ -176,6 +379,9 @@ def get_distances(
     z: Optional[int] = None,
     geometry: Optional[Union[Polygon, MultiPolygon]] = None,
     max_size=None,
+    tilesize: int = 256,
+    block: Tuple[int, int] = (1, 1),
+    grid: Optional[AOIGrid] = None,
 ):
     """Get filtered masks and distance arrays"""
     # find the required datasets to open
@@ -185,24 +391,30 @@ def get_distances(
     # we require grid and roads for calculations
     sent_filters += ["grid", "roads"]
 
-    datasets = [
-        k for k, v in LAYERS.items() if any([layer in sent_filters for layer in v])
-    ]
-
-    arrays = []
-    for dataset in datasets:
-        data, mask = read_dataset(
-            f"s3://{BUCKET}/{dataset}.tif",
-            LAYERS[dataset],
-            x=x,
-            y=y,
-            z=z,
-            geometry=geometry,
-            max_size=max_size,
-        )
-        arrays.append(data)
+    datasets = REGISTRY.datasets_for(sent_filters)
+
+    # read all datasets concurrently
+    reads = gather(
+        [
+            partial(
+                read_dataset,
+                REGISTRY.url(dataset),
+                REGISTRY.bands(dataset),
+                x=x,
+                y=y,
+                z=z,
+                geometry=geometry,
+                max_size=max_size,
+                tilesize=tilesize,
+                block=block,
+                grid=grid,
+            )
+            for dataset in datasets
+        ]
+    )
+    mask = reads[-1][1]
 
-    data = xr.concat(arrays, dim="layer")
+    data = xr.concat([data for data, _ in reads], dim="layer")
 
     _, filter_mask = _filter(data, filters)
 
@@ -287,19 +499,27 @@ def _filter(array, filters):
 
 def flat_layers():
     """flatten layer list"""
-    return [flat for layer in LAYERS.values() for flat in layer]
+    return REGISTRY.ids
 
 
 def get_layer_location(id):
     """get layer location and dataset index"""
-    loc = [(k, int(v.index(id))) for k, v in LAYERS.items() if id in v]
-    if loc:
-        return (f"s3://{BUCKET}/{loc[0][0]}.tif", loc[0][1])
-    else:
-        return (None, None)
+    return REGISTRY.location_of(id)
 
 
-LayerNames = create_model("LayerNames", **dict(zip(flat_layers(), flat_layers())))
+_layer_names = None
+
+
+def __getattr__(name):
+    """LayerNames, a model with a field per layer, built on first use"""
+    global _layer_names
+    if name == "LayerNames":
+        if _layer_names is None:
+            _layer_names = create_model(
+                "LayerNames", **dict(zip(flat_layers(), flat_layers()))
+            )
+        return _layer_names
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 def min_max_scale(arr, scale_min=None, scale_max=None, flip=False):
@@ -308,7 +528,11 @@ def min_max_scale(arr, scale_min=None, scale_max=None, flip=False):
         scale_min = arr.min()
     if not scale_max:
         scale_max = arr.max()
+    return scale(arr, scale_min, scale_max, flip=flip)
 
+
+def scale(arr, scale_min, scale_max, flip=False):
+    """returns a normalized ~0.0-1.0 array (or value) from min/maxes"""
     # flip min/max if requested
     if flip:
         temp = scale_max
@@ -329,6 +553,12 @@ def get_min_max(xml):
     return (mins, maxs)
 
 
+@lru_cache(maxsize=None)
+def get_layer_min_max(key: str) -> Tuple[List[float], List[float]]:
+    """per band minimum and maximum from the VRT of a dataset, fetched once"""
+    return get_min_max(s3_get(BUCKET, key))
+
+
 def get_stat(root, attrib_key):
     """get from XML"""
     return [
@@ -355,31 +585,97 @@ def calc_score(
     geometry: Optional[Union[Polygon, MultiPolygon]] = None,
     max_size=None,
     ret_extras=False,
+    tilesize: int = 256,
+    block: Tuple[int, int] = (1, 1),
+    grid: Optional[AOIGrid] = None,
+    window_scale=False,
 ):
     """
     calculate a "zone score" from the provided LCOE, weight, and filter inputs
     the function returns a pixel array of scored values which can later be
     aggregated into zones so here we refer to the function as a "score" calculation
+    with ret_extras, the lcoe and capacity factor arrays and per criterion masked
+    arrays of values (criterion_average) and weighted scaled values
+    (criterion_contribution) are returned too, see db.zonal
+    with window_scale (blocks of a window, with ret_extras), layers without a
+    country min or max are left out of the score instead of being scaled by
+    the min or max of the block: their values are returned (window_scaled) to
+    be scaled by the min or max of the whole window, see db.zonal
     """
+    # areas are read on one grid, with the area rasterized once
+    if geometry is not None and x is None and grid is None:
+        grid = get_aoi_grid(geometry, max_size=max_size)
+
     # spatial temporal inputs
-    ds, dr, calc, mask = get_distances(filters, x=x, y=y, z=z, geometry=geometry)
+    ds, dr, calc, mask = get_distances(
+        filters,
+        x=x,
+        y=y,
+        z=z,
+        geometry=geometry,
+        tilesize=tilesize,
+        block=block,
+        grid=grid,
+    )
 
+    check_deadline()
     criterion_average = dict()
     criterion_contribution = dict()
+    window_scaled = dict()
 
-    # if the entire area is filtered out, return early and fail early
-    if mask.sum() == 0:
+    # if the entire area is filtered out, return early and fail early (blocks
+    # still read the window scaled layers, the window includes filtered pixels)
+    if mask.sum() == 0 and not window_scale:
         score_array = np.zeros(mask.shape)
         cf = np.zeros(mask.shape)
         lcoe_t = np.zeros(mask.shape)
         if ret_extras:
-            return score_array, mask, dict(lcoe=lcoe_t, cf=cf, criterion_average=criterion_average, criterion_contribution=criterion_contribution)
+            return score_array, mask, dict(lcoe=lcoe_t, cf=cf, criterion_average=criterion_average, criterion_contribution=criterion_contribution, window_scaled=window_scaled)
         else:
             return score_array, mask
 
-    cf = get_capacity_factor(
-        lcoe.capacity_factor, lcoe.tlf, lcoe.af, x=x, y=y, z=z, geometry=geometry
+    # read the capacity factor and the datasets of weighted layers concurrently,
+    # each dataset once
+    weight_datasets = REGISTRY.datasets_for(
+        weight_name.replace("_", "-")
+        for weight_name, weight_value in weights
+        if weight_value > 0
     )
+    cf, *weight_reads = gather(
+        [
+            partial(
+                get_capacity_factor,
+                lcoe.capacity_factor,
+                lcoe.tlf,
+                lcoe.af,
+                x=x,
+                y=y,
+                z=z,
+                geometry=geometry,
+                tilesize=tilesize,
+                block=block,
+                grid=grid,
+            )
+        ]
+        + [
+            partial(
+                read_dataset,
+                REGISTRY.url(dataset),
+                REGISTRY.bands(dataset),
+                x=x,
+                y=y,
+                z=z,
+                geometry=geometry,
+                max_size=max_size,
+                tilesize=tilesize,
+                block=block,
+                grid=grid,
+            )
+            for dataset in weight_datasets
+        ]
+    )
+    weight_data = dict(zip(weight_datasets, (data for data, _ in weight_reads)))
+    check_deadline()
 
     # lcoe component calculation
     lg = lcoe_generation(lcoe, cf)
@@ -405,14 +701,13 @@ def calc_score(
     weights = Weights(**temp_weights)
 
     # zone score
-    shape = (256, 256) if x is not None else cf.shape
-    score_array = np.zeros(shape)
+    score_array = np.zeros(cf.shape)
 
     weight_count = 0
     for weight_name, weight_value in weights:
         layer = weight_name.replace("_", "-")
-        loc, idx = get_layer_location(layer)
-        if (loc and weight_value > 0) or weight_name == "lcoe_gen":
+        entry = REGISTRY.get(layer)
+        if (entry and weight_value > 0) or weight_name == "lcoe_gen":
             # valid weight
             weight_count += weight_value
 
@@ -431,32 +726,38 @@ def calc_score(
                 )
                 lcoe_gen_scaled = np.clip(lcoe_gen_scaled, 0, 1)
 
-                criterion_average[weight_name] = float(ma.masked_array(lg, ~mask).mean())
-                criterion_contribution[weight_name] = weights.lcoe_gen * \
-                    float(ma.masked_array(lcoe_gen_scaled, ~mask).mean())
+                if ret_extras:
+                    criterion_average[weight_name] = ma.masked_array(lg, ~mask)
+                    criterion_contribution[weight_name] = weights.lcoe_gen * \
+                        ma.masked_array(lcoe_gen_scaled, ~mask)
 
                 score_array += lcoe_gen_scaled * weights.lcoe_gen
             else:
-                dataset = loc.replace(f"s3://{BUCKET}/", "").replace(".tif", "")
-                data, _ = read_dataset(
-                    f"s3://{BUCKET}/{dataset}.tif",
-                    LAYERS[dataset],
-                    x=x,
-                    y=y,
-                    z=z,
-                    geometry=geometry,
-                    max_size=max_size,
-                )
+                data = weight_data[entry.dataset]
 
                 # if we don't have country min/max, use layer
                 if cmm:
                     layer_min = cmm[layer]["min"]
                     layer_max = cmm[layer]["max"]
                 if not cmm or layer_min == layer_max:
-                    key = loc.replace(f"s3://{BUCKET}/", "").replace("tif", "vrt")
-                    layer_min_arr, layer_max_arr = get_min_max(s3_get(BUCKET, key))
-                    layer_min = layer_min_arr[idx]
-                    layer_max = layer_max_arr[idx]
+                    key = REGISTRY.vrt_key(entry.dataset)
+                    layer_min_arr, layer_max_arr = get_layer_min_max(key)
+                    layer_min = layer_min_arr[entry.index]
+                    layer_max = layer_max_arr[entry.index]
+
+                if ret_extras:
+                    criterion_average[weight_name] = ma.masked_array(
+                        data.sel(layer=layer).values, ~mask)
+
+                if window_scale and not (layer_min and layer_max):
+                    window_scaled[weight_name] = dict(
+                        values=data.sel(layer=layer).values,
+                        weight=weight_value,
+                        flip=flip,
+                        min=layer_min,
+                        max=layer_max,
+                    )
+                    continue
 
                 scaled_array = min_max_scale(
                     np.nan_to_num(data.sel(layer=layer).values, nan=0),
@@ -465,20 +766,21 @@ def calc_score(
                     flip=flip,
                 )
 
-                criterion_average[weight_name] = float(
-                    ma.masked_array(data.sel(layer=layer).values, ~mask).mean())
-                criterion_contribution[weight_name] = weight_value * \
-                    float(ma.masked_array(scaled_array, ~mask).mean())
+                if ret_extras:
+                    criterion_contribution[weight_name] = weight_value * \
+                        ma.masked_array(scaled_array, ~mask)
 
                 score_array += weight_value * scaled_array
 
     # final normalization
     score_array /= weight_count
+    for scaled in window_scaled.values():
+        scaled["score_weight"] = scaled["weight"] / weight_count
 
     lcoe_t = lg + li + lr
     lcoe_t = ma.masked_invalid(lcoe_t)
     score_array = ma.masked_invalid(score_array)
     if ret_extras:
-        return score_array, mask, dict(lcoe=lcoe_t, cf=cf, criterion_average=criterion_average, criterion_contribution=criterion_contribution)
+        return score_array, mask, dict(lcoe=lcoe_t, cf=cf, criterion_average=criterion_average, criterion_contribution=criterion_contribution, window_scaled=window_scaled)
     else:
         return score_array, mask
@@ -0,0 +1,129 @@
+"""
+warm a fresh worker up before it serves traffic
+
+The first requests of a new Lambda container or ECS task otherwise pay for
+creating clients, importing deferred dependencies, fetching dataset headers,
+layer statistics, building metadata responses and decoding geometries. warmup() does that work up front
+and reports how long each stage took. It runs from the app startup event and
+the Lambda handler's init when WARMUP_ON_STARTUP is set (so provisioned
+concurrency instances are hot before their first request), and on demand from
+the /warmup endpoint. It is idempotent: everything it loads is cached, a
+second run only re-checks the caches.
+
+usage: python -m rezoning_api.warmup [--countries FRA,DEU] [--datasets KEY,...]
+"""
+import argparse
+import json
+import logging
+from functools import partial
+from time import time
+from typing import Callable, Dict, List, Optional
+
+from rezoning_api.api.api_v1.endpoints.filter import (
+    country_layers_response,
+    filter_schema_response,
+)
+from rezoning_api.api.api_v1.endpoints.layers import layer_list_response
+from rezoning_api.api.api_v1.endpoints.zone import weights_schema_response
+from rezoning_api.core.aio import gather
+from rezoning_api.core.blockcache import get_range_reader, open_cog
+from rezoning_api.core.config import (
+    IS_LOCAL_DEV,
+    USE_CUBE,
+    WARMUP_COUNTRIES,
+    WARMUP_DATASETS,
+)
+from rezoning_api.core.lazy import lazy_module
+from rezoning_api.db.country import get_country_geojson, get_country_min_max
+from rezoning_api.db.cube import open_cube
+from rezoning_api.db.irena import load_irena_data
+from rezoning_api.utils import REGISTRY, get_layer_min_max, s3
+
+logger = logging.getLogger(__name__)
+
+
+def _open(dataset: str):
+    """open the tile location of a dataset, caching its header"""
+    with open_cog(REGISTRY.location(dataset, tiles=True)):
+        pass
+
+
+def _modules():
+    """deferred imports and clients"""
+    lazy_module("xarray").DataArray
+    s3.meta
+    get_range_reader()
+    load_irena_data()
+
+
+def _metadata():
+    """precomputed metadata responses (see core.metadata)"""
+    layer_list_response()
+    filter_schema_response()
+    weights_schema_response()
+
+
+def _country(country: str):
+    """geometries, minmax tables and layer statistics of a country"""
+    for offshore, resource in ((False, "solar"), (True, "offshore")):
+        get_country_geojson(country, offshore=offshore)
+        get_country_min_max(country, resource)
+        country_layers_response(country, resource)
+
+
+def _run(calls: List[Callable[[], None]]) -> int:
+    """run calls concurrently, return the number that failed"""
+
+    def safe(call):
+        try:
+            call()
+            return 0
+        except Exception:
+            logger.debug("warmup of %s failed", call, exc_info=True)
+            return 1
+
+    return sum(gather([partial(safe, call) for call in calls]))
+
+
+def warmup(
+    datasets: Optional[List[str]] = None, countries: Optional[List[str]] = None
+) -> Dict[str, dict]:
+    """warm the worker up, return per stage seconds, item and error counts"""
+    datasets = datasets or WARMUP_DATASETS or list(REGISTRY.datasets)
+    countries = countries if countries is not None else WARMUP_COUNTRIES
+
+    stages = dict(
+        modules=[_modules],
+        metadata=[_metadata],
+        datasets=[open_cube] if USE_CUBE else [partial(_open, d) for d in datasets],
+        # keyed like the VRT lookups of the layers and score endpoints; the
+        # VRTs only exist on S3, local development fetches them on demand
+        statistics=[
+            partial(get_layer_min_max, REGISTRY.vrt_key(d))
+            for d in datasets
+            if not IS_LOCAL_DEV
+        ],
+        countries=[partial(_country, c) for c in countries],
+    )
+
+    report = {}
+    for stage, calls in stages.items():
+        t1 = time()
+        errors = _run(calls)
+        report[stage] = dict(
+            seconds=round(time() - t1, 3), items=len(calls), errors=errors
+        )
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--countries", default="", help="comma separated ISO3 codes")
+    parser.add_argument("--datasets", default="", help="comma separated layers.json keys")
+    args = parser.parse_args()
+
+    report = warmup(
+        [d for d in args.datasets.split(",") if d] or None,
+        [c for c in args.countries.split(",") if c] or None,
+    )
+    print(json.dumps(report, indent=2))
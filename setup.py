@@ -20,6 +20,8 @@ inst_reqs = [
 extra_reqs = {
     "dev": ["pytest", "pytest-benchmark", "pytest-asyncio"],
     "server": ["uvicorn"],
+    "compression": ["brotli"],
+    "json": ["orjson"],
     "deploy": [
         "docker",
         "attrs",
@@ -51,6 +53,7 @@ setup(
             "templates/*.html",
             "db/countries.geojson",
             "db/eez.geojson",
+            "db/geometries.bin",
             "db/layers.json",
             "db/cf.json",
             "db/irena.json",
@@ -163,6 +163,7 @@ class rezoningApiLambdaStack(core.Stack):
                 AIRTABLE_KEY=os.environ["AIRTABLE_KEY"],
                 GITHUB_TOKEN=os.environ["GITHUB_TOKEN"],
                 FEEDBACK_URL=os.environ["FEEDBACK_URL"],
+                WARMUP_ON_STARTUP="true",
                 # MEMCACHE_HOST=cache.attr_configuration_endpoint_address,
                 # MEMCACHE_PORT=cache.attr_configuration_endpoint_port,
             )
@@ -0,0 +1,79 @@
+"""Test rezoning_api.core.admission."""
+
+import asyncio
+
+from starlette.responses import PlainTextResponse
+from starlette.testclient import TestClient
+
+from rezoning_api.core.admission import (
+    AdmissionMiddleware,
+    ConcurrencyClass,
+    load_classes,
+)
+
+
+def test_classify():
+    """Test routes map to their concurrency class."""
+    middleware = AdmissionMiddleware(None, load_classes())
+    assert middleware.classify("/v1/score/FRA/solar/8/1/2.png").name == "tiles"
+    assert middleware.classify("/v1/layers/slope/batch").name == "tiles"
+    assert middleware.classify("/v1/zone/FRA/solar").name == "zone"
+    assert middleware.classify("/v1/zone/schema").name == "metadata"
+    assert middleware.classify("/v1/layers/").name == "metadata"
+
+
+def test_concurrency_class():
+    """Test limits, queueing and timeouts."""
+
+    async def run():
+        cls = ConcurrencyClass("test", [""], 1, 1, 0.05, 0, 1)
+        assert await cls.acquire()
+        queued = asyncio.ensure_future(cls.acquire())
+        await asyncio.sleep(0)
+        # queue full
+        assert not await cls.acquire()
+        cls.release()
+        assert await queued
+        assert cls.active == 1
+        # queue wait times out
+        assert not await cls.acquire()
+        cls.release()
+        assert cls.active == 0
+
+    asyncio.run(run())
+
+
+def test_load_shedding():
+    """Test saturated classes answer 503 with Retry-After."""
+    classes = load_classes({"tiles": {"limit": 0, "queue": 0}})
+
+    async def app(scope, receive, send):
+        await PlainTextResponse("ok")(scope, receive, send)
+
+    client = TestClient(AdmissionMiddleware(app, classes))
+    response = client.get("/v1/score/FRA/solar/8/1/2.png")
+    assert response.status_code == 503
+    assert response.headers["retry-after"] == "1"
+    assert client.get("/v1/layers/").status_code == 200
+
+
+def test_load_shedding_cors(app, monkeypatch):
+    """Test 503 answers to cross-origin requests carry CORS headers."""
+    from rezoning_api.core import admission
+    from rezoning_api.main import app as api
+
+    monkeypatch.setattr(
+        admission, "ADMISSION_CLASSES", {"tiles": {"limit": 0, "queue": 0}}
+    )
+    stack = api.middleware_stack
+    api.middleware_stack = api.build_middleware_stack()
+    try:
+        response = app.get(
+            "/v1/score/FRA/solar/8/1/2.png",
+            headers={"Origin": "http://example.com"},
+        )
+    finally:
+        api.middleware_stack = stack
+    assert response.status_code == 503
+    assert response.headers["retry-after"] == "1"
+    assert "access-control-allow-origin" in response.headers
@@ -0,0 +1,102 @@
+"""Test rezoning_api.db.aoi."""
+
+import numpy as np
+from rasterio.io import MemoryFile
+from rasterio.transform import from_origin
+
+from rezoning_api.db.aoi import aoi_grid, label_grid, read_grid
+
+AOI = {
+    "type": "Polygon",
+    "coordinates": [[[0.15, 0.15], [0.75, 0.15], [0.45, 0.85], [0.15, 0.15]]],
+}
+
+
+def _dataset(memfile, origin=(0, 1), res=0.1):
+    data = np.arange(200, dtype="float32").reshape(2, 10, 10)
+    with memfile.open(
+        driver="GTiff",
+        width=10,
+        height=10,
+        count=2,
+        dtype="float32",
+        crs="epsg:4326",
+        transform=from_origin(*origin, res, res),
+        nodata=-9999,
+    ) as dst:
+        dst.write(data)
+    return memfile.open()
+
+
+def test_aoi_grid():
+    """Test the area grid and reads on it, aligned or warped."""
+    with MemoryFile() as memfile, _dataset(memfile) as src:
+        grid = aoi_grid(src, {"type": "Feature", "geometry": AOI})
+        # whole pixels covering the area bounds
+        assert (grid.width, grid.height) == (7, 8)
+        assert np.allclose(grid.bounds, (0.1, 0.1, 0.8, 0.9))
+        assert grid.mask[-1, :].any() and not grid.mask[0, 0]
+
+        data, mask = read_grid(src, grid, [2])
+        assert data.shape == (1, 8, 7)
+        assert data[0, 0, 0] == 100 + 11
+        assert ((mask == 255) == grid.mask).all()
+
+    # half a pixel off: warped onto the grid
+    with MemoryFile() as memfile, _dataset(memfile, origin=(0.05, 1.05)) as src:
+        data, mask = read_grid(src, grid, [1])
+        assert data.shape == (1, 8, 7)
+        assert ((mask == 255) == grid.mask).all()
+
+    with MemoryFile() as memfile, _dataset(memfile) as src:
+        grid = aoi_grid(src, AOI, max_size=4)
+        assert max(grid.width, grid.height) == 4
+        data, _ = read_grid(src, grid, [1, 2])
+        assert data.shape == (2, 4, 4)
+
+
+def test_label_grid():
+    """Test areas labelled on a shared grid, overlaps in separate layers."""
+    square = {
+        "type": "Polygon",
+        "coordinates": [[[0.1, 0.7], [0.3, 0.7], [0.3, 0.9], [0.1, 0.9], [0.1, 0.7]]],
+    }
+    with MemoryFile() as memfile, _dataset(memfile) as src:
+        grid = label_grid(src, [AOI, square, {"type": "Feature", "geometry": AOI}])
+        assert (grid.width, grid.height) == (7, 8)
+        blocks = list(grid.blocks(4))
+        # the third area overlaps the others
+        assert all(block.labels.shape[0] == 2 for block in blocks)
+        for label, geometry in enumerate([AOI, square], start=1):
+            alone = aoi_grid(src, geometry)
+            pixels = sum((block.labels == label).sum() for block in blocks)
+            assert pixels == alone.mask.sum()
+        labels = np.zeros((8, 7), dtype=np.int32)
+        for block in blocks:
+            col, row = ~grid.transform * (block.transform.c, block.transform.f)
+            rows = slice(round(row), round(row) + block.height)
+            cols = slice(round(col), round(col) + block.width)
+            labels[rows, cols] = block.labels[1]
+            assert (block.mask == block.labels.any(axis=0)).all()
+        assert ((labels == 3) == aoi_grid(src, AOI).mask).all()
+        assert sum((block.labels == 2).sum() for block in blocks) == 4
+
+
+def test_label_grid_far_apart():
+    """Test far apart areas only cost the blocks they cover."""
+    far = {
+        "type": "Polygon",
+        "coordinates": [
+            [[2000.15, -2000.15], [2000.75, -2000.15], [2000.45, -1999.45]]
+        ],
+    }
+    with MemoryFile() as memfile, _dataset(memfile) as src:
+        # a 20 000 x 20 000 pixel union
+        grid = label_grid(src, [AOI, far])
+        assert grid.width > 20000 and grid.height > 20000
+        blocks = list(grid.blocks(512))
+        assert len(blocks) <= 4
+        for label, geometry in enumerate([AOI, far], start=1):
+            alone = aoi_grid(src, geometry)
+            pixels = sum((block.labels == label).sum() for block in blocks)
+            assert pixels == alone.mask.sum()
@@ -0,0 +1,77 @@
+"""Test rezoning_api.core.blockcache against a local S3 stand-in."""
+
+import boto3
+import numpy as np
+import pytest
+import rasterio
+from moto import mock_aws
+
+from rezoning_api.core import blockcache
+from rezoning_api.core.blockcache import MEMORY_BLOCKS, BlockCache, RangeFile
+from rezoning_api.core.ranges import RangeReader
+
+BUCKET = "rezoning-test"
+KEY = "data.bin"
+DATA = bytes(range(256)) * 1024
+BLOCK_SIZE = 1024
+
+
+@pytest.fixture
+def reader(monkeypatch):
+    """range reader of an S3 client with a test object"""
+    with mock_aws():
+        client = boto3.client("s3", region_name="us-east-1")
+        client.create_bucket(Bucket=BUCKET)
+        client.put_object(Bucket=BUCKET, Key=KEY, Body=DATA)
+        reader = RangeReader(client, percentile=0)
+        monkeypatch.setattr(blockcache, "_s3_client", client)
+        monkeypatch.setattr(blockcache, "_range_reader", reader)
+        monkeypatch.setattr(blockcache, "_heads", {})
+        yield reader
+
+
+def test_range_file(reader, tmp_path):
+    """Test reads through the disk cache, with bounded blocks in memory."""
+    cache = BlockCache(str(tmp_path), 10 * len(DATA))
+    f = RangeFile(BUCKET, KEY, cache, BLOCK_SIZE)
+    f.seek(100)
+    assert f.read(5000) == DATA[100:5100]
+    assert f.read(10) == DATA[5100:5110]
+    # the whole object, more blocks than kept in memory
+    f.seek(0)
+    assert f.read() == DATA
+    assert len(f._blocks) == MEMORY_BLOCKS
+    requests = reader.requests
+
+    # another file reads from disk only
+    f = RangeFile(BUCKET, KEY, cache, BLOCK_SIZE)
+    f.seek(-300, 2)
+    assert f.read() == DATA[-300:]
+    assert reader.requests == requests
+
+
+def test_range_reads_without_cache(reader, monkeypatch, tmp_path):
+    """Test RANGE_READS opens remote rasters through a RangeFile with no cache."""
+    data = np.arange(64 * 64, dtype="float32").reshape(1, 64, 64)
+    path = str(tmp_path / "raster.tif")
+    with rasterio.open(
+        path,
+        "w",
+        driver="GTiff",
+        width=64,
+        height=64,
+        count=1,
+        dtype="float32",
+        crs="EPSG:4326",
+        transform=rasterio.transform.from_origin(0, 64, 1, 1),
+    ) as dst:
+        dst.write(data)
+    with open(path, "rb") as f:
+        reader.client.put_object(Bucket=BUCKET, Key="raster.tif", Body=f.read())
+
+    monkeypatch.setattr(blockcache, "RANGE_READS", True)
+    monkeypatch.setattr(blockcache, "_block_cache", None)
+    monkeypatch.setattr(blockcache, "BLOCK_CACHE_SIZE", 0)
+    with blockcache.open_raster(f"s3://{BUCKET}/raster.tif") as src:
+        assert (src.read() == data).all()
+    assert reader.requests > 0
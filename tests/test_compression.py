@@ -0,0 +1,46 @@
+"""Test rezoning_api.core.compression."""
+
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse, Response
+from starlette.testclient import TestClient
+
+from rezoning_api.core.compression import CompressionMiddleware
+
+
+def test_vary():
+    """Test every compressible response varies on Accept-Encoding."""
+    app = Starlette()
+    app.add_middleware(CompressionMiddleware, minimum_size=100)
+
+    @app.route("/large")
+    def large(request):
+        return JSONResponse(list(range(100)))
+
+    @app.route("/small")
+    def small(request):
+        return JSONResponse([])
+
+    @app.route("/encoded")
+    def encoded(request):
+        headers = {"Content-Encoding": "gzip", "Vary": "Accept-Encoding"}
+        return Response(b"", media_type="application/json", headers=headers)
+
+    @app.route("/image")
+    def image(request):
+        return Response(b"\x89PNG", media_type="image/png")
+
+    client = TestClient(app)
+    response = client.get("/large", headers={"Accept-Encoding": "gzip"})
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.headers["vary"] == "Accept-Encoding"
+    # not compressed: no accepted encoding or too small
+    response = client.get("/large", headers={"Accept-Encoding": "identity"})
+    assert "content-encoding" not in response.headers
+    assert response.headers["vary"] == "Accept-Encoding"
+    response = client.get("/small", headers={"Accept-Encoding": "gzip"})
+    assert response.headers["vary"] == "Accept-Encoding"
+    # already encoded: not repeated
+    response = client.get("/encoded", headers={"Accept-Encoding": "gzip"})
+    assert response.headers["vary"] == "Accept-Encoding"
+    response = client.get("/image", headers={"Accept-Encoding": "gzip"})
+    assert "vary" not in response.headers
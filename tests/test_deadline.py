@@ -0,0 +1,58 @@
+"""Test rezoning_api.core.deadline."""
+
+import time
+
+import pytest
+
+from rezoning_api.core.aio import gather
+from rezoning_api.core import deadline as deadline_module
+from rezoning_api.core.deadline import (
+    Deadline,
+    RequestCancelled,
+    _deadline,
+    request_timeout,
+)
+
+
+def test_deadline():
+    """Test expiry and cancellation."""
+    deadline = Deadline(0.05)
+    deadline.check()
+    time.sleep(0.06)
+    with pytest.raises(RequestCancelled):
+        deadline.check()
+
+    deadline = Deadline()
+    assert deadline.remaining() is None
+    deadline.cancel()
+    with pytest.raises(RequestCancelled):
+        deadline.check()
+
+
+def test_gather_skips_abandoned_work():
+    """Test work queued for an abandoned request does not run."""
+    ran = []
+    deadline = Deadline()
+    token = _deadline.set(deadline)
+    try:
+        assert gather([lambda: ran.append(1) or 1, lambda: 2]) == [1, 2]
+        deadline.cancel()
+        with pytest.raises(RequestCancelled):
+            gather([lambda: ran.append(1), lambda: ran.append(2)])
+    finally:
+        _deadline.reset(token)
+    assert ran == [1]
+
+
+def test_request_timeout(monkeypatch):
+    """Test only Lambda invocations get a deadline by default."""
+
+    class LambdaContext:
+        def get_remaining_time_in_millis(self):
+            return 29000
+
+    assert request_timeout({}) is None
+    assert request_timeout({"aws.context": LambdaContext()}) == 27
+    monkeypatch.setattr(deadline_module, "REQUEST_TIMEOUT", 10)
+    assert request_timeout({}) == 10
+    assert request_timeout({"aws.context": LambdaContext()}) == 10
@@ -0,0 +1,55 @@
+"""Test rezoning_api.db.geometries."""
+
+import json
+
+from rezoning_api.db.geometries import GeometryStore, build_store
+
+SQUARE = {"type": "Polygon", "coordinates": [[[0, 0], [2, 0], [2, 2], [0, 2], [0, 0]]]}
+RIGHT = {"type": "Polygon", "coordinates": [[[2, 0], [4, 0], [4, 2], [2, 2], [2, 0]]]}
+
+
+def test_store(tmp_path):
+    """Test building and reading a geometry store."""
+    countries = tmp_path / "countries.geojson"
+    eez = tmp_path / "eez.geojson"
+    countries.write_text(
+        json.dumps(
+            dict(
+                type="FeatureCollection",
+                features=[
+                    dict(
+                        type="Feature",
+                        properties=dict(GID_0="FRA", NAME_0="France"),
+                        geometry=SQUARE,
+                    )
+                ],
+            )
+        )
+    )
+    eez.write_text(
+        json.dumps(
+            dict(
+                type="FeatureCollection",
+                features=[
+                    dict(type="Feature", properties=dict(ISO_TER1="FRA"), geometry=g)
+                    for g in (SQUARE, RIGHT)
+                ],
+            )
+        )
+    )
+    path = tmp_path / "geometries.bin"
+    path.write_bytes(build_store(str(countries), str(eez)))
+
+    store = GeometryStore(str(path))
+    assert store.ids("countries") == ["fra"]
+    assert store.bbox("eez", "FRA") == [0, 0, 4, 2]
+    assert store._features == {}
+
+    feature = store.feature("countries", "fra")
+    assert feature.properties["NAME_0"] == "France"
+    assert json.loads(feature.geometry.json()) == SQUARE
+    assert store.feature("countries", "FRA") is feature
+
+    # eez features of a territory are merged
+    assert store.feature("eez", "fra").geometry.type == "Polygon"
+    assert store.feature("countries", "esp") is None
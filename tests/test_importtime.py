@@ -0,0 +1,34 @@
+"""Test rezoning_api.importtime and lazy loading."""
+
+import pytest
+
+from rezoning_api.importtime import by_package, measure, parse_importtime, total_time
+
+OUTPUT = """import time: self [us] | cumulative | imported package
+import time:       100 |        100 |     numpy.core
+import time:       200 |        300 |   numpy
+import time:      1000 |       1000 |   rezoning_api.utils
+import time:       500 |       1800 | rezoning_api.main
+"""
+
+
+def test_parse():
+    """Test parsing -X importtime output."""
+    entries = parse_importtime(OUTPUT)
+    assert [e.name for e in entries] == [
+        "numpy.core",
+        "numpy",
+        "rezoning_api.utils",
+        "rezoning_api.main",
+    ]
+    assert [e.depth for e in entries] == [2, 1, 1, 0]
+    assert total_time(entries, "rezoning_api.main") == 0.0018
+    assert by_package(entries) == pytest.approx(dict(rezoning_api=0.0015, numpy=0.0003))
+
+
+def test_lazy_imports():
+    """Test heavy dependencies are not imported with the app."""
+    names = {e.name for e in measure("rezoning_api.main")}
+    assert "rezoning_api.main" in names
+    for module in ("xarray", "pandas", "requests", "jinja2"):
+        assert module not in names
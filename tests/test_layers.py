@@ -0,0 +1,30 @@
+"""Test rezoning_api.db.layers."""
+
+from rezoning_api.db.layers import LayerRegistry
+
+DATASETS = {
+    "multiband/distance": ["grid", "roads"],
+    "multiband/gsa": ["gsa-pvout", "gsa-temp"],
+    "raster/gebco/gebco_combined": ["gebco"],
+}
+
+
+def test_registry():
+    """Test layer and dataset lookups."""
+    registry = LayerRegistry(DATASETS)
+    assert registry.ids == ["grid", "roads", "gsa-pvout", "gsa-temp", "gebco"]
+
+    layer = registry.get("roads")
+    assert (layer.dataset, layer.index) == ("multiband/distance", 1)
+    assert registry.get("missing") is None
+    assert registry.location_of("gsa-temp")[1] == 1
+    assert registry.location_of("missing") == (None, None)
+    assert registry.get("gsa-pvout").daily and not registry.get("gsa-temp").daily
+
+    assert registry.datasets_for(["gebco", "grid", "roads", "missing"]) == [
+        "multiband/distance",
+        "raster/gebco/gebco_combined",
+    ]
+    assert registry.bands("multiband/gsa") == ["gsa-pvout", "gsa-temp"]
+    assert registry.url("multiband/gsa").endswith("/multiband/gsa.tif")
+    assert registry.vrt_key("multiband/gsa") == "multiband/gsa.vrt"
@@ -0,0 +1,23 @@
+"""Test rezoning_api.core.metadata."""
+
+
+def test_precomputed(app):
+    """Test pre-compressed schema responses and revalidation."""
+    response = app.get("/v1/filter/schema", headers={"Accept-Encoding": "gzip"})
+    assert response.status_code == 200
+    assert response.headers["content-encoding"] == "gzip"
+    assert "f_roads" in response.json()
+    gzip_etag = response.headers["etag"]
+    assert gzip_etag.endswith('-gzip"')
+
+    response = app.get("/v1/filter/schema", headers={"Accept-Encoding": "identity"})
+    assert "content-encoding" not in response.headers
+    # every encoding has its own ETag
+    etag = response.headers["etag"]
+    assert etag != gzip_etag
+    assert "f_roads" in response.json()
+
+    for tag in (etag, f"W/{etag}", gzip_etag):
+        response = app.get("/v1/filter/schema", headers={"If-None-Match": tag})
+        assert response.status_code == 304
+        assert response.content == b""
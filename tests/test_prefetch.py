@@ -0,0 +1,27 @@
+"""Test rezoning_api.core.prefetch."""
+
+import threading
+import time
+
+from rezoning_api.core.aio import PriorityExecutor
+from rezoning_api.core.prefetch import Prefetcher
+
+
+def test_prefetch_runs_after_requests():
+    """Test a queued prefetch read runs after a foreground read."""
+    io = PriorityExecutor(1, thread_name_prefix="test")
+    busy = threading.Event()
+    io.submit(busy.wait)
+
+    order = []
+    prefetcher = Prefetcher(1, 4)
+    prefetcher.submit("tile", lambda: io.submit(order.append, "prefetch").result())
+    while io._queue.qsize() < 1:
+        time.sleep(0.01)
+    foreground = io.submit(order.append, "foreground")
+
+    busy.set()
+    foreground.result()
+    while prefetcher.pending():
+        time.sleep(0.01)
+    assert order == ["foreground", "prefetch"]
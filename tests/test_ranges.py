@@ -0,0 +1,80 @@
+"""Test rezoning_api.core.ranges against a local S3 stand-in."""
+
+import time
+
+import boto3
+import pytest
+from moto import mock_aws
+
+from rezoning_api.core.ranges import RangeReader, merge_ranges
+
+BUCKET = "rezoning-test"
+KEY = "data.bin"
+DATA = bytes(range(256)) * 1024
+
+
+@pytest.fixture
+def s3():
+    """S3 client with a test object, and per-call latencies to inject."""
+    with mock_aws():
+        client = boto3.client("s3", region_name="us-east-1")
+        client.create_bucket(Bucket=BUCKET)
+        client.put_object(Bucket=BUCKET, Key=KEY, Body=DATA)
+
+        client.delays = []
+
+        def inject_latency(**kwargs):
+            if client.delays:
+                time.sleep(client.delays.pop(0))
+
+        client.meta.events.register("before-call.s3.GetObject", inject_latency)
+        yield client
+
+
+def test_merge_ranges():
+    """Test merging overlapping and nearby ranges."""
+    assert merge_ranges([(5, 6), (0, 1), (2, 2)]) == [(0, 2), (5, 6)]
+    assert merge_ranges([(0, 1), (4, 6), (5, 9)], gap=2) == [(0, 9)]
+    assert merge_ranges([(0, 1), (5, 6)], gap=2) == [(0, 1), (5, 6)]
+    assert merge_ranges([]) == []
+
+
+def test_get(s3):
+    """Test a plain ranged read."""
+    reader = RangeReader(s3)
+    assert reader.get(BUCKET, KEY, 100, 1099) == DATA[100:1100]
+    assert reader.requests == 1
+
+
+def test_hedged_get(s3):
+    """Test a slow request is hedged and the fast duplicate wins."""
+    reader = RangeReader(s3, initial_delay=0.1, min_delay=0.01)
+    s3.delays = [2.0]
+    t1 = time.monotonic()
+    assert reader.get(BUCKET, KEY, 0, 99) == DATA[:100]
+    assert time.monotonic() - t1 < 1.0
+    assert reader.requests == 2
+    # the slow primary is recorded, at least for as long as it ran
+    assert max(reader.latency._samples) >= 0.1
+
+
+def test_hedge_delay_adapts(s3):
+    """Test the hedge threshold follows observed latencies."""
+    reader = RangeReader(s3, percentile=95, initial_delay=2.0, min_delay=0.01)
+    assert reader.hedge_delay() == 2.0
+    for _ in range(20):
+        reader.latency.record(0.5)
+    assert reader.hedge_delay() == pytest.approx(0.5)
+
+    # requests faster than the threshold are never hedged
+    for _ in range(10):
+        reader.get(BUCKET, KEY, 0, 9)
+    assert reader.requests == 10
+
+
+def test_no_hedging(s3):
+    """Test percentile=0 disables hedging."""
+    reader = RangeReader(s3, percentile=0, initial_delay=0.01, min_delay=0.01)
+    s3.delays = [0.3]
+    assert reader.get(BUCKET, KEY, 0, 9) == DATA[:10]
+    assert reader.requests == 1
@@ -0,0 +1,31 @@
+"""Test rezoning_api.core.serialize."""
+
+import json
+
+import numpy as np
+
+from rezoning_api.core import serialize
+
+
+def test_dumps(monkeypatch):
+    """Test numpy values and non-finite numbers, with and without orjson."""
+    content = {
+        "nan": float("nan"),
+        "inf": np.float64("inf"),
+        "f32": np.float32(0.5),
+        "i64": np.int64(3),
+        "arr": np.array([1.0, np.nan]),
+        "nested": [{"min": float("-inf"), "max": 2.0}],
+    }
+    expected = {
+        "nan": None,
+        "inf": None,
+        "f32": 0.5,
+        "i64": 3,
+        "arr": [1.0, None],
+        "nested": [{"min": None, "max": 2.0}],
+    }
+    assert json.loads(serialize.dumps(content)) == expected
+
+    monkeypatch.setattr(serialize, "orjson", None)
+    assert json.loads(serialize.dumps(content)) == expected
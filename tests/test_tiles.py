@@ -0,0 +1,72 @@
+"""Test rezoning_api.core.tiles."""
+
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pytest
+
+from rezoning_api.core import cache, tiles
+from rezoning_api.core.cache import pack_result, unpack_result
+
+
+@pytest.fixture
+def cached(monkeypatch):
+    """Enable the result cache, empty."""
+    monkeypatch.setattr(cache, "ENABLE_CACHE", True)
+    monkeypatch.setattr(tiles, "ENABLE_CACHE", True)
+    cache.result_cache.clear()
+    yield
+    cache.result_cache.clear()
+
+
+def _counting_compute():
+    """a slow tile computation counting its calls"""
+    calls = []
+    lock = threading.Lock()
+
+    def compute(z, x, y, tilesize, block):
+        with lock:
+            calls.append((z, x, y, block))
+        time.sleep(0.1)
+        cols, rows = block
+        data = np.full((rows * tilesize, cols * tilesize), x % 256, dtype=np.uint8)
+        return pack_result(data, np.ones(data.shape, dtype=bool))
+
+    return compute, calls
+
+
+def _request_all(compute, requests):
+    with ThreadPoolExecutor(len(requests)) as executor:
+        return list(
+            executor.map(
+                lambda tile: tiles._tile_result("test", compute, *tile, 256), requests
+            )
+        )
+
+
+def test_overzoom_single_flight(cached, monkeypatch):
+    """Test concurrent overzoomed tiles compute their parent once."""
+    compute, calls = _counting_compute()
+    # the 16 z12 tiles of the z10 tile 3/5
+    requests = [(12, 12 + dx, 20 + dy) for dx in range(4) for dy in range(4)]
+    results = _request_all(compute, requests)
+    assert calls == [(10, 3, 5, (1, 1))]
+    data, mask = unpack_result(results[0])
+    assert data.shape == (256, 256) and (data == 3).all() and mask.all()
+
+    # with the parent cached, children are served without the compute executor
+    monkeypatch.setattr(tiles, "run_compute", None)
+    result = asyncio.run(tiles.tile_result_async("test", compute, 13, 24, 40))
+    assert (unpack_result(result)[0] == 3).all()
+
+
+def test_metatile_single_flight(cached, monkeypatch):
+    """Test concurrent tiles of one metatile compute it once."""
+    monkeypatch.setattr(tiles, "METATILE_SIZE", 2)
+    compute, calls = _counting_compute()
+    results = _request_all(compute, [(8, 4, 6), (8, 5, 6), (8, 4, 7), (8, 5, 7)])
+    assert calls == [(8, 4, 6, (2, 2))]
+    assert all(result is not None for result in results)
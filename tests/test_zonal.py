@@ -0,0 +1,137 @@
+"""Test rezoning_api.db.zonal."""
+
+import numpy as np
+import numpy.ma as ma
+import pytest
+
+from rezoning_api.db.zonal import LabelAccumulator, ZoneAccumulator
+from rezoning_api.utils import min_max_scale
+
+
+def _extras(lcoe, cf, values, mask):
+    """calc_score extras: criteria are masked outside the mask"""
+    outside = (values < 0) | ~mask
+    return dict(
+        lcoe=ma.masked_invalid(lcoe),
+        cf=cf,
+        criterion_average=dict(grid=ma.masked_array(values, outside)),
+        criterion_contribution=dict(grid=0.5 * ma.masked_array(values / 10, outside)),
+    )
+
+
+def test_accumulator_blocks():
+    """Test merged block statistics match statistics over the whole area."""
+    rng = np.random.default_rng(0)
+    score = rng.random((8, 8))
+    mask = rng.random((8, 8)) > 0.3
+    lcoe = rng.uniform(100, 200, (8, 8))
+    lcoe[0, 0] = np.inf
+    cf = rng.uniform(0.1, 0.3, (8, 8))
+    values = rng.uniform(-1, 10, (8, 8))
+
+    whole = ZoneAccumulator()
+    whole.add(score, mask, _extras(lcoe, cf, values, mask))
+    blocks = ZoneAccumulator()
+    for rows in (slice(0, 3), slice(3, 8)):
+        part = ZoneAccumulator()
+        part.add(
+            score[rows],
+            mask[rows],
+            _extras(lcoe[rows], cf[rows], values[rows], mask[rows]),
+        )
+        blocks.merge(part)
+
+    expected = whole.stats(landuse=30)
+    stats = blocks.stats(landuse=30)
+    assert stats.keys() == expected.keys()
+    assert stats["suitable_area"] == mask.sum() * 500 ** 2
+    assert stats["lcoe"] == pytest.approx(
+        ma.masked_array(ma.masked_invalid(lcoe), ~mask).mean()
+    )
+    assert stats["lcoe_max"] < np.inf
+    for key, value in expected.items():
+        assert stats[key] == pytest.approx(value)
+
+    assert ZoneAccumulator().stats(landuse=30) is None
+
+
+def test_window_scaled():
+    """Test criteria without country min are scaled by the min of the window."""
+    rng = np.random.default_rng(2)
+    values = rng.uniform(1000, 5000, (8, 8))
+    mask = rng.random((8, 8)) > 0.3
+    lcoe = rng.uniform(100, 200, (8, 8))
+    cf = rng.uniform(0.1, 0.3, (8, 8))
+
+    def extras(rows):
+        scaled = dict(values=values[rows], weight=0.5, flip=True, min=0, max=6000)
+        return dict(
+            lcoe=ma.masked_invalid(lcoe[rows]),
+            cf=cf[rows],
+            criterion_average=dict(grid=ma.masked_array(values[rows], ~mask[rows])),
+            criterion_contribution={},
+            window_scaled=dict(grid=dict(scaled, score_weight=0.25)),
+        )
+
+    for window in (64, 64 + 16):
+        zone = ZoneAccumulator(window)
+        for rows in (slice(0, 3), slice(3, 8)):
+            part = ZoneAccumulator()
+            part.add(np.zeros(mask[rows].shape), mask[rows], extras(rows))
+            zone.merge(part)
+        stats = zone.stats(landuse=30)
+
+        # the whole window at once, pixels outside of it have no data
+        whole = np.full((window // 8, 8), np.nan)
+        whole[:8] = values
+        scaled = min_max_scale(np.nan_to_num(whole), 0, 6000, flip=True)[:8]
+        expected = ma.masked_array(scaled, ~mask).mean()
+        assert stats["criterion_contribution"]["grid"] == pytest.approx(0.5 * expected)
+        assert stats["zone_score"] == pytest.approx(0.25 * expected)
+
+
+def test_label_accumulator():
+    """Test per label statistics match a ZoneAccumulator per zone."""
+    rng = np.random.default_rng(1)
+    score = rng.random((6, 6))
+    mask = rng.random((6, 6)) > 0.2
+    lcoe, cf, values = rng.uniform(100, 200, (6, 6)), rng.random((6, 6)), rng.random((6, 6))
+    scaled = rng.uniform(1, 5, (6, 6))
+    labels = np.zeros((2, 6, 6), dtype=np.int32)
+    labels[0, :3] = 1
+    labels[0, 3:] = 2
+    labels[1, 2:5, 2:5] = 3
+    labels[1, 2, 2] = 0
+    windows = {1: np.s_[:3, :], 2: np.s_[3:, :], 3: np.s_[2:5, 2:5]}
+
+    def extras(window, inside, scaled):
+        return dict(
+            _extras(lcoe[window], cf[window], values[window], inside),
+            window_scaled=dict(
+                grid=dict(
+                    values=scaled,
+                    weight=0.5,
+                    score_weight=0.25,
+                    flip=False,
+                    min=0,
+                    max=10,
+                )
+            ),
+        )
+
+    acc = LabelAccumulator(3)
+    acc.add(labels, score, mask, extras(np.s_[:, :], mask, scaled))
+    for label, window in windows.items():
+        # a single request reads the zone window, without data outside the zone
+        zone_mask = (labels == label).any(axis=0)[window]
+        inside = mask[window] & zone_mask
+        zone = ZoneAccumulator(zone_mask.size)
+        zone.add(
+            score[window],
+            inside,
+            extras(window, inside, np.where(zone_mask, scaled[window], np.nan)),
+        )
+        expected = zone.stats(landuse=30)
+        stats = acc.zone(label, zone_mask.size).stats(landuse=30)
+        for key, value in expected.items():
+            assert stats[key] == pytest.approx(value)